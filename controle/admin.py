@@ -6,11 +6,128 @@ from import_export import fields
 from import_export.widgets import ForeignKeyWidget
 from .models import Veiculo, Setor, Motorista
 from import_export.widgets import DateWidget
+import io
+import os
+from datetime import timedelta
+from django import forms
+from django.contrib import messages
+from django.core.files.base import ContentFile
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.shortcuts import redirect, render
+from django.urls import path
+from django.utils import timezone
+from django.utils.html import format_html
+from django.db.models import Q
+from .busca import buscar
+from .importacao import importar_abastecimentos, importar_multas
+
+
+class BuscaNormalizadaMixin:
+    """
+    Troca a busca do admin (icontains em search_fields) pela busca nas
+    colunas normalizadas (controle/busca.py). search_fields continua
+    definindo a caixa de busca; campos_busca_extra são buscados como antes.
+    """
+    campos_busca_extra = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        resultado = buscar(queryset, search_term)
+        if self.campos_busca_extra:
+            extra = Q()
+            for campo in self.campos_busca_extra:
+                extra |= Q(**{f'{campo}__icontains': search_term})
+            resultado = resultado | queryset.filter(extra)
+        return resultado, False
+
+
+class MultaAdmin(BuscaNormalizadaMixin, admin.ModelAdmin):
+    change_list_template = 'admin/controle/multa/change_list.html'
+    list_display = ('auto_infracao', 'veiculo', 'setor_nome', 'status_multa', 'status_pagamento')
+    list_filter = ('setor',)
+    list_select_related = ('veiculo',)
+    search_fields = ('auto_infracao', 'veiculo__placa')
+
+    def get_urls(self):
+        urls = [
+            path(
+                'importar-autuacoes/',
+                self.admin_site.admin_view(self.importar_autuacoes),
+                name='controle_multa_importar_autuacoes',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def importar_autuacoes(self, request):
+        """
+        Importa o arquivo de autuações. Na pré-visualização o arquivo fica
+        guardado no storage e a confirmação (token assinado) importa o mesmo
+        arquivo, sem novo envio.
+        """
+        contexto = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Importar autuações",
+        }
+        if request.method == 'POST' and 'pendente' in request.POST:
+            try:
+                pendente = signing.loads(
+                    request.POST['pendente'], salt=SALT_IMPORTACAO_MULTAS, max_age=VALIDADE_PENDENTE
+                )
+            except signing.BadSignature:
+                self.message_user(request, "Pré-visualização expirada; envie o arquivo de novo.", messages.ERROR)
+                return redirect('admin:controle_multa_importar_autuacoes')
+            caminho = reservar_pendente(pendente['caminho'])
+            if caminho is None:
+                self.message_user(
+                    request, "Esta pré-visualização já foi importada ou expirou; confira a lista de multas.",
+                    messages.ERROR,
+                )
+                return redirect('admin:controle_multa_changelist')
+            try:
+                with default_storage.open(caminho, 'rb') as arquivo:
+                    resultado = importar_multas(arquivo, pendente['nome'], pendente['orgao'], usuario=request.user)
+            finally:
+                default_storage.delete(caminho)
+            self._concluir(request, resultado)
+            return redirect('admin:controle_multa_changelist')
+
+        form = ImportarMultasForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            orgao = form.cleaned_data['orgao_autuador'] or None
+            if not form.cleaned_data['simular']:
+                resultado = importar_multas(arquivo, arquivo.name, orgao, usuario=request.user)
+                self._concluir(request, resultado)
+                return redirect('admin:controle_multa_changelist')
+
+            limpar_pendentes()
+            caminho = default_storage.save(
+                f"{PASTA_PENDENTES_MULTAS}/{timezone.now():%Y%m%d_%H%M%S}_{arquivo.name}", arquivo
+            )
+            with default_storage.open(caminho, 'rb') as guardado:
+                resultado = importar_multas(guardado, arquivo.name, orgao, simular=True)
+            contexto.update({
+                'resultado': resultado,
+                'rejeitados': resultado.rejeitados[:50],
+                'pendente': signing.dumps(
+                    {'caminho': caminho, 'nome': arquivo.name, 'orgao': orgao}, salt=SALT_IMPORTACAO_MULTAS
+                ),
+            })
+        contexto['form'] = form
+        return render(request, 'admin/controle/multa/importar_autuacoes.html', contexto)
+
+    def _concluir(self, request, resultado):
+        self.message_user(request, f"Importação concluída: {resultado}.", messages.SUCCESS)
+        salvar_rejeitados(self, request, resultado, 'multas')
+
 
 # Registros normais
 admin.site.register(Setor)
 admin.site.register(ManutencaoVeiculo)
-admin.site.register(Multa)
+admin.site.register(Multa, MultaAdmin)
 admin.site.register(TermoResponsabilidade)
 admin.site.register(ContaPagamento)
 
@@ -33,10 +150,11 @@ class VeiculoResource(resources.ModelResource):
         report_skipped = True
 
 
-class VeiculoAdmin(ImportExportModelAdmin):
+class VeiculoAdmin(BuscaNormalizadaMixin, ImportExportModelAdmin):
     resource_class = VeiculoResource
     list_display = ('placa', 'modelo', 'status_atual', 'setor')
     search_fields = ('placa', 'modelo', 'renavam', 'chassi')
+    campos_busca_extra = ('modelo', 'renavam', 'chassi')
 
 
 admin.site.register(Veiculo, VeiculoAdmin)
@@ -64,7 +182,7 @@ class MotoristaResource(resources.ModelResource):
         skip_unchanged = True
         report_skipped = True
 
-class MotoristaAdmin(ImportExportModelAdmin):
+class MotoristaAdmin(BuscaNormalizadaMixin, ImportExportModelAdmin):
     resource_class = MotoristaResource
     list_display = ('nome', 'cpf', 'telefone', 'status_atual', 'cnh_categoria')
     search_fields = ('nome', 'cpf', 'cnh_numero')
@@ -88,4 +206,120 @@ class InfracaoTransitoAdmin(ImportExportModelAdmin):
 
 admin.site.register(InfracaoTransito, InfracaoTransitoAdmin)
 
-admin.site.register(Abastecimento)
\ No newline at end of file
+
+class ImportarArquivoForm(forms.Form):
+    arquivo = forms.FileField(label="Arquivo (.csv ou .xlsx)")
+
+
+class ImportarMultasForm(ImportarArquivoForm):
+    orgao_autuador = forms.CharField(
+        label="Órgão autuador", max_length=100, required=False,
+        help_text="Usado nas linhas sem a coluna orgao_autuador.",
+    )
+    simular = forms.BooleanField(label="Pré-visualizar antes de gravar", required=False, initial=True)
+
+
+SALT_IMPORTACAO_MULTAS = 'controle.importacao.multas'
+PASTA_PENDENTES_MULTAS = 'importacoes/multas/pendentes'
+VALIDADE_PENDENTE = 60 * 60  # segundos entre a pré-visualização e a confirmação
+
+
+def reservar_pendente(caminho):
+    """
+    Tira da fila o arquivo pré-visualizado, renomeando-o (atômico no sistema
+    de arquivos): de duas confirmações do mesmo token só uma consegue.
+    Devolve o novo caminho, ou None se o arquivo já não está lá.
+    """
+    reservado = f"{caminho}.importando"
+    try:
+        os.rename(default_storage.path(caminho), default_storage.path(reservado))
+    except FileNotFoundError:
+        return None
+    return reservado
+
+
+def limpar_pendentes():
+    """Apaga as pré-visualizações que expiraram sem confirmação."""
+    limite = timezone.now() - timedelta(seconds=VALIDADE_PENDENTE)
+    try:
+        _, arquivos = default_storage.listdir(PASTA_PENDENTES_MULTAS)
+    except FileNotFoundError:
+        return
+    for nome in arquivos:
+        caminho = f"{PASTA_PENDENTES_MULTAS}/{nome}"
+        try:
+            if default_storage.get_modified_time(caminho) < limite:
+                default_storage.delete(caminho)
+        except FileNotFoundError:
+            pass  # outra requisição apagou ou reservou no meio
+
+
+def salvar_rejeitados(model_admin, request, resultado, pasta):
+    """Grava o relatório de linhas rejeitadas no storage e avisa com o link."""
+    if not resultado.rejeitados:
+        return
+    saida = io.StringIO()
+    resultado.escrever_rejeitados(saida)
+    caminho = default_storage.save(
+        f"importacoes/{pasta}/rejeitados_{timezone.now():%Y%m%d_%H%M%S}.csv",
+        ContentFile(saida.getvalue().encode('utf-8')),
+    )
+    model_admin.message_user(
+        request,
+        format_html('Linhas rejeitadas: <a href="{}">baixar relatório</a>.', default_storage.url(caminho)),
+        messages.WARNING,
+    )
+
+
+class AbastecimentoAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/controle/abastecimento/change_list.html'
+    list_display = ('veiculo', 'data', 'hodometro', 'litros', 'valor_total', 'tipo_combustivel', 'posto')
+    list_filter = ('tipo_combustivel',)
+    search_fields = ('veiculo__placa', 'posto')
+    date_hierarchy = 'data'
+    list_select_related = ('veiculo',)
+
+    def get_urls(self):
+        urls = [
+            path(
+                'importar-cartao/',
+                self.admin_site.admin_view(self.importar_cartao),
+                name='controle_abastecimento_importar_cartao',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def importar_cartao(self, request):
+        """Importa o arquivo do cartão combustível e salva o relatório de rejeitados."""
+        form = ImportarArquivoForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            resultado = importar_abastecimentos(arquivo, arquivo.name)
+            self.message_user(request, f"Importação concluída: {resultado}.", messages.SUCCESS)
+            salvar_rejeitados(self, request, resultado, 'abastecimentos')
+            return redirect('admin:controle_abastecimento_changelist')
+
+        contexto = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': "Importar cartão combustível",
+        }
+        return render(request, 'admin/controle/abastecimento/importar_cartao.html', contexto)
+
+
+admin.site.register(Abastecimento, AbastecimentoAdmin)
+
+admin.site.register(ConsumoMensal)
+admin.site.register(LeituraHodometro)
+
+
+class VinculoMotoristaAdmin(admin.ModelAdmin):
+    list_display = ('veiculo', 'motorista', 'inicio', 'fim', 'origem')
+    list_filter = ('origem',)
+    list_select_related = ('veiculo', 'motorista')
+    raw_id_fields = ('veiculo', 'motorista', 'termo')
+    date_hierarchy = 'inicio'
+
+
+admin.site.register(VinculoMotorista, VinculoMotoristaAdmin)
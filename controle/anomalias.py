@@ -0,0 +1,228 @@
+"""
+Detecção de anomalias nos abastecimentos de toda a frota.
+
+O histórico é carregado uma vez em arrays NumPy, ordenado por veículo,
+data e hodômetro, e todas as regras são calculadas sobre os arrays:
+
+- consumo (km/L) fora da média móvel do próprio veículo;
+- consumo fora do padrão do tipo de modelo (Hatch, SUV, ...);
+- preço por litro fora do padrão do posto e combustível;
+- hodômetro menor que o do abastecimento anterior;
+- litros acima do que caberia no tanque desde o abastecimento anterior.
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import Abastecimento, AnomaliaAbastecimento
+
+
+# Média móvel do veículo: últimos JANELA abastecimentos válidos, mínimo JANELA_MINIMA
+JANELA = 10
+JANELA_MINIMA = 5
+LIMITE_Z = 3.0
+DESVIO_MINIMO = 0.25       # desvio relativo mínimo em relação à média do veículo
+LIMITE_Z_ROBUSTO = 3.5     # escore z modificado (mediana/MAD)
+GRUPO_MINIMO = 5           # amostras mínimas por tipo de modelo ou posto
+FOLGA_TANQUE = 0.10        # fração da capacidade aceita como erro de medição
+
+
+class Historico:
+    """Abastecimentos da frota em arrays paralelos, ordenados por veículo."""
+
+    def __init__(self, linhas):
+        colunas = list(zip(*linhas)) or [()] * 8
+        self.ids = np.array(colunas[0], dtype=np.int64)
+        self.veiculos = np.array(colunas[1], dtype=np.int64)
+        self.modelos = np.array([m or '' for m in colunas[2]], dtype=str)
+        self.hodometros = np.array(colunas[3], dtype=float)
+        self.litros = np.array(colunas[4], dtype=float)
+        self.precos = np.array(colunas[5], dtype=float)
+        self.postos = np.array([(p or '').strip().upper() for p in colunas[6]], dtype=str)
+        self.combustiveis = np.array(colunas[7], dtype=str)
+
+        n = len(self.ids)
+        # Primeiro abastecimento de cada veículo
+        self.inicio = np.ones(n, dtype=bool)
+        self.inicio[1:] = self.veiculos[1:] != self.veiculos[:-1]
+        self.segmentos = np.append(np.flatnonzero(self.inicio), n)
+
+        self.hodometro_anterior = np.concatenate(([np.nan], self.hodometros[:-1]))[:n]
+        self.hodometro_anterior[self.inicio] = np.nan
+        self.litros_anterior = np.concatenate(([np.nan], self.litros[:-1]))[:n]
+        self.litros_anterior[self.inicio] = np.nan
+
+        self.km = self.hodometros - self.hodometro_anterior
+        with np.errstate(divide='ignore', invalid='ignore'):
+            valido = (self.km > 0) & (self.litros > 0)
+            self.km_por_litro = np.where(valido, self.km / self.litros, np.nan)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def por_veiculo(self):
+        """Fatias (início, fim) de cada veículo nos arrays."""
+        return zip(self.segmentos[:-1], self.segmentos[1:])
+
+
+def carregar_historico():
+    linhas = Abastecimento.objects.order_by(
+        'veiculo_id', 'data', 'hodometro', 'pk'
+    ).values_list(
+        'pk', 'veiculo_id', 'veiculo__tipo_modelo', 'hodometro',
+        'litros', 'valor_litro', 'posto', 'tipo_combustivel',
+    ).iterator(chunk_size=5000)
+    return Historico(linhas)
+
+
+def _escore_robusto(valores):
+    """Escore z modificado (Iglewicz-Hoaglin) e a mediana do grupo."""
+    mediana = np.median(valores)
+    mad = np.median(np.abs(valores - mediana))
+    if mad == 0:
+        return np.zeros_like(valores), mediana
+    return 0.6745 * (valores - mediana) / mad, mediana
+
+
+def _outliers_por_grupo(chaves, valores, mascara):
+    """Marca valores fora do padrão do seu grupo; devolve (flags, referência)."""
+    flags = np.zeros(len(valores), dtype=bool)
+    referencia = np.full(len(valores), np.nan)
+    indices = np.flatnonzero(mascara)
+    if not len(indices):
+        return flags, referencia
+
+    grupos, inverso = np.unique(chaves[indices], return_inverse=True)
+    ordem = np.argsort(inverso, kind='stable')
+    limites = np.append(np.flatnonzero(np.diff(inverso[ordem], prepend=-1)), len(ordem))
+    for inicio, fim in zip(limites[:-1], limites[1:]):
+        if fim - inicio < GRUPO_MINIMO:
+            continue
+        linhas = indices[ordem[inicio:fim]]
+        escore, mediana = _escore_robusto(valores[linhas])
+        flags[linhas] = np.abs(escore) > LIMITE_Z_ROBUSTO
+        referencia[linhas] = mediana
+    return flags, referencia
+
+
+def _consumo_veiculo(h):
+    """Km/L comparado com a média móvel dos abastecimentos anteriores do veículo."""
+    flags = np.zeros(len(h), dtype=bool)
+    media = np.full(len(h), np.nan)
+    for inicio, fim in h.por_veiculo():
+        posicoes = inicio + np.flatnonzero(~np.isnan(h.km_por_litro[inicio:fim]))
+        if len(posicoes) <= JANELA_MINIMA:
+            continue
+        x = h.km_por_litro[posicoes]
+        soma = np.concatenate(([0.0], np.cumsum(x)))
+        soma2 = np.concatenate(([0.0], np.cumsum(x * x)))
+        i = np.arange(len(x))
+        de = np.maximum(i - JANELA, 0)
+        quantidade = i - de
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m = (soma[i] - soma[de]) / quantidade
+            desvio = np.sqrt(np.maximum((soma2[i] - soma2[de]) / quantidade - m * m, 0))
+            distante = (
+                (quantidade >= JANELA_MINIMA)
+                & (np.abs(x - m) > LIMITE_Z * desvio)
+                & (np.abs(x - m) > DESVIO_MINIMO * m)
+            )
+        flags[posicoes] = distante
+        media[posicoes] = m
+    return flags, media
+
+
+def _capacidade_tanque(h, consumo_modelo):
+    """
+    Litros acima do espaço livre no tanque: depois do abastecimento anterior
+    o tanque tinha ao menos os litros colocados; até o seguinte só pode ter
+    sido consumido km / km_por_litro. Sem a capacidade cadastrada, usa o
+    maior abastecimento do veículo.
+    """
+    capacidade = np.zeros(len(h))
+    base = np.full(len(h), np.nan)
+    mediana_frota = np.nanmedian(h.km_por_litro) if np.any(~np.isnan(h.km_por_litro)) else np.nan
+    for inicio, fim in h.por_veiculo():
+        capacidade[inicio:fim] = h.litros[inicio:fim].max()
+        validos = h.km_por_litro[inicio:fim]
+        validos = validos[~np.isnan(validos)]
+        base[inicio:fim] = np.median(validos) if len(validos) else np.nan
+    base = np.where(np.isnan(base), consumo_modelo, base)
+    base = np.where(np.isnan(base), mediana_frota, base)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        espaco = capacidade - h.litros_anterior + np.maximum(h.km, 0) / base
+        flags = (
+            ~h.inicio
+            & (h.km >= 0)
+            & ~np.isnan(espaco)
+            & (h.litros > espaco + FOLGA_TANQUE * capacidade)
+        )
+    return flags, espaco
+
+
+def detectar(h):
+    """
+    Aplica todas as regras ao histórico.
+    Devolve tuplas (abastecimento_id, tipo, valor, referência).
+    """
+    tipos = AnomaliaAbastecimento.Tipos
+    resultado = []
+
+    def marcar(tipo, flags, valores, referencias):
+        for i in np.flatnonzero(flags):
+            valor = None if np.isnan(valores[i]) else round(float(valores[i]), 2)
+            referencia = None if np.isnan(referencias[i]) else round(float(referencias[i]), 2)
+            resultado.append((int(h.ids[i]), tipo, valor, referencia))
+
+    if not len(h):
+        return resultado
+
+    flags, media = _consumo_veiculo(h)
+    marcar(tipos.CONSUMO_VEICULO, flags, h.km_por_litro, media)
+
+    flags, mediana_modelo = _outliers_por_grupo(h.modelos, h.km_por_litro, ~np.isnan(h.km_por_litro))
+    marcar(tipos.CONSUMO_MODELO, flags, h.km_por_litro, mediana_modelo)
+
+    chave_posto = np.char.add(np.char.add(h.postos, '|'), h.combustiveis)
+    flags, mediana_preco = _outliers_por_grupo(chave_posto, h.precos, (h.postos != '') & (h.precos > 0))
+    marcar(tipos.PRECO_POSTO, flags, h.precos, mediana_preco)
+
+    marcar(tipos.HODOMETRO_REGRESSIVO, h.km < 0, h.hodometros, h.hodometro_anterior)
+
+    # Referência de consumo do tipo de modelo mesmo para grupos pequenos
+    consumo_modelo = np.full(len(h), np.nan)
+    for modelo in np.unique(h.modelos):
+        linhas = h.modelos == modelo
+        validos = h.km_por_litro[linhas & ~np.isnan(h.km_por_litro)]
+        if len(validos):
+            consumo_modelo[linhas] = np.median(validos)
+    flags, espaco = _capacidade_tanque(h, consumo_modelo)
+    marcar(tipos.CAPACIDADE_TANQUE, flags, h.litros, espaco)
+
+    return resultado
+
+
+def analisar_frota():
+    """
+    Executa a análise completa e grava as anomalias encontradas.
+    As pendentes de revisão são substituídas; as já revisadas são mantidas.
+    Devolve {tipo: quantidade}.
+    """
+    encontradas = detectar(carregar_historico())
+
+    with transaction.atomic():
+        AnomaliaAbastecimento.objects.filter(revisado=False).delete()
+        revisadas = set(AnomaliaAbastecimento.objects.values_list('abastecimento_id', 'tipo'))
+        AnomaliaAbastecimento.objects.bulk_create(
+            [
+                AnomaliaAbastecimento(abastecimento_id=pk, tipo=tipo, valor=valor, referencia=referencia)
+                for pk, tipo, valor, referencia in encontradas
+                if (pk, tipo) not in revisadas
+            ],
+            batch_size=2000,
+        )
+
+    totais = {}
+    for _, tipo, _, _ in encontradas:
+        totais[tipo] = totais.get(tipo, 0) + 1
+    return totais
@@ -0,0 +1,275 @@
+"""
+Feed de auditoria com o histórico (django-simple-history) dos modelos
+principais.
+
+As tabelas históricas (e as alterações intermediárias do histórico
+enxuto, AlteracaoHistorico) são combinadas no banco com UNION ALL, trazendo só
+as colunas comuns (data, tipo, usuário, id do objeto), e a ordenação e a
+paginação por cursor (history_date, tabela, history_id) também ficam no
+banco. A descrição de cada linha (placa, nome, ...) é buscada depois, em
+lote, apenas para as linhas da página.
+
+Períodos já arquivados (controle/retencao.py) não estão no banco: com o
+filtro "arquivo" (AAAA-MM) a página é montada a partir dos arquivos daquele
+mês, com as mesmas linhas, descrições e cursor.
+"""
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import CharField, F, Q, Value
+from django.utils import timezone
+
+from .models import AlteracaoHistorico, Motorista, Multa, TermoResponsabilidade, Veiculo
+from .paginacao import (
+    ANTERIOR, PROXIMA, Ordenacao, Pagina, codificar_cursor, decodificar_cursor, depois_de, tamanho_pagina,
+)
+from .retencao import registros_arquivados
+
+MODELOS = {
+    'motorista': (Motorista, 'Motorista'),
+    'veiculo': (Veiculo, 'Veículo'),
+    'termoresponsabilidade': (TermoResponsabilidade, 'Termo'),
+    'multa': (Multa, 'Multa'),
+}
+
+TIPOS = {'+': 'Criado', '~': 'Atualizado', '-': 'Deletado'}
+
+COLUNAS = ['history_date', 'tabela', 'history_id', 'history_type', 'history_user_id', 'history_change_reason', 'id']
+ORDEM = ['-history_date', '-tabela', '-history_id']
+ORDENACOES = {'recentes': Ordenacao("Mais recentes", *ORDEM)}
+
+
+def _inicio_do_dia(data):
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def _filtros(parametros):
+    """Q comum a todas as tabelas históricas a partir dos parâmetros da URL."""
+    filtro = Q()
+    if parametros.get('usuario'):
+        filtro &= Q(history_user=parametros['usuario'])
+    if parametros.get('tipo') in TIPOS:
+        filtro &= Q(history_type=parametros['tipo'])
+    if parametros.get('data_inicio'):
+        filtro &= Q(history_date__gte=_inicio_do_dia(parametros['data_inicio']))
+    if parametros.get('data_fim'):
+        filtro &= Q(history_date__lt=_inicio_do_dia(parametros['data_fim']) + timedelta(days=1))
+    return filtro
+
+
+def _apos_cursor(modelo, direcao, valores):
+    """
+    Linhas de uma tabela depois do cursor (data, modelo, history_id) na
+    direção pedida. Como o modelo é constante em cada tabela, a comparação
+    da tupla vira uma condição simples sobre data e history_id.
+    """
+    data, modelo_cursor, history_id = valores
+    maior = direcao == ANTERIOR   # a ordem da lista é decrescente
+    operador = 'gt' if maior else 'lt'
+    if modelo == modelo_cursor:
+        return Q(**{f'history_date__{operador}': data}) | Q(history_date=data, **{f'history_id__{operador}': history_id})
+    # Mesma data: entra se o modelo da tabela vem depois do modelo do cursor
+    mesma_data_entra = (modelo > modelo_cursor) if maior else (modelo < modelo_cursor)
+    return Q(**{f'history_date__{operador}{"e" if mesma_data_entra else ""}': data})
+
+
+def consultar(filtro, modelos, posicao, limite):
+    """Uma única consulta (UNION ALL) com as linhas da página, já ordenadas."""
+    direcao, valores = posicao if posicao else (PROXIMA, None)
+    ordem = ORDEM if direcao == PROXIMA else [c.lstrip('-') for c in ORDEM]
+    # Postgres aceita ORDER BY/LIMIT em cada parte: cada tabela usa o índice de
+    # history_date e devolve no máximo "limite" linhas para o UNION
+    limitar_partes = connection.features.supports_slicing_ordering_in_compound
+
+    partes = []
+    for chave in modelos:
+        consulta = MODELOS[chave][0].history.filter(filtro)
+        if valores:
+            consulta = consulta.filter(_apos_cursor(chave, direcao, valores))
+        consulta = consulta.annotate(tabela=Value(chave, output_field=CharField())).values_list(*COLUNAS)
+        # Sem limite por parte, a ordenação padrão das tabelas históricas precisa sair
+        consulta = consulta.order_by(*ordem)[:limite] if limitar_partes else consulta.order_by()
+        partes.append(consulta)
+
+    # Alterações intermediárias do histórico enxuto (controle/historico.py). O id
+    # vai negativo para não coincidir com o history_id das tabelas históricas
+    deltas = AlteracaoHistorico.objects.filter(filtro, tabela__in=modelos).annotate(history_id=-F('id'))
+    if valores:
+        deltas = deltas.filter(depois_de(ordem, valores))
+    deltas = deltas.values_list(
+        'history_date', 'tabela', 'history_id', 'history_type', 'history_user_id',
+        'history_change_reason', 'objeto_id',
+    )
+    partes.append(deltas.order_by(*ordem)[:limite] if limitar_partes else deltas.order_by())
+
+    primeira, *demais = partes
+    uniao = primeira.union(*demais, all=True) if demais else primeira
+    return list(uniao.order_by(*ordem)[:limite])
+
+
+def _no_periodo(data, parametros):
+    if parametros.get('data_inicio') and data < _inicio_do_dia(parametros['data_inicio']):
+        return False
+    if parametros.get('data_fim') and data >= _inicio_do_dia(parametros['data_fim']) + timedelta(days=1):
+        return False
+    return True
+
+
+def consultar_arquivo(parametros, modelos, posicao, limite):
+    """
+    Mesmo resultado de consultar() para um mês arquivado, lendo só os
+    arquivos do mês e dos modelos pedidos. Devolve (linhas, valores), com
+    os valores de descrição dos checkpoints (que não existem mais no banco).
+    """
+    usuario = parametros.get('usuario')
+    tipo = parametros.get('tipo') if parametros.get('tipo') in TIPOS else None
+    linhas, valores = [], {}
+    for registro in registros_arquivados(parametros['arquivo'], modelos):
+        if usuario and registro['history_user_id'] != usuario.pk:
+            continue
+        if tipo and registro['history_type'] != tipo:
+            continue
+        if not _no_periodo(registro['history_date'], parametros):
+            continue
+        tabela = registro['tabela']
+        # Como em consultar(): deltas com o id negativo
+        history_id = registro['id'] if registro['fonte'] == 'checkpoint' else -registro['id']
+        linhas.append((
+            registro['history_date'], tabela, history_id, registro['history_type'],
+            registro['history_user_id'], registro['history_change_reason'], registro['objeto_id'],
+        ))
+        if history_id > 0:
+            valores[tabela, history_id] = {c: registro['campos'].get(c) for c in CAMPOS_DESCRICAO[tabela]}
+
+    direcao, cursor = posicao if posicao else (PROXIMA, None)
+    if direcao == PROXIMA:
+        linhas.sort(key=lambda linha: linha[:3], reverse=True)
+        if cursor:
+            linhas = [linha for linha in linhas if linha[:3] < tuple(cursor)]
+    else:
+        linhas.sort(key=lambda linha: linha[:3])
+        linhas = [linha for linha in linhas if linha[:3] > tuple(cursor)]
+    return linhas[:limite], valores
+
+
+# Campos de cada modelo usados na descrição da linha
+CAMPOS_DESCRICAO = {
+    'motorista': ['nome'],
+    'veiculo': ['placa'],
+    'multa': ['veiculo_id', 'setor_nome'],
+    'termoresponsabilidade': ['veiculo_id', 'motorista_id'],
+}
+
+
+def _valores_descricao(linhas, arquivados=None):
+    """
+    {(tabela, history_id): valores dos CAMPOS_DESCRICAO}. Checkpoints usam a
+    própria linha histórica (ou os valores lidos do arquivo, em arquivados);
+    deltas (history_id negativo) usam o objeto atual.
+    """
+    valores = dict(arquivados or {})
+    historicos, objetos = {}, {}
+    for _, tabela, history_id, _, _, _, objeto_id in linhas:
+        if history_id < 0:
+            objetos.setdefault(tabela, set()).add(objeto_id)
+        elif (tabela, history_id) not in valores:
+            historicos.setdefault(tabela, set()).add(history_id)
+
+    for tabela, ids in historicos.items():
+        consulta = MODELOS[tabela][0].history.filter(history_id__in=ids).order_by()
+        for linha in consulta.values('history_id', *CAMPOS_DESCRICAO[tabela]):
+            valores[tabela, linha.pop('history_id')] = linha
+    atuais = {}
+    for tabela, ids in objetos.items():
+        for linha in MODELOS[tabela][0].objects.filter(pk__in=ids).values('id', *CAMPOS_DESCRICAO[tabela]):
+            atuais[tabela, linha.pop('id')] = linha
+    for _, tabela, history_id, _, _, _, objeto_id in linhas:
+        if history_id < 0 and (tabela, objeto_id) in atuais:
+            valores[tabela, history_id] = atuais[tabela, objeto_id]
+    return valores
+
+
+def _descricoes(linhas, arquivados=None):
+    """{(tabela, history_id): descrição} buscando em lote só as linhas informadas."""
+    valores = _valores_descricao(linhas, arquivados)
+    veiculos = Veiculo.objects.in_bulk({v['veiculo_id'] for v in valores.values() if 'veiculo_id' in v})
+    motoristas = Motorista.objects.in_bulk({v['motorista_id'] for v in valores.values() if 'motorista_id' in v})
+
+    descricoes = {}
+    for (tabela, history_id), v in valores.items():
+        if tabela == 'motorista':
+            descricao = v['nome']
+        elif tabela == 'veiculo':
+            descricao = v['placa']
+        elif tabela == 'multa':
+            veiculo = veiculos.get(v['veiculo_id'])
+            placa = veiculo.placa if veiculo else f"Veículo #{v['veiculo_id']}"
+            # Meses arquivados antes da troca do campo guardam 'setor'
+            descricao = f"{placa} - {v.get('setor_nome', v.get('setor'))}"
+        else:
+            veiculo, motorista = veiculos.get(v['veiculo_id']), motoristas.get(v['motorista_id'])
+            descricao = f"Termo - {veiculo} - {motorista}" if veiculo and motorista else "Termo - [dados indisponíveis]"
+        descricoes[tabela, history_id] = descricao
+    return descricoes
+
+
+def _registros(linhas, arquivados=None):
+    descricoes = _descricoes(linhas, arquivados)
+    usuarios = User.objects.in_bulk({linha[4] for linha in linhas if linha[4]})
+    return [
+        {
+            'modelo': MODELOS[modelo][1],
+            'tabela': modelo,
+            'objeto_id': objeto_id,
+            'descricao': descricoes.get((modelo, history_id), f"#{objeto_id}"),
+            'tipo': tipo,
+            'tipo_operacao': TIPOS.get(tipo, 'Desconhecido'),
+            'usuario': usuarios.get(usuario_id),
+            'data': data,
+            'motivo': motivo,
+        }
+        for data, modelo, history_id, tipo, usuario_id, motivo, objeto_id in linhas
+    ]
+
+
+def _conversores():
+    campo_data = Multa.history.model._meta.get_field('history_date')
+    return [campo_data.to_python, str, int]
+
+
+def paginar_logs(request, parametros):
+    """Página do feed de auditoria conforme os filtros (cleaned_data de FiltroLogsForm) e o cursor."""
+    modelos = [parametros['modelo']] if parametros.get('modelo') in MODELOS else list(MODELOS)
+    tamanho = tamanho_pagina(request, 50)
+
+    cursor = request.GET.get('cursor')
+    posicao = decodificar_cursor(cursor, 'recentes', _conversores()) if cursor else None
+    if posicao and posicao[1][1] not in MODELOS:
+        posicao = None
+
+    arquivados = None
+    if parametros.get('arquivo'):
+        linhas, arquivados = consultar_arquivo(parametros, modelos, posicao, tamanho + 1)
+    else:
+        linhas = consultar(_filtros(parametros), modelos, posicao, tamanho + 1)
+    ha_mais = len(linhas) > tamanho
+    linhas = linhas[:tamanho]
+    if posicao and posicao[0] == ANTERIOR:
+        linhas.reverse()
+        tem_anterior, tem_proxima = ha_mais, True
+    else:
+        tem_anterior, tem_proxima = posicao is not None, ha_mais
+
+    pagina = Pagina(_registros(linhas, arquivados), request, 'recentes', ORDENACOES, tamanho)
+
+    def url(direcao, linha):
+        parametros_url = request.GET.copy()
+        parametros_url['cursor'] = codificar_cursor(direcao, 'recentes', list(linha[:3]))
+        return f"?{parametros_url.urlencode()}"
+
+    if linhas and tem_anterior:
+        pagina.url_anterior = url(ANTERIOR, linhas[0])
+    if linhas and tem_proxima:
+        pagina.url_proxima = url(PROXIMA, linhas[-1])
+    return pagina
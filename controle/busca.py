@@ -0,0 +1,410 @@
+"""
+Busca por colunas normalizadas.
+
+Cada model pesquisável guarda, além dos campos originais, colunas
+"_busca" preenchidas no save (controle/signals.py):
+
+- textos (nome) sem acento, em minúsculas e com espaços simples, para
+  "JOSE" encontrar "José";
+- documentos (CPF, CNH) só com os dígitos, para "123.456" e "123456"
+  darem o mesmo resultado;
+- placa e auto de infração só com letras e dígitos, em minúsculas.
+
+No PostgreSQL as colunas com "contém" (nome, placa, auto) têm índice
+trigram (pg_trgm, migração 0037); as de documento são buscadas por prefixo
+como intervalo no índice comum. No SQLite o "contém" percorre a tabela,
+mas o resultado é o mesmo.
+
+A busca global (cabeçalho) usa a tabela desnormalizada DocumentoBusca:
+um documento por veículo, condutor, multa, termo e abastecimento com todo
+o texto que identifica o objeto, mantido pelos signals. Uma única consulta
+(índice trigram em "texto") devolve os resultados misturados e ordenados
+por relevância: identificador exato, depois começo do identificador, depois
+o resto.
+"""
+import hashlib
+import re
+import unicodedata
+
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.urls import reverse
+
+TAMANHO_MINIMO_DOCUMENTO = 3
+
+# model_name -> {coluna de busca: (campo original, normalizador)}
+CAMPOS = {}
+
+
+def normalizar_texto(valor):
+    if not valor:
+        return ''
+    sem_acento = unicodedata.normalize('NFKD', str(valor)).encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acento.lower().split())
+
+
+def so_digitos(valor):
+    return re.sub(r'\D', '', str(valor or ''))
+
+
+def so_alfanumericos(valor):
+    return re.sub(r'[^0-9a-z]', '', normalizar_texto(valor))
+
+
+def registrar(model_name, **colunas):
+    CAMPOS[model_name] = colunas
+
+
+registrar('motorista', nome_busca=('nome', normalizar_texto), cpf_busca=('cpf', so_digitos),
+          cnh_busca=('cnh_numero', so_digitos))
+registrar('veiculo', placa_busca=('placa', so_alfanumericos))
+registrar('multa', auto_infracao_busca=('auto_infracao', so_alfanumericos))
+registrar('infracaotransito', descricao_busca=('descricao', normalizar_texto))
+
+
+def preencher(instancia):
+    """Atualiza as colunas de busca a partir dos campos originais (sem salvar)."""
+    for coluna, (campo, normalizador) in CAMPOS.get(instancia._meta.model_name, {}).items():
+        setattr(instancia, coluna, normalizador(getattr(instancia, campo)))
+
+
+# ==================================================
+# =================== FILTROS ======================
+# ==================================================
+
+def q_texto(coluna, termo):
+    """Todas as palavras do termo contidas na coluna (índice trigram no PostgreSQL)."""
+    palavras = normalizar_texto(termo).split()
+    if not palavras:
+        return None
+    condicao = Q()
+    for palavra in palavras:
+        condicao &= Q(**{f'{coluna}__contains': palavra})
+    return condicao
+
+
+def q_prefixo(coluna, prefixo):
+    """
+    Coluna começando pelo prefixo, como intervalo (>= '123' e < '124'): usa o
+    índice B-tree comum em qualquer banco, ao contrário de LIKE 'x%'.
+    """
+    return Q(**{f'{coluna}__gte': prefixo, f'{coluna}__lt': prefixo[:-1] + chr(ord(prefixo[-1]) + 1)})
+
+
+def q_documento(coluna, termo):
+    """Documento começando pelos dígitos digitados."""
+    digitos = so_digitos(termo)
+    if len(digitos) < TAMANHO_MINIMO_DOCUMENTO:
+        return None
+    return q_prefixo(coluna, digitos)
+
+
+def q_codigo(coluna, termo):
+    """Placa ou auto de infração contendo as letras e dígitos digitados."""
+    codigo = so_alfanumericos(termo)
+    if not codigo:
+        return None
+    return Q(**{f'{coluna}__contains': codigo})
+
+
+def _combinar(*condicoes):
+    resultado = None
+    for condicao in condicoes:
+        if condicao is not None:
+            resultado = condicao if resultado is None else resultado | condicao
+    return resultado
+
+
+def _tem_letras(termo):
+    return any(c.isalpha() for c in termo)
+
+
+def q_motorista(termo, prefixo=''):
+    """Com letras, busca no nome; só números e pontuação, no CPF e na CNH."""
+    if _tem_letras(termo):
+        return q_texto(f'{prefixo}nome_busca', termo)
+    return _combinar(q_documento(f'{prefixo}cpf_busca', termo), q_documento(f'{prefixo}cnh_busca', termo))
+
+
+def q_veiculo(termo, prefixo=''):
+    return q_codigo(f'{prefixo}placa_busca', termo)
+
+
+def q_multa(termo):
+    return _combinar(q_codigo('auto_infracao_busca', termo), q_veiculo(termo, 'veiculo__'))
+
+
+def buscar(queryset, termo):
+    """
+    Filtra o queryset (motorista, veículo ou multa) pelo termo. Termo vazio
+    devolve o queryset inteiro; termo sem nada pesquisável, nenhum resultado.
+    """
+    if not termo or not termo.strip():
+        return queryset
+    condicao = {
+        'motorista': q_motorista,
+        'veiculo': q_veiculo,
+        'multa': q_multa,
+    }[queryset.model._meta.model_name](termo)
+    return queryset.filter(condicao) if condicao is not None else queryset.none()
+
+
+# ==================================================
+# ================ BUSCA GLOBAL ====================
+# ==================================================
+
+TIPOS_DOCUMENTO = {
+    'veiculo': 'Veículo',
+    'motorista': 'Condutor',
+    'multa': 'Multa',
+    'termo': 'Termo',
+    'abastecimento': 'Abastecimento',
+}
+LIMITE_GLOBAL = 20
+TAMANHO_LOTE_INDICE = 1000
+
+
+def _juntar(*partes):
+    """Texto do documento: cada parte normalizada e também só com letras e dígitos."""
+    termos = []
+    for parte in partes:
+        texto = normalizar_texto(parte)
+        if texto:
+            termos.append(texto)
+            compacto = so_alfanumericos(texto)
+            if compacto and compacto != texto:
+                termos.append(compacto)
+    return ' '.join(termos)
+
+
+def _data(valor):
+    return f"{valor:%d/%m/%Y}" if valor else ''
+
+
+def _doc_veiculo(v):
+    return {
+        'chave': v.placa_busca,
+        'titulo': v.placa,
+        'subtitulo': ' · '.join(filter(None, [f"{v.marca} {v.modelo}", str(v.setor or '')])),
+        'texto': _juntar(v.placa, v.marca, v.modelo, v.renavam, v.chassi, v.setor),
+        'url': reverse('detalhar_veiculo', args=[v.pk]),
+    }
+
+
+def _doc_motorista(m):
+    return {
+        'chave': m.cpf_busca,
+        'titulo': m.nome,
+        'subtitulo': f"CPF {m.cpf} · CNH {m.cnh_numero}",
+        'texto': _juntar(m.nome, m.cpf, m.cnh_numero),
+        'url': reverse('editar_motorista', args=[m.pk]),
+    }
+
+
+def _doc_multa(m):
+    motorista = m.motorista.nome if m.motorista else ''
+    return {
+        'chave': m.auto_infracao_busca,
+        'titulo': f"Multa {m.auto_infracao}" if m.auto_infracao else f"Multa #{m.pk}",
+        'subtitulo': ' · '.join(filter(None, [m.veiculo.placa, _data(m.data_hora_infracao), m.setor_nome, motorista])),
+        'texto': _juntar(m.auto_infracao, m.veiculo.placa, motorista, m.setor_nome),
+        'url': reverse('detalhar_multa', args=[m.pk]),
+    }
+
+
+def _doc_termo(t):
+    return {
+        'chave': t.veiculo.placa_busca,
+        'titulo': f"Termo {t.veiculo.placa} - {t.motorista.nome}",
+        'subtitulo': f"Assinado em {_data(t.data_assinatura)}",
+        'texto': _juntar(t.veiculo.placa, t.motorista.nome, t.motorista.cpf),
+        'url': reverse('termo_responsabilidade', args=[t.veiculo_id, t.motorista_id]),
+    }
+
+
+def _doc_abastecimento(a):
+    motorista = a.abastecido_por.nome if a.abastecido_por else ''
+    return {
+        'chave': a.veiculo.placa_busca,
+        'titulo': f"Abastecimento {a.veiculo.placa}",
+        'subtitulo': ' · '.join(filter(None, [_data(a.data), f"{a.litros} L", a.posto, motorista])),
+        'texto': _juntar(a.veiculo.placa, a.posto, motorista),
+        'url': reverse('editar_abastecimento', args=[a.pk]),
+    }
+
+
+def _indexados():
+    """model -> (tipo, prioridade, select_related, montador)."""
+    from .models import Abastecimento, Motorista, Multa, TermoResponsabilidade, Veiculo
+
+    return {
+        Veiculo: ('veiculo', 0, ['setor'], _doc_veiculo),
+        Motorista: ('motorista', 1, [], _doc_motorista),
+        Multa: ('multa', 2, ['veiculo', 'motorista'], _doc_multa),
+        TermoResponsabilidade: ('termo', 3, ['veiculo', 'motorista'], _doc_termo),
+        Abastecimento: ('abastecimento', 4, ['veiculo', 'abastecido_por'], _doc_abastecimento),
+    }
+
+
+def indexar(queryset):
+    """Cria ou atualiza os documentos dos objetos do queryset, em lotes."""
+    from .models import DocumentoBusca
+
+    tipo, prioridade, relacionados, montar = _indexados()[queryset.model]
+    campos = ['prioridade', 'chave', 'texto', 'titulo', 'subtitulo', 'url', 'atualizado_em']
+    lote, total = [], 0
+    for objeto in queryset.select_related(*relacionados).order_by().iterator(chunk_size=TAMANHO_LOTE_INDICE):
+        lote.append(DocumentoBusca(tipo=tipo, objeto_id=objeto.pk, prioridade=prioridade, **montar(objeto)))
+        if len(lote) >= TAMANHO_LOTE_INDICE:
+            total += _gravar(lote, campos)
+            lote = []
+    return total + _gravar(lote, campos)
+
+
+def _gravar(documentos, campos):
+    from .models import DocumentoBusca
+
+    if documentos:
+        DocumentoBusca.objects.bulk_create(
+            documentos, update_conflicts=True, unique_fields=['tipo', 'objeto_id'], update_fields=campos,
+        )
+    return len(documentos)
+
+
+def remover(model, pk):
+    from .models import DocumentoBusca
+
+    DocumentoBusca.objects.filter(tipo=_indexados()[model][0], objeto_id=pk).delete()
+
+
+def indexar_objeto(instancia):
+    """
+    Atualiza o documento do objeto. Se o texto de um veículo ou condutor
+    mudou (placa, nome, ...), atualiza também os documentos que o citam.
+    """
+    from .models import DocumentoBusca, Motorista, Veiculo
+
+    model = type(instancia)
+    tipo = _indexados()[model][0]
+    anterior = DocumentoBusca.objects.filter(tipo=tipo, objeto_id=instancia.pk).values_list('texto', flat=True).first()
+    indexar(model.objects.filter(pk=instancia.pk))
+    if anterior is None or model not in (Veiculo, Motorista):
+        return
+    atual = DocumentoBusca.objects.filter(tipo=tipo, objeto_id=instancia.pk).values_list('texto', flat=True).first()
+    if atual == anterior:
+        return
+    # Veículo e condutor têm os mesmos related_names
+    for queryset in (instancia.multas.all(), instancia.termoresponsabilidade_set.all(), instancia.abastecimentos.all()):
+        indexar(queryset)
+
+
+def reindexar_tudo():
+    """Recria todos os documentos (comando indexar_busca). Devolve {tipo: quantidade}."""
+    from .models import DocumentoBusca
+
+    totais = {}
+    for model, (tipo, _, _, _) in _indexados().items():
+        totais[tipo] = indexar(model.objects.all())
+        DocumentoBusca.objects.filter(tipo=tipo).exclude(objeto_id__in=model.objects.values('pk')).delete()
+    return totais
+
+
+def buscar_global(termo, limite=LIMITE_GLOBAL):
+    """
+    Documentos que contêm todas as palavras do termo (ou o termo sem
+    pontuação, para placas e documentos), do mais relevante ao menos.
+    """
+    from .models import DocumentoBusca
+
+    palavras = normalizar_texto(termo).split()
+    compacto = so_alfanumericos(termo)
+    if not palavras:
+        return []
+
+    condicao = Q()
+    for palavra in palavras:
+        condicao &= Q(texto__contains=palavra)
+    if len(compacto) >= TAMANHO_MINIMO_DOCUMENTO:
+        condicao |= Q(texto__contains=compacto)
+
+    relevancia = Case(
+        When(chave=compacto, then=Value(3)),
+        When(chave__startswith=compacto, then=Value(2)),
+        default=Value(1),
+        output_field=IntegerField(),
+    ) if compacto else Value(1, output_field=IntegerField())
+    return list(
+        DocumentoBusca.objects.filter(condicao)
+        .annotate(relevancia=relevancia)
+        .order_by('-relevancia', 'prioridade', 'titulo')[:limite]
+    )
+
+
+# ==================================================
+# ================= AUTOCOMPLETE ===================
+# ==================================================
+
+LIMITE_AUTOCOMPLETE = 15
+TAMANHO_MINIMO_AUTOCOMPLETE = 2
+CACHE_AUTOCOMPLETE = 60  # segundos
+
+
+def _autocomplete_veiculo(termo):
+    from .models import Veiculo
+
+    codigo = so_alfanumericos(termo)
+    if not codigo:
+        return None
+    return Veiculo.objects.filter(q_prefixo('placa_busca', codigo)).order_by('placa_busca')
+
+
+def _autocomplete_motorista(termo):
+    from .models import Motorista
+
+    if _tem_letras(termo):
+        condicao = q_prefixo('nome_busca', normalizar_texto(termo))
+    else:
+        condicao = _combinar(q_documento('cpf_busca', termo), q_documento('cnh_busca', termo))
+    if condicao is None:
+        return None
+    return Motorista.objects.filter(condicao).order_by('nome_busca')
+
+
+def _autocomplete_infracao(termo):
+    from .models import InfracaoTransito
+
+    # Tabela pequena (infrações do CTB): palavras em qualquer parte da descrição
+    condicao = q_texto('descricao_busca', termo)
+    if condicao is None:
+        return None
+    return InfracaoTransito.objects.filter(condicao).order_by('descricao_busca')
+
+
+# tipo -> (consulta pelo termo, rótulo exibido)
+AUTOCOMPLETE = {
+    'veiculo': (_autocomplete_veiculo, lambda v: f"{v.placa} - {v.marca} {v.modelo}"),
+    'motorista': (_autocomplete_motorista, lambda m: f"{m.nome} (CPF {m.cpf})"),
+    'infracao': (_autocomplete_infracao, lambda i: f"{i.descricao} ({i.get_gravidade_display()})"),
+}
+
+
+def autocompletar(tipo, termo):
+    """
+    [{'id', 'texto'}] para as caixas de seleção dos formulários, no máximo
+    LIMITE_AUTOCOMPLETE. O resultado de cada termo fica CACHE_AUTOCOMPLETE
+    segundos no cache.
+    """
+    termo = (termo or '').strip()
+    if len(termo) < TAMANHO_MINIMO_AUTOCOMPLETE:
+        return []
+    # Hash do termo normalizado: a chave fica curta e sem espaços (memcached)
+    chave = f"controle:autocomplete:{tipo}:{hashlib.md5(normalizar_texto(termo).encode()).hexdigest()}"
+    resultados = cache.get(chave)
+    if resultados is None:
+        consultar, rotulo = AUTOCOMPLETE[tipo]
+        queryset = consultar(termo)
+        resultados = [] if queryset is None else [
+            {'id': objeto.pk, 'texto': rotulo(objeto)} for objeto in queryset[:LIMITE_AUTOCOMPLETE]
+        ]
+        cache.set(chave, resultados, CACHE_AUTOCOMPLETE)
+    return resultados
@@ -0,0 +1,227 @@
+"""
+Cache de páginas e trechos de template por dependência de models.
+
+Cada view ou trecho declara de quais models depende ('multa') e,
+opcionalmente, de quais objetos ('veiculo' com pk 5). Cada dependência tem
+um carimbo de versão no cache; a chave da entrada inclui os carimbos, então
+trocar um carimbo invalida exatamente as entradas que dependem dele, sem
+procurar chaves. Os signals de controle/signals.py trocam, a cada
+post_save/post_delete/m2m_changed de um model de modelos(), o carimbo do
+model, o do objeto e o dos objetos "pais" (as chaves estrangeiras para
+outros models de modelos(), antes e depois da alteração): um abastecimento
+novo invalida o veículo dele. Dentro de uma transação os carimbos são
+trocados na hora e de novo no commit: uma requisição que leia as linhas
+antigas entre os dois momentos guarda a página sob um carimbo que o commit
+descarta.
+
+Usa o backend padrão do django.core.cache (locmem por padrão; em produção
+um backend compartilhado, como Redis ou Memcached, para valer entre os
+processos). Acertos e falhas são contados por nome no próprio cache
+(comando estatisticas_cache).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+TEMPO_PADRAO = getattr(settings, 'CACHE_MODELOS_TEMPO', 60 * 60)  # segundos
+NOMES = set()  # nomes de views/trechos registrados, para as estatísticas
+
+
+def modelos():
+    """Models cujas alterações invalidam o cache."""
+    from .models import Abastecimento, InfracaoTransito, Motorista, Multa, Setor, TermoResponsabilidade, Veiculo
+
+    return (Veiculo, Motorista, Multa, Abastecimento, TermoResponsabilidade, Setor, InfracaoTransito)
+
+
+# ==================================================
+# =============== CARIMBOS DE VERSÃO ===============
+# ==================================================
+
+def _chave_versao(tabela, pk=None):
+    return f"controle:dep:{tabela}" if pk is None else f"controle:dep:{tabela}:{pk}"
+
+
+def _dependencia(texto):
+    """'veiculo' -> ('veiculo', None); 'veiculo:5' -> ('veiculo', '5')."""
+    tabela, _, pk = str(texto).partition(':')
+    return tabela, pk or None
+
+
+def versoes(dependencias):
+    """
+    Carimbos atuais das dependências, na ordem. Um carimbo que não está no
+    cache (nunca usado ou expulso) recebe um novo, nunca um já usado.
+    """
+    chaves = [_chave_versao(*dependencia) for dependencia in dependencias]
+    atuais = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in atuais:
+            cache.add(chave, time.time_ns(), None)
+            atuais[chave] = cache.get(chave)
+    return [atuais[chave] for chave in chaves]
+
+
+def _trocar(chaves):
+    """Carimbos novos para as chaves agora e, se houver transação aberta, de novo no commit."""
+    def trocar():
+        agora = time.time_ns()
+        cache.set_many({chave: agora for chave in chaves}, None)
+
+    if not chaves:
+        return
+    trocar()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(trocar)
+
+
+def invalidar(tabela, pks=()):
+    """Troca o carimbo do model e dos objetos informados."""
+    _trocar([_chave_versao(tabela)] + [_chave_versao(tabela, pk) for pk in pks if pk is not None])
+
+
+def _campos_pais(model):
+    """Chaves estrangeiras do model para outros models de modelos()."""
+    tabelas = {m._meta.model_name for m in modelos()}
+    return [
+        campo for campo in model._meta.concrete_fields
+        if campo.many_to_one and campo.related_model._meta.model_name in tabelas
+    ]
+
+
+def pais(instancia):
+    """[(tabela, pk)] dos objetos apontados pelas chaves estrangeiras da instância."""
+    return [
+        (campo.related_model._meta.model_name, getattr(instancia, campo.attname))
+        for campo in _campos_pais(type(instancia))
+    ]
+
+
+def pais_no_banco(instancia):
+    """Como pais(), mas com os valores ainda gravados (antes do save)."""
+    campos = _campos_pais(type(instancia))
+    if not campos or instancia.pk is None:
+        return []
+    gravado = type(instancia)._default_manager.filter(pk=instancia.pk).values(*(c.attname for c in campos)).first()
+    if gravado is None:
+        return []
+    return [(campo.related_model._meta.model_name, gravado[campo.attname]) for campo in campos]
+
+
+def invalidar_objeto(instancia, anteriores=()):
+    """Carimbos do model, do objeto e dos pais (atuais e anteriores ao save)."""
+    invalidar(instancia._meta.model_name, [instancia.pk])
+    por_tabela = {}
+    for tabela, pk in [*pais(instancia), *anteriores]:
+        if pk is not None:
+            por_tabela.setdefault(tabela, set()).add(pk)
+    for tabela, pks in por_tabela.items():
+        invalidar_pks(tabela, pks)
+
+
+def invalidar_pks(tabela, pks):
+    """Só os carimbos dos objetos (a lista do model não mudou)."""
+    _trocar([_chave_versao(tabela, pk) for pk in pks if pk is not None])
+
+
+# ==================================================
+# ==================== ENTRADAS ====================
+# ==================================================
+
+def _contar(nome, evento):
+    chave = f"controle:entrada:estatisticas:{nome}:{evento}"
+    if not cache.add(chave, 1, None):
+        try:
+            cache.incr(chave)
+        except ValueError:  # expulsa entre o add e o incr
+            cache.set(chave, 1, None)
+
+
+def estatisticas():
+    """{nome: (acertos, falhas)} dos nomes registrados neste processo."""
+    chaves = {
+        (nome, evento): f"controle:entrada:estatisticas:{nome}:{evento}"
+        for nome in NOMES for evento in ('acertos', 'falhas')
+    }
+    valores = cache.get_many(chaves.values())
+    return {
+        nome: (valores.get(chaves[nome, 'acertos'], 0), valores.get(chaves[nome, 'falhas'], 0))
+        for nome in sorted(NOMES)
+    }
+
+
+def zerar_estatisticas():
+    cache.delete_many([f"controle:entrada:estatisticas:{nome}:{evento}" for nome in NOMES for evento in ('acertos', 'falhas')])
+
+
+def em_cache(nome, dependencias, gerar, variacao=(), tempo=None):
+    """
+    Valor de gerar() guardado sob o nome, a variação (usuário, URL...) e os
+    carimbos atuais das dependências ('multa', 'veiculo:5'). None não é
+    guardado.
+    """
+    NOMES.add(nome)
+    dependencias = [_dependencia(d) for d in dependencias]
+    partes = [*map(str, variacao), *(f"{t}:{pk}={v}" for (t, pk), v in zip(dependencias, versoes(dependencias)))]
+    chave = f"controle:entrada:{nome}:{hashlib.md5('|'.join(partes).encode()).hexdigest()}"
+    valor = cache.get(chave)
+    if valor is not None:
+        _contar(nome, 'acertos')
+        return valor
+    _contar(nome, 'falhas')
+    valor = gerar()
+    if valor is not None:
+        cache.set(chave, valor, TEMPO_PADRAO if tempo is None else tempo)
+    return valor
+
+
+def cache_dependente(*dependencias, tempo=None):
+    """
+    Cacheia a resposta de uma view de GET por usuário e URL completa.
+    'tabela:kwarg' depende do objeto cuja pk vem do argumento da URL, ex.:
+    @cache_dependente('veiculo:pk', 'motorista').
+
+    Não cacheia (nem lê do cache) quando há mensagens pendentes ou o
+    navegador ainda não tem o cookie CSRF; o valor do cookie entra na chave,
+    para o token dos formulários da página continuar válido.
+    """
+    def decorador(view):
+        nome = view.__name__
+        NOMES.add(nome)
+
+        @wraps(view)
+        def embrulho(request, *args, **kwargs):
+            csrf = request.META.get('CSRF_COOKIE')
+            if request.method != 'GET' or not csrf or len(get_messages(request)):
+                return view(request, *args, **kwargs)
+
+            resultado = {}
+
+            def gerar():
+                resposta = view(request, *args, **kwargs)
+                resultado['resposta'] = resposta
+                if resposta.status_code != 200 or getattr(resposta, 'streaming', False):
+                    return None
+                if hasattr(resposta, 'render') and not resposta.is_rendered:
+                    resposta.render()
+                return (resposta.content, resposta['Content-Type'])
+
+            resolvidas = []
+            for dependencia in dependencias:
+                tabela, argumento = _dependencia(dependencia)
+                resolvidas.append(tabela if argumento is None else f"{tabela}:{kwargs[argumento]}")
+            variacao = (request.user.pk, request.get_full_path(), hashlib.md5(csrf.encode()).hexdigest())
+
+            guardado = em_cache(nome, resolvidas, gerar, variacao, tempo)
+            if 'resposta' in resultado:
+                return resultado['resposta']
+            conteudo, tipo = guardado
+            return HttpResponse(conteudo, content_type=tipo)
+        return embrulho
+    return decorador
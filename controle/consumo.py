@@ -0,0 +1,119 @@
+import calendar
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Abastecimento, ConsumoMensal, Veiculo
+
+
+def primeiro_dia(data):
+    return data.replace(day=1)
+
+
+def ultimo_dia(data):
+    return data.replace(day=calendar.monthrange(data.year, data.month)[1])
+
+
+def _novo_total(veiculo_id, mes, tipo_combustivel):
+    return ConsumoMensal(
+        veiculo_id=veiculo_id,
+        mes=mes,
+        tipo_combustivel=tipo_combustivel,
+        litros=Decimal('0'),
+        valor_total=Decimal('0'),
+        km_rodado=0,
+        quantidade=0,
+    )
+
+
+def _acumular(total, abastecimento):
+    total.litros += abastecimento['litros']
+    total.valor_total += abastecimento['valor_total']
+    total.quantidade += 1
+    # O primeiro abastecimento do veículo não tem km anterior para comparar
+    if abastecimento['hodometro_anterior']:
+        total.km_rodado += abastecimento['km_rodado']
+
+
+def _campos_consumo(queryset):
+    return queryset.values(
+        'veiculo_id', 'data', 'tipo_combustivel', 'litros', 'valor_total',
+        'hodometro_anterior', 'km_rodado',
+    )
+
+
+def _proxima_data(veiculo_id, data, hodometro, ignorar_pk=None):
+    """Data do abastecimento seguinte a uma posição (data, hodômetro)."""
+    proximos = Abastecimento.objects.filter(
+        Q(data__gt=data) | Q(data=data, hodometro__gt=hodometro),
+        veiculo_id=veiculo_id,
+    )
+    if ignorar_pk:
+        proximos = proximos.exclude(pk=ignorar_pk)
+    return proximos.order_by('data', 'hodometro').values_list('data', flat=True).first()
+
+
+def recalcular_mes(veiculo_id, mes):
+    """Refaz os totais de um veículo em um mês a partir dos abastecimentos."""
+    abastecimentos = Abastecimento.objects.filter(veiculo_id=veiculo_id).com_consumo(
+        primeiro_dia(mes), ultimo_dia(mes)
+    )
+
+    totais = {}
+    for abastecimento in _campos_consumo(abastecimentos):
+        tipo = abastecimento['tipo_combustivel']
+        if tipo not in totais:
+            totais[tipo] = _novo_total(veiculo_id, primeiro_dia(mes), tipo)
+        _acumular(totais[tipo], abastecimento)
+
+    ConsumoMensal.objects.filter(veiculo_id=veiculo_id, mes=primeiro_dia(mes)).delete()
+    ConsumoMensal.objects.bulk_create(totais.values())
+
+
+def atualizar_consumo_mensal(posicoes, ignorar_pk=None):
+    """
+    Atualiza o consolidado após incluir, alterar ou excluir abastecimentos.
+
+    posicoes: tuplas (veiculo_id, data, hodometro) antes e depois da alteração.
+    Além do mês de cada posição, recalcula o mês do abastecimento seguinte,
+    cujo km rodado depende do anterior.
+    """
+    posicoes = list(posicoes)
+    with transaction.atomic():
+        # Trava os veículos (em ordem de pk, sem deadlock entre lotes) antes
+        # de ler os abastecimentos: duas gravações do mesmo veículo e mês
+        # recalculam uma depois da outra, e a segunda já enxerga a primeira
+        veiculos = sorted({veiculo_id for veiculo_id, _, _ in posicoes})
+        list(Veiculo.objects.select_for_update().filter(pk__in=veiculos).order_by('pk').values_list('pk', flat=True))
+
+        meses = set()
+        for veiculo_id, data, hodometro in posicoes:
+            meses.add((veiculo_id, primeiro_dia(data)))
+            proxima = _proxima_data(veiculo_id, data, hodometro, ignorar_pk)
+            if proxima:
+                meses.add((veiculo_id, primeiro_dia(proxima)))
+
+        for veiculo_id, mes in sorted(meses):
+            recalcular_mes(veiculo_id, mes)
+
+
+def reconstruir_consumo_mensal(tamanho_lote=2000):
+    """Apaga e recria todo o consolidado a partir do histórico de abastecimentos."""
+    abastecimentos = Abastecimento.objects.com_consumo().order_by('veiculo_id', 'data', 'hodometro')
+
+    totais = {}
+    for abastecimento in _campos_consumo(abastecimentos).iterator(chunk_size=tamanho_lote):
+        chave = (
+            abastecimento['veiculo_id'],
+            primeiro_dia(abastecimento['data']),
+            abastecimento['tipo_combustivel'],
+        )
+        if chave not in totais:
+            totais[chave] = _novo_total(*chave)
+        _acumular(totais[chave], abastecimento)
+
+    with transaction.atomic():
+        ConsumoMensal.objects.all().delete()
+        ConsumoMensal.objects.bulk_create(totais.values(), batch_size=tamanho_lote)
+    return len(totais)
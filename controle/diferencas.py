@@ -0,0 +1,248 @@
+"""
+Histórico de um objeto com as diferenças campo a campo.
+
+As entradas (checkpoints Historical* e deltas de AlteracaoHistorico) são
+paginadas por cursor, na mesma ordem de historico.versoes: (data, origem,
+id), com origem 0 para checkpoint e 1 para delta. O diff só é calculado
+para as entradas da página: parte-se do último checkpoint anterior à
+entrada mais antiga e aplicam-se no máximo CHECKPOINT deltas, então o custo
+não depende do tamanho do histórico. Como o passado não muda, cada diff
+fica no cache para sempre, pela chave da entrada. Os rótulos de chaves
+estrangeiras são buscados em lote, só na exibição.
+"""
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Q
+from django.utils import formats, timezone
+
+from .historico import aplicar_delta, campos_rastreados, estado_checkpoint, iguais, serializar
+from .models import AlteracaoHistorico
+from .paginacao import ANTERIOR, PROXIMA, Ordenacao, Pagina, codificar_cursor, decodificar_cursor, tamanho_pagina
+
+CHECKPOINT, DELTA = 0, 1
+ORDENACOES = {'recentes': Ordenacao("Mais recentes", '-history_date', '-origem', '-id')}
+
+
+def _chave_cache(tabela, origem, registro_id):
+    return f"controle:diff:{tabela}:{origem}:{registro_id}"
+
+
+def _ignorados(campos):
+    """A chave primária e os campos que mudam a cada save (auto_now) só poluem o diff."""
+    return {campo.attname for campo in campos if campo.primary_key or getattr(campo, 'auto_now', False)}
+
+
+# ==================================================
+# ================== ENTRADAS ======================
+# ==================================================
+
+def _apos(origem, direcao, valores):
+    """Condição de cursor para uma das fontes (origem constante, como em auditoria._apos_cursor)."""
+    data, origem_cursor, registro_id = valores
+    maior = direcao == ANTERIOR
+    operador = 'gt' if maior else 'lt'
+    campo_id = 'history_id' if origem == CHECKPOINT else 'id'
+    if origem == origem_cursor:
+        return Q(**{f'history_date__{operador}': data}) | Q(history_date=data, **{f'{campo_id}__{operador}': registro_id})
+    mesma_data_entra = (origem > origem_cursor) if maior else (origem < origem_cursor)
+    return Q(**{f'history_date__{operador}{"e" if mesma_data_entra else ""}': data})
+
+
+def _fontes(model, objeto_id):
+    return (
+        model.history.filter(id=objeto_id),
+        AlteracaoHistorico.objects.filter(tabela=model._meta.model_name, objeto_id=objeto_id),
+    )
+
+
+def _chave(registro):
+    origem = DELTA if isinstance(registro, AlteracaoHistorico) else CHECKPOINT
+    return (registro.history_date, origem, registro.pk)
+
+
+def entradas(model, objeto_id, posicao, limite):
+    """Até `limite` entradas do objeto depois do cursor, na ordem da direção pedida."""
+    direcao, valores = posicao if posicao else (PROXIMA, None)
+    decrescente = direcao == PROXIMA
+    checkpoints, deltas = _fontes(model, objeto_id)
+    if valores:
+        checkpoints = checkpoints.filter(_apos(CHECKPOINT, direcao, valores))
+        deltas = deltas.filter(_apos(DELTA, direcao, valores))
+    ordem = ['-history_date'] if decrescente else ['history_date']
+    checkpoints = checkpoints.order_by(*ordem, '-history_id' if decrescente else 'history_id')[:limite]
+    deltas = deltas.order_by(*ordem, '-id' if decrescente else 'id')[:limite]
+    return sorted([*checkpoints, *deltas], key=_chave, reverse=decrescente)[:limite]
+
+
+# ==================================================
+# =================== DIFFS ========================
+# ==================================================
+
+def _calcular(model, objeto_id, registros, campos):
+    """
+    {chave: [(attname, antes, depois)]} para os registros (em ordem
+    cronológica), refazendo o estado a partir do checkpoint anterior.
+    """
+    por_nome = {campo.attname: campo for campo in campos}
+    ignorados = _ignorados(campos)
+    primeiro = _chave(registros[0])
+    checkpoints, deltas = _fontes(model, objeto_id)
+
+    base = checkpoints.filter(_apos(CHECKPOINT, PROXIMA, primeiro)).order_by('-history_date', '-history_id').first()
+    estado = None
+    if base is not None and base.history_type != '-':
+        estado = estado_checkpoint(base, campos)
+        # Deltas entre o checkpoint-base e a primeira entrada (no máximo CHECKPOINT)
+        anteriores = deltas.filter(_apos(DELTA, PROXIMA, primeiro)).filter(_apos(DELTA, ANTERIOR, _chave(base)))
+        for delta in anteriores.order_by('history_date', 'id'):
+            aplicar_delta(estado, delta, por_nome)
+
+    diffs = {}
+    for registro in registros:
+        chave = _chave(registro)
+        if chave[1] == CHECKPOINT:
+            novo = estado_checkpoint(registro, campos)
+            if registro.history_type == '-':
+                diff = []
+            else:
+                diff = [
+                    (nome, None if estado is None else serializar(por_nome[nome], estado.get(nome)),
+                     serializar(por_nome[nome], valor))
+                    for nome, valor in novo.items()
+                    if nome not in ignorados and (
+                        (estado is None and valor not in (None, ''))
+                        or (estado is not None and not iguais(por_nome[nome], valor, estado.get(nome)))
+                    )
+                ]
+            estado = None if registro.history_type == '-' else novo
+        else:
+            diff = [
+                (nome, None if estado is None else serializar(por_nome[nome], estado.get(nome)), valor)
+                for nome, valor in registro.campos.items()
+                if nome in por_nome and nome not in ignorados
+            ]
+            if estado is not None:
+                estado = dict(estado)
+                aplicar_delta(estado, registro, por_nome)
+        diffs[chave] = diff
+    return diffs
+
+
+def diferencas(model, objeto_id, registros):
+    """
+    {chave: [(attname, antes, depois)]} para as entradas informadas. Usa o
+    cache e só recalcula (numa única passada) as que faltam.
+    """
+    tabela = model._meta.model_name
+    chaves = {_chave(r): _chave_cache(tabela, *_chave(r)[1:]) for r in registros}
+    em_cache = cache.get_many(chaves.values())
+    diffs = {chave: em_cache[chave_cache] for chave, chave_cache in chaves.items() if chave_cache in em_cache}
+
+    faltando = sorted((r for r in registros if _chave(r) not in diffs), key=_chave)
+    if faltando:
+        # Do mais antigo faltante até o mais novo faltante, incluindo os do meio (já em cache ou não)
+        trecho = [r for r in sorted(registros, key=_chave) if _chave(faltando[0]) <= _chave(r) <= _chave(faltando[-1])]
+        calculados = _calcular(model, objeto_id, trecho, campos_rastreados(model))
+        cache.set_many({chaves[chave]: diff for chave, diff in calculados.items()}, None)
+        diffs.update(calculados)
+    return diffs
+
+
+# ==================================================
+# ================== EXIBIÇÃO ======================
+# ==================================================
+
+def _rotulos(campos, diffs):
+    """{(attname, valor): texto} para chaves estrangeiras e choices, em lote."""
+    por_nome = {campo.attname: campo for campo in campos}
+    ids_por_campo = {}
+    for diff in diffs:
+        for nome, antes, depois in diff:
+            campo = por_nome[nome]
+            if campo.is_relation:
+                ids_por_campo.setdefault(nome, set()).update(v for v in (antes, depois) if v is not None)
+
+    rotulos = {}
+    for nome, ids in ids_por_campo.items():
+        relacionado = por_nome[nome].related_model
+        for pk, objeto in relacionado._default_manager.in_bulk(ids).items():
+            rotulos[nome, pk] = str(objeto)
+    for campo in campos:
+        if campo.choices:
+            for valor, texto in campo.flatchoices:
+                rotulos[campo.attname, valor] = str(texto)
+    return rotulos
+
+
+def _texto(campo, valor, rotulos):
+    if valor is None or valor == '':
+        return '—'
+    if (campo.attname, valor) in rotulos:
+        return rotulos[campo.attname, valor]
+    if campo.is_relation:
+        return f"#{valor} (excluído)"
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    if isinstance(campo, (models.DateField, models.DecimalField)):
+        valor = campo.to_python(valor)
+        if isinstance(valor, datetime):
+            valor = timezone.localtime(valor)
+        return formats.localize(valor)
+    return str(valor)
+
+
+def paginar_historico(request, model, objeto_id):
+    """Página do histórico do objeto, com as diferenças de cada entrada."""
+    campos = campos_rastreados(model)
+    por_nome = {campo.attname: campo for campo in campos}
+    conversores = [model.history.model._meta.get_field('history_date').to_python, int, int]
+    tamanho = tamanho_pagina(request, 25)
+
+    cursor = request.GET.get('cursor')
+    posicao = decodificar_cursor(cursor, 'recentes', conversores) if cursor else None
+    registros = entradas(model, objeto_id, posicao, tamanho + 1)
+    ha_mais = len(registros) > tamanho
+    registros = registros[:tamanho]
+    if posicao and posicao[0] == ANTERIOR:
+        registros.reverse()
+        tem_anterior, tem_proxima = ha_mais, True
+    else:
+        tem_anterior, tem_proxima = posicao is not None, ha_mais
+
+    diffs = diferencas(model, objeto_id, registros) if registros else {}
+    rotulos = _rotulos(campos, diffs.values())
+    usuarios = User.objects.in_bulk({r.history_user_id for r in registros if r.history_user_id})
+
+    itens = []
+    for registro in registros:
+        chave = _chave(registro)
+        itens.append({
+            'data': registro.history_date,
+            'tipo': registro.history_type,
+            'usuario': usuarios.get(registro.history_user_id),
+            'motivo': registro.history_change_reason,
+            'alteracoes': [
+                {
+                    'campo': por_nome[nome].verbose_name,
+                    'antes': _texto(por_nome[nome], antes, rotulos),
+                    'depois': _texto(por_nome[nome], depois, rotulos),
+                }
+                for nome, antes, depois in diffs[chave]
+            ],
+        })
+
+    pagina = Pagina(itens, request, 'recentes', ORDENACOES, tamanho)
+
+    def url(direcao, registro):
+        parametros = request.GET.copy()
+        parametros['cursor'] = codificar_cursor(direcao, 'recentes', list(_chave(registro)))
+        return f"?{parametros.urlencode()}"
+
+    if registros and tem_anterior:
+        pagina.url_anterior = url(ANTERIOR, registros[0])
+    if registros and tem_proxima:
+        pagina.url_proxima = url(PROXIMA, registros[-1])
+    return pagina
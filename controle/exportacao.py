@@ -0,0 +1,116 @@
+"""
+Exportação de multas em XLSX e CSV com memória constante.
+
+As multas são lidas do banco em blocos (.iterator) e escritas linha a
+linha: o XLSX usa o modo write-only do openpyxl, que grava as linhas em
+arquivo temporário, e o CSV é gerado sob demanda para um
+StreamingHttpResponse. Os links dos documentos vão como fórmula
+HYPERLINK, pois hyperlinks de célula ficam em memória até o fim da
+planilha. O consumo de memória não cresce com o número de multas.
+"""
+import csv
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from .busca import buscar
+
+TAMANHO_LOTE = 2000
+
+CABECALHO = [
+    'ID', 'Placa', 'Setor', 'Setor Descrição', 'Motorista',
+    'Infração', 'Valor', 'Gravidade',
+    'Data/Hora Infração', 'Local', 'Órgão Autuador',
+    'Status Multa', 'Status Pagamento', 'Prazo Pagamento', 'Data Registro',
+    'Documento Recebido', 'Comprovante Pagamento', 'Notificação Infração'
+]
+
+TEXTO_LINK = "📎 Abrir Documento"
+FONTE_LINK = Font(color="0000FF", underline="single")
+
+
+def filtrar_multas(multas, parametros):
+    """Filtros de listar_multas (status_multa, status_pagamento, setor e a busca q)."""
+    status_multa = parametros.get('status_multa')
+    status_pagamento = parametros.get('status_pagamento')
+    setor = parametros.get('setor')
+
+    if status_multa and status_multa != "todos":
+        multas = multas.filter(status_multa=status_multa)
+    if status_pagamento and status_pagamento != "todos":
+        multas = multas.filter(status_pagamento=status_pagamento)
+    if setor and setor != "todos":
+        # id do setor (tela) ou nome (comando exportar_multas --setor)
+        multas = multas.filter(setor_id=setor) if str(setor).isdigit() else multas.filter(setor__nome=setor)
+    return buscar(multas, parametros.get('q'))
+
+
+def multas_para_exportar(multas):
+    return multas.select_related('veiculo', 'motorista', 'infracao').order_by('-data_hora_infracao', '-pk')
+
+
+def _valores(multa):
+    return [
+        multa.id,
+        multa.veiculo.placa if multa.veiculo else '',
+        multa.setor_nome or '',
+        multa.setor_descricao or '',
+        multa.motorista.nome if multa.motorista else '',
+        multa.infracao.descricao if multa.infracao else '',
+        multa.valor if multa.infracao else '',
+        multa.gravidade if multa.infracao else '',
+        multa.data_hora_infracao.strftime('%d/%m/%Y %H:%M'),
+        multa.local,
+        multa.orgao_autuador,
+        multa.get_status_multa_display(),
+        multa.get_status_pagamento_display(),
+        multa.prazo_pagamento.strftime('%d/%m/%Y'),
+        multa.data_registro.strftime('%d/%m/%Y %H:%M'),
+    ]
+
+
+def _links(multa, dominio):
+    return [
+        f"{dominio}{arquivo.url}" if arquivo else ''
+        for arquivo in (multa.documento_recebido, multa.comprovante_pagamento, multa.notificacao_infracao)
+    ]
+
+
+def gerar_xlsx(multas, destino, dominio, tamanho_lote=TAMANHO_LOTE):
+    """Escreve a planilha em destino (caminho ou arquivo binário). Devolve o total de linhas."""
+    planilha = Workbook(write_only=True)
+    aba = planilha.create_sheet("Multas")
+    aba.append(CABECALHO)
+
+    total = 0
+    for multa in multas_para_exportar(multas).iterator(chunk_size=tamanho_lote):
+        linha = _valores(multa)
+        for url in _links(multa, dominio):
+            if url:
+                url = url.replace('"', '""')
+                celula = WriteOnlyCell(aba, value=f'=HYPERLINK("{url}","{TEXTO_LINK}")')
+                celula.font = FONTE_LINK
+                linha.append(celula)
+            else:
+                linha.append('')
+        aba.append(linha)
+        total += 1
+
+    planilha.save(destino)
+    return total
+
+
+class _Eco:
+    """Buffer de escrita que só devolve o que recebe (para csv.writer)."""
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(multas, dominio, tamanho_lote=TAMANHO_LOTE):
+    """Gera o CSV linha a linha (separador ';', com BOM para o Excel)."""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield '﻿' + escritor.writerow(CABECALHO)
+    for multa in multas_para_exportar(multas).iterator(chunk_size=tamanho_lote):
+        yield escritor.writerow(_valores(multa) + _links(multa, dominio))
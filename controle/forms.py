@@ -1,6 +1,11 @@
 from django import forms
 from .models import Motorista, TermoResponsabilidade, Veiculo, Multa, Setor, Abastecimento, ContaPagamento
 from django.contrib.auth.models import User, Group
+from .auditoria import MODELOS as MODELOS_AUDITADOS, TIPOS as TIPOS_AUDITORIA
+from .busca import so_alfanumericos
+from .retencao import meses_arquivados
+from .widgets import AutocompleteSelect, AutocompleteSelectMultiple
+from .vinculos import responsavel
 
 class VeiculoForm(forms.ModelForm):
     class Meta:
@@ -20,7 +25,7 @@ class VeiculoForm(forms.ModelForm):
             'tipo_combustivel': forms.Select(attrs={'class': 'form-select'}),
             'crlv': forms.ClearableFileInput(attrs={'class': 'form-control'}),
             'seguro': forms.ClearableFileInput(attrs={'class': 'form-control'}),
-            'motoristas': forms.SelectMultiple(attrs={'class': 'form-select', 'size':6}),
+            'motoristas': AutocompleteSelectMultiple('motorista', attrs={'class': 'form-select', 'size':6}),
             'status_atual': forms.Select(attrs={'class': 'form-select'}),
             'setor': forms.Select(attrs={'class': 'form-select'}),
         }
@@ -70,26 +75,23 @@ class UserForm(forms.ModelForm):
 
 
 class TrocaSetorForm(forms.ModelForm):
+    """Troca o setor da multa: a chave estrangeira e o nome/descrição congelados."""
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        setores = Setor.objects.all()
-        self.setor_map = {s.nome: s.descricao for s in setores}
-        self.fields['setor'] = forms.ChoiceField(
-            choices=[(s.nome, s.nome) for s in setores],
-            label='Setor',
-            required=True
-        )
+        self.fields['setor'].queryset = Setor.objects.order_by('nome')
+        self.fields['setor'].required = True
         self.fields['setor_descricao'].widget.attrs['readonly'] = True
 
     class Meta:
         model = Multa
         fields = ['setor', 'setor_descricao']
 
-    def clean(self):
-        cleaned_data = super().clean()
-        setor_nome = cleaned_data.get('setor')
-        cleaned_data['setor_descricao'] = self.setor_map.get(setor_nome, '')
-        return cleaned_data
+    def save(self, commit=True):
+        multa = super().save(commit=False)
+        multa.congelar_setor()
+        if commit:
+            multa.save()
+        return multa
 
 class MultaForm(forms.ModelForm):
     class Meta:
@@ -99,7 +101,6 @@ class MultaForm(forms.ModelForm):
             'auto_infracao',
             'veiculo',
             'setor',
-            'setor_descricao',
             'motorista',
             'infracao',
             'data_hora_infracao',
@@ -123,9 +124,14 @@ class MultaForm(forms.ModelForm):
             ),
             'status_multa': forms.Select(attrs={'class': 'form-select'}),
             'status_pagamento': forms.Select(attrs={'class': 'form-select'}),
+            # O template usa modais com busca no endpoint de autocomplete
+            'veiculo': AutocompleteSelect('veiculo'),
+            'motorista': AutocompleteSelect('motorista'),
+            'infracao': AutocompleteSelect('infracao'),
         }
         help_texts = {
             'setor': "Será preenchido automaticamente com o setor do veículo, mas pode ser ajustado.",
+            'motorista': "Se ficar vazio, é preenchido com o motorista vinculado ao veículo na data e hora da infração.",
             'documento_recebido': "Obrigatório se o status da multa for 'Recebido'.",
             'comprovante_pagamento': "Obrigatório se o status do pagamento for 'Pago'.",
             'notificacao_infracao': "É obrigatório informar a notificação ao criar a multa.",
@@ -133,12 +139,27 @@ class MultaForm(forms.ModelForm):
 
     def clean(self):
         cleaned_data = super().clean()
+
+        # Auto único por órgão autuador. A coluna normalizada não está no
+        # formulário: o full_clean não checa a constraint
+        chave = so_alfanumericos(cleaned_data.get("auto_infracao"))
+        orgao = cleaned_data.get("orgao_autuador")
+        repetida = Multa.objects.filter(auto_infracao_busca=chave, orgao_autuador=orgao).exclude(pk=self.instance.pk)
+        if chave and orgao and repetida.exists():
+            self.add_error('auto_infracao', "Já existe uma multa deste órgão autuador com este auto de infração.")
+
         status_multa = cleaned_data.get("status_multa")
         status_pagamento = cleaned_data.get("status_pagamento")
         documento_recebido = cleaned_data.get("documento_recebido")
         comprovante_pagamento = cleaned_data.get("comprovante_pagamento")
         notificacao = cleaned_data.get("notificacao_infracao")
 
+        # Sem motorista informado: quem respondia pelo veículo no momento da infração
+        veiculo = cleaned_data.get("veiculo")
+        data_hora = cleaned_data.get("data_hora_infracao")
+        if not cleaned_data.get("motorista") and veiculo and data_hora:
+            cleaned_data["motorista"] = responsavel(veiculo.pk, data_hora)
+
         # Se estiver criando (sem pk ainda) e não tiver notificação
         if not self.instance.pk and not notificacao:
             self.add_error('notificacao_infracao', "É obrigatório informar a notificação ao criar a multa.")
@@ -228,8 +249,8 @@ class AbastecimentoForm(forms.ModelForm):
             'observacao': forms.Textarea(
                 attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Observações (opcional)'}
             ),
-            'veiculo': forms.Select(attrs={'class': 'form-control'}),
-            'abastecido_por': forms.Select(attrs={'class': 'form-control'}),
+            'veiculo': AutocompleteSelect('veiculo', attrs={'class': 'form-control'}),
+            'abastecido_por': AutocompleteSelect('motorista', attrs={'class': 'form-control'}),
             'tipo_combustivel': forms.Select(attrs={'class': 'form-control'}),
         }
 
@@ -245,3 +266,40 @@ class ContaPagamentoForm(forms.ModelForm):
             'favorecido': forms.TextInput(attrs={'class': 'form-control'}),
             'cnpj': forms.TextInput(attrs={'class': 'form-control'}),
         }
+
+
+class FiltroLogsForm(forms.Form):
+    """Filtros do feed de auditoria (logs_todos)."""
+    modelo = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Todos os modelos')] + [(chave, rotulo) for chave, (_, rotulo) in MODELOS_AUDITADOS.items()],
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    usuario = forms.ModelChoiceField(
+        required=False,
+        queryset=User.objects.order_by('username'),
+        empty_label='Todos os usuários',
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    tipo = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Todas as ações')] + list(TIPOS_AUDITORIA.items()),
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    data_inicio = forms.DateField(
+        required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'})
+    )
+    data_fim = forms.DateField(
+        required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'})
+    )
+    arquivo = forms.ChoiceField(
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Meses já retirados do banco (controle/retencao.py), consultados nos arquivos
+        self.fields['arquivo'].choices = [('', 'Histórico no banco')] + [
+            (mes, f"Arquivo {mes[5:]}/{mes[:4]}") for mes in meses_arquivados()
+        ]
@@ -0,0 +1,306 @@
+"""
+Histórico enxuto sobre o django-simple-history.
+
+O HistoricalRecords padrão grava uma cópia completa do objeto a cada
+save(), mesmo quando nada mudou. HistoricoEnxuto muda isso:
+
+- save() sem nenhum campo alterado (fora os auto_now) não gera registro;
+- criação, exclusão e a cada CHECKPOINT alterações gravam a cópia completa
+  na tabela Historical* (checkpoint), como antes;
+- as alterações intermediárias vão para AlteracaoHistorico só com os
+  campos alterados (JSON).
+
+Qualquer versão passada é reconstruída aplicando os deltas sobre o
+checkpoint anterior (estado_em, versoes).
+"""
+import json
+
+from django.apps import apps
+from django.db import transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+
+# Alterações entre duas cópias completas
+CHECKPOINT = 20
+
+# Model -> HistoricoEnxuto (para comandos e medições)
+REGISTROS = {}
+
+
+def _alteracoes():
+    return apps.get_model('controle', 'AlteracaoHistorico')
+
+
+def serializar(campo, valor):
+    """Valor em formato JSON (datas em ISO, Decimal como texto, arquivo pelo nome)."""
+    if valor is None:
+        return None
+    return json.loads(json.dumps(campo.get_prep_value(valor), cls=DjangoJSONEncoder))
+
+
+def iguais(campo, a, b):
+    """Compara dois valores do campo como ficariam gravados no histórico."""
+    if a is None or b is None:
+        return a is None and b is None
+    return campo.to_python(serializar(campo, a)) == campo.to_python(serializar(campo, b))
+
+
+def campos_rastreados(model):
+    """Campos copiados para o histórico (os mesmos do simple_history)."""
+    return model.history.model.tracked_fields
+
+
+def _so_automaticos(alterados, campos):
+    """True se só mudaram campos auto_now (ex.: updated_at), ou seja, nada de fato."""
+    automaticos = {campo.attname for campo in campos if getattr(campo, 'auto_now', False)}
+    return set(alterados) <= automaticos
+
+
+def estado_checkpoint(registro, campos):
+    """{attname: valor} dos campos rastreados de um registro completo do histórico."""
+    return {campo.attname: getattr(registro, campo.attname) for campo in campos}
+
+
+def aplicar_delta(estado, delta, campos_por_nome):
+    """Aplica sobre o estado os campos de um delta (AlteracaoHistorico), já convertidos."""
+    for nome, valor in delta.campos.items():
+        campo = campos_por_nome.get(nome)
+        if campo is not None:
+            estado[nome] = None if valor is None else campo.to_python(valor)
+
+
+class HistoricoEnxuto(HistoricalRecords):
+    """
+    HistoricalRecords que ignora saves sem alteração e guarda as
+    alterações intermediárias como delta (ver docstring do módulo).
+    """
+
+    def __init__(self, *args, checkpoint=CHECKPOINT, **kwargs):
+        self.checkpoint = checkpoint
+        super().__init__(*args, **kwargs)
+
+    def contribute_to_class(self, cls, name):
+        super().contribute_to_class(cls, name)
+        REGISTROS[cls] = self
+
+    def create_historical_record(self, instance, history_type, using=None):
+        if history_type != '~':
+            return super().create_historical_record(instance, history_type, using)
+
+        manager = getattr(instance, self.manager_name)
+        ultimo = manager.order_by('-history_date', '-history_id').first()
+        if ultimo is None:
+            # Objeto sem histórico anterior: começa com uma cópia completa
+            return super().create_historical_record(instance, history_type, using)
+
+        campos = self.fields_included(instance)
+        deltas = list(_alteracoes().objects.filter(
+            tabela=instance._meta.model_name,
+            objeto_id=instance.pk,
+            history_date__gte=ultimo.history_date,
+        ).order_by('history_date', 'id'))
+
+        anterior = estado_checkpoint(ultimo, campos)
+        por_nome = {campo.attname: campo for campo in campos}
+        for delta in deltas:
+            aplicar_delta(anterior, delta, por_nome)
+
+        alterados = {
+            campo.attname: serializar(campo, getattr(instance, campo.attname))
+            for campo in campos
+            if not iguais(campo, getattr(instance, campo.attname), anterior.get(campo.attname))
+        }
+        if _so_automaticos(alterados, campos):
+            return None
+        if len(deltas) + 1 >= self.checkpoint:
+            return super().create_historical_record(instance, history_type, using)
+
+        _alteracoes().objects.using(using).create(
+            tabela=instance._meta.model_name,
+            objeto_id=instance.pk,
+            history_date=getattr(instance, '_history_date', timezone.now()),
+            history_type='~',
+            history_user=self.get_history_user(instance),
+            history_change_reason=self.get_change_reason_for_object(instance, history_type, using),
+            campos=alterados,
+        )
+        return None
+
+
+def registrar_alteracoes(model, alteracoes, usuario=None, motivo=None):
+    """
+    Deltas em lote para alterações feitas sem save() (bulk_update):
+    {objeto_id: {attname: novo valor}}. Objetos sem nenhuma cópia completa
+    ficam de fora, já que o delta não teria base.
+    """
+    campos = {campo.attname: campo for campo in model._meta.concrete_fields}
+    com_base = set(
+        model.history.filter(id__in=list(alteracoes)).order_by().values_list('id', flat=True).distinct()
+    )
+    agora = timezone.now()
+    _alteracoes().objects.bulk_create([
+        _alteracoes()(
+            tabela=model._meta.model_name,
+            objeto_id=objeto_id,
+            history_date=agora,
+            history_type='~',
+            history_user=usuario,
+            history_change_reason=motivo,
+            campos={nome: serializar(campos[nome], valor) for nome, valor in valores.items()},
+        )
+        for objeto_id, valores in alteracoes.items() if objeto_id in com_base
+    ])
+
+
+# ==================================================
+# ============== RECONSTRUÇÃO ======================
+# ==================================================
+
+def versoes(model, objeto_id):
+    """
+    Todas as versões do objeto em ordem cronológica, como dicionários:
+    data, tipo, usuario_id, motivo, estado ({attname: valor}) e alterados
+    (attnames que mudaram em relação à versão anterior).
+    """
+    campos = campos_rastreados(model)
+    por_nome = {campo.attname: campo for campo in campos}
+
+    checkpoints = [
+        (registro.history_date, 0, registro.history_id, registro)
+        for registro in model.history.filter(id=objeto_id)
+    ]
+    deltas = [
+        (delta.history_date, 1, delta.id, delta)
+        for delta in _alteracoes().objects.filter(tabela=model._meta.model_name, objeto_id=objeto_id)
+    ]
+
+    estado = None
+    for _, origem, _, registro in sorted(checkpoints + deltas, key=lambda item: item[:3]):
+        if origem == 0:
+            novo = estado_checkpoint(registro, campos)
+            alterados = set(novo) if estado is None else {
+                nome for nome, campo in por_nome.items() if not iguais(campo, novo[nome], estado.get(nome))
+            }
+            estado = novo
+            usuario_id = registro.history_user_id
+        else:
+            if estado is None:
+                continue
+            estado = dict(estado)
+            aplicar_delta(estado, registro, por_nome)
+            alterados = set(registro.campos)
+            usuario_id = registro.history_user_id
+        yield {
+            'data': registro.history_date,
+            'tipo': registro.history_type,
+            'usuario_id': usuario_id,
+            'motivo': registro.history_change_reason,
+            'estado': estado,
+            'alterados': alterados,
+        }
+
+
+def estado_em(model, objeto_id, quando):
+    """Campos do objeto como estavam no instante informado (None se não existia)."""
+    campos = campos_rastreados(model)
+    checkpoint = model.history.filter(id=objeto_id, history_date__lte=quando).order_by(
+        '-history_date', '-history_id'
+    ).first()
+    if checkpoint is None or checkpoint.history_type == '-':
+        return None
+    estado = estado_checkpoint(checkpoint, campos)
+    por_nome = {campo.attname: campo for campo in campos}
+    deltas = _alteracoes().objects.filter(
+        tabela=model._meta.model_name,
+        objeto_id=objeto_id,
+        history_date__gte=checkpoint.history_date,
+        history_date__lte=quando,
+    ).order_by('history_date', 'id')
+    for delta in deltas:
+        aplicar_delta(estado, delta, por_nome)
+    return estado
+
+
+def reconstruir(model, objeto_id, quando):
+    """Instância (não salva) do objeto como estava no instante informado."""
+    estado = estado_em(model, objeto_id, quando)
+    return None if estado is None else model(**estado)
+
+
+# ==================================================
+# ======= CONVERSÃO DO HISTÓRICO EXISTENTE =========
+# ==================================================
+
+def _tamanho(valores):
+    return len(json.dumps(valores, cls=DjangoJSONEncoder))
+
+
+def compactar(model, checkpoint=CHECKPOINT, tamanho_lote=500, simular=False):
+    """
+    Converte o histórico completo de um model para o formato enxuto:
+    remove registros '~' sem alteração e troca os intermediários por deltas,
+    mantendo criação, exclusão e um checkpoint a cada `checkpoint` alterações.
+    Processa tamanho_lote objetos por transação. Devolve um dicionário com
+    as contagens e o tamanho estimado (JSON) antes e depois.
+    """
+    Alteracao = _alteracoes()
+    campos = campos_rastreados(model)
+    por_nome = {campo.attname: campo for campo in campos}
+    tabela = model._meta.model_name
+    totais = {'registros': 0, 'sem_alteracao': 0, 'deltas': 0, 'bytes_antes': 0, 'bytes_depois': 0}
+
+    ids = list(model.history.order_by().values_list('id', flat=True).distinct().order_by('id'))
+    for inicio in range(0, len(ids), tamanho_lote):
+        lote = ids[inicio:inicio + tamanho_lote]
+        remover, novos = [], []
+        registros = model.history.filter(id__in=lote).order_by('id', 'history_date', 'history_id')
+
+        atual_id, estado, desde_checkpoint = None, None, 0
+        for registro in registros.iterator(chunk_size=2000):
+            valores = estado_checkpoint(registro, campos)
+            tamanho = _tamanho({nome: serializar(por_nome[nome], v) for nome, v in valores.items()})
+            totais['registros'] += 1
+            totais['bytes_antes'] += tamanho
+
+            if registro.id != atual_id:
+                atual_id, estado, desde_checkpoint = registro.id, None, 0
+            if estado is None or registro.history_type != '~':
+                estado, desde_checkpoint = valores, 0
+                totais['bytes_depois'] += tamanho
+                continue
+
+            alterados = {
+                nome: serializar(campo, valores[nome])
+                for nome, campo in por_nome.items()
+                if not iguais(campo, valores[nome], estado.get(nome))
+            }
+            estado = valores
+            if _so_automaticos(alterados, campos):
+                totais['sem_alteracao'] += 1
+                remover.append(registro.history_id)
+                continue
+            desde_checkpoint += 1
+            if desde_checkpoint >= checkpoint:
+                desde_checkpoint = 0
+                totais['bytes_depois'] += tamanho
+                continue
+            totais['deltas'] += 1
+            totais['bytes_depois'] += _tamanho(alterados)
+            remover.append(registro.history_id)
+            novos.append(Alteracao(
+                tabela=tabela,
+                objeto_id=registro.id,
+                history_date=registro.history_date,
+                history_type='~',
+                history_user_id=registro.history_user_id,
+                history_change_reason=registro.history_change_reason,
+                campos=alterados,
+            ))
+
+        if not simular:
+            with transaction.atomic():
+                Alteracao.objects.bulk_create(novos, batch_size=1000)
+                for i in range(0, len(remover), 1000):
+                    model.history.filter(history_id__in=remover[i:i + 1000]).delete()
+    return totais
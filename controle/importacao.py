@@ -0,0 +1,567 @@
+"""
+Importação em lote de arquivos externos (CSV/XLSX).
+
+Os arquivos são lidos em streaming e gravados em lotes com bulk_create,
+sem passar pelo save() de cada registro. Placas, infrações e setores são
+resolvidos por dicionários carregados uma vez por importação.
+"""
+import csv
+import hashlib
+import io
+import os
+import unicodedata
+from functools import lru_cache
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .busca import indexar, normalizar_texto, preencher, so_alfanumericos
+from .models import Abastecimento, InfracaoTransito, Motorista, Multa, Setor, Veiculo
+
+
+TAMANHO_LOTE = 1000
+
+
+# ==================================================
+# ============ LEITURA DOS ARQUIVOS ================
+# ==================================================
+
+def normalizar_cabecalho(valor):
+    """'Valor Total (R$)' -> 'valor_total_r'"""
+    texto = unicodedata.normalize('NFKD', str(valor or '')).encode('ascii', 'ignore').decode()
+    texto = ''.join(c if c.isalnum() else '_' for c in texto.strip().lower())
+    return '_'.join(parte for parte in texto.split('_') if parte)
+
+
+def normalizar_placa(valor):
+    return ''.join(c for c in str(valor or '').upper() if c.isalnum())
+
+
+def _linhas_csv(arquivo):
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    amostra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t')
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.reader(texto, dialeto)
+    try:
+        yield from leitor
+    finally:
+        texto.detach()
+
+
+def _linhas_xlsx(arquivo):
+    planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        yield from planilha.active.iter_rows(values_only=True)
+    finally:
+        planilha.close()
+
+
+def ler_linhas(arquivo, nome):
+    """
+    Gera (numero_linha, dict) para cada linha do arquivo, com as chaves
+    do cabeçalho normalizadas. Linhas totalmente vazias são ignoradas.
+    """
+    extensao = os.path.splitext(nome)[1].lower()
+    linhas = _linhas_xlsx(arquivo) if extensao in ('.xlsx', '.xlsm') else _linhas_csv(arquivo)
+
+    cabecalho = None
+    for numero, valores in enumerate(linhas, start=1):
+        if cabecalho is None:
+            cabecalho = [normalizar_cabecalho(v) for v in valores]
+            continue
+        if not any(v not in (None, '') for v in valores):
+            continue
+        yield numero, dict(zip(cabecalho, valores))
+
+
+def em_lotes(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _primeiro(linha, *nomes):
+    for nome in nomes:
+        valor = linha.get(nome)
+        if valor not in (None, ''):
+            return valor.strip() if isinstance(valor, str) else valor
+    return None
+
+
+def converter_data(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor or '').strip()[:10]
+    for formato in ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"data inválida: {valor!r}")
+
+
+def converter_decimal(valor):
+    if isinstance(valor, (int, float, Decimal)):
+        return Decimal(str(valor))
+    texto = str(valor or '').replace('R$', '').replace(' ', '')
+    if ',' in texto:
+        # Formato brasileiro: 1.234,56
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"número inválido: {valor!r}")
+
+
+# Os arquivos repetem poucas datas e horas em milhares de linhas: as
+# conversões de texto ficam em cache (strptime é a parte cara)
+@lru_cache(maxsize=4096)
+def _hora_texto(texto):
+    for formato in ('%H:%M:%S', '%H:%M', '%Hh%M'):
+        try:
+            return datetime.strptime(texto, formato).time()
+        except ValueError:
+            continue
+    raise ValueError(f"hora inválida: {texto!r}")
+
+
+@lru_cache(maxsize=4096)
+def _data_hora_texto(texto):
+    if len(texto) > 10:
+        for formato in ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                        '%Y-%m-%d %H:%M'):
+            try:
+                return datetime.strptime(texto, formato)
+            except ValueError:
+                continue
+    return datetime.combine(converter_data(texto), time())
+
+
+def converter_data_hora(valor, hora=None):
+    """Data e hora (com fuso, se USE_TZ); a hora pode vir numa coluna separada."""
+    if isinstance(valor, datetime):
+        momento = valor
+    elif isinstance(valor, date):
+        momento = datetime.combine(valor, time())
+    else:
+        momento = _data_hora_texto(str(valor or '').strip())
+    if hora not in (None, ''):
+        if isinstance(hora, datetime):
+            hora = hora.time()
+        momento = datetime.combine(momento.date(), hora if isinstance(hora, time) else _hora_texto(str(hora).strip()))
+    if settings.USE_TZ and timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+
+class ResultadoImportacao:
+    """Resumo de uma importação: quantidades e linhas rejeitadas com o motivo."""
+
+    def __init__(self):
+        self.importados = 0
+        self.ja_importados = 0
+        self.rejeitados = []
+        # Primeiras linhas aceitas, para a pré-visualização (simular=True)
+        self.amostra = []
+
+    def rejeitar(self, numero, linha, motivo):
+        self.rejeitados.append((numero, linha, motivo))
+
+    def escrever_rejeitados(self, destino):
+        """Grava as linhas rejeitadas em CSV (linha, motivo e colunas originais)."""
+        colunas = []
+        for _, linha, _ in self.rejeitados:
+            colunas.extend(c for c in linha if c not in colunas)
+        escritor = csv.writer(destino, delimiter=';')
+        escritor.writerow(['linha', 'motivo'] + colunas)
+        for numero, linha, motivo in self.rejeitados:
+            escritor.writerow([numero, motivo] + [linha.get(c, '') for c in colunas])
+
+    def __str__(self):
+        return (
+            f"{self.importados} importados, {self.ja_importados} já existentes, "
+            f"{len(self.rejeitados)} rejeitados"
+        )
+
+
+# ==================================================
+# ======== ABASTECIMENTOS (CARTÃO COMBUSTÍVEL) =====
+# ==================================================
+
+# Aceita o código ('G') ou o nome do combustível como aparece nos arquivos
+COMBUSTIVEIS = {normalizar_cabecalho(nome): codigo for codigo, nome in Abastecimento.TIPO_COMBUSTIVEL_CHOICES}
+COMBUSTIVEIS.update({codigo.lower(): codigo for codigo, _ in Abastecimento.TIPO_COMBUSTIVEL_CHOICES})
+COMBUSTIVEIS.update({
+    'etanol': 'A',
+    'gasolina_comum': 'G',
+    'gasolina_aditivada': 'G',
+    'diesel_s10': 'D',
+    'diesel_s500': 'D',
+})
+
+
+def _chave_abastecimento(linha, placa, data, hodometro, litros, valor_total, posto):
+    transacao = _primeiro(linha, 'transacao', 'id_transacao', 'nsu', 'codigo_transacao')
+    if transacao:
+        return f"cartao:{transacao}"[:64]
+    conteudo = '|'.join(str(v) for v in (placa, data, hodometro, litros, valor_total, posto or ''))
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def _montar_abastecimento(linha, veiculos):
+    """Valida uma linha do arquivo e devolve o Abastecimento (ainda não salvo)."""
+    placa = normalizar_placa(_primeiro(linha, 'placa'))
+    if not placa:
+        raise ValueError("placa não informada")
+    veiculo_id = veiculos.get(placa)
+    if veiculo_id is None:
+        raise ValueError(f"placa {placa} não cadastrada")
+
+    data = converter_data(_primeiro(linha, 'data', 'data_abastecimento', 'data_transacao'))
+    hodometro = int(converter_decimal(_primeiro(linha, 'hodometro', 'km', 'quilometragem')))
+    if hodometro < 0:
+        raise ValueError("hodômetro negativo")
+    litros = converter_decimal(_primeiro(linha, 'litros', 'quantidade', 'qtd_litros'))
+    valor_total = converter_decimal(_primeiro(linha, 'valor_total', 'valor', 'valor_total_r'))
+    if litros <= 0 or valor_total < 0:
+        raise ValueError("litros/valor inválidos")
+
+    combustivel = normalizar_cabecalho(_primeiro(linha, 'tipo_combustivel', 'combustivel', 'produto') or 'F')
+    tipo_combustivel = COMBUSTIVEIS.get(combustivel)
+    if tipo_combustivel is None:
+        raise ValueError(f"combustível desconhecido: {combustivel}")
+
+    posto = _primeiro(linha, 'posto', 'estabelecimento')
+    posto = str(posto)[:100] if posto else None
+
+    return Abastecimento(
+        veiculo_id=veiculo_id,
+        data=data,
+        hodometro=hodometro,
+        litros=litros,
+        valor_total=valor_total,
+        valor_litro=round(valor_total / litros, 2),
+        posto=posto,
+        tipo_combustivel=tipo_combustivel,
+        observacao="Importado do cartão combustível",
+        chave_importacao=_chave_abastecimento(linha, placa, data, hodometro, litros, valor_total, posto),
+    )
+
+
+def importar_abastecimentos(arquivo, nome, tamanho_lote=TAMANHO_LOTE):
+    """
+    Importa um arquivo de transações do cartão combustível.
+
+    Colunas reconhecidas (cabeçalho sem acento/maiúsculas): placa, data,
+    hodometro/km, litros, valor_total/valor, tipo_combustivel/combustivel,
+    posto e, se houver, transacao/nsu para identificar cada transação.
+
+    Pode ser executada de novo sobre o mesmo arquivo: transações já
+    importadas são contadas em ja_importados e não são gravadas de novo.
+    Cada lote grava os abastecimentos, avança o hodômetro e atualiza o
+    consolidado mensal na mesma transação, então uma importação
+    interrompida não deixa lotes gravados sem os seus efeitos.
+    """
+    from .cache_modelos import invalidar, invalidar_pks
+
+    veiculos = {normalizar_placa(placa): pk for placa, pk in Veiculo.objects.values_list('placa', 'pk')}
+    resultado = ResultadoImportacao()
+    chaves_arquivo = set()
+    maior_hodometro = {}
+
+    for lote in em_lotes(ler_linhas(arquivo, nome), tamanho_lote):
+        novos = {}
+        for numero, linha in lote:
+            try:
+                abastecimento = _montar_abastecimento(linha, veiculos)
+            except (ValueError, ArithmeticError) as e:
+                resultado.rejeitar(numero, linha, str(e))
+                continue
+            if abastecimento.chave_importacao in chaves_arquivo:
+                resultado.rejeitar(numero, linha, "transação repetida no arquivo")
+                continue
+            chaves_arquivo.add(abastecimento.chave_importacao)
+            novos[abastecimento.chave_importacao] = abastecimento
+
+        with transaction.atomic():
+            existentes = set(
+                Abastecimento.objects.filter(chave_importacao__in=novos).values_list('chave_importacao', flat=True)
+            )
+            gravar = [a for chave, a in novos.items() if chave not in existentes]
+            Abastecimento.objects.bulk_create(gravar, batch_size=tamanho_lote, ignore_conflicts=True)
+            # ignore_conflicts descarta em silêncio o que outra importação
+            # gravou no meio: conta o que de fato entrou
+            inseridos = Abastecimento.objects.filter(chave_importacao__in=novos).count() - len(existentes)
+            # bulk_create não dispara signals: documentos da busca global em lote
+            indexar(Abastecimento.objects.filter(chave_importacao__in=[a.chave_importacao for a in gravar]))
+            for veiculo_id, hodometro in _aplicar_abastecimentos(gravar).items():
+                maior_hodometro[veiculo_id] = max(maior_hodometro.get(veiculo_id, 0), hodometro)
+        resultado.importados += inseridos
+        resultado.ja_importados += len(novos) - inseridos
+
+    # bulk_create e o UPDATE do hodômetro não disparam os signals do cache
+    if resultado.importados:
+        invalidar('abastecimento')
+    invalidar_pks('veiculo', maior_hodometro)
+    return resultado
+
+
+def _aplicar_abastecimentos(abastecimentos):
+    """
+    Hodômetro e consolidado mensal de abastecimentos gravados com
+    bulk_create. Devolve {veiculo_id: maior hodômetro} do lote.
+    """
+    from .consumo import atualizar_consumo_mensal
+
+    maior_hodometro = {}
+    ultima_posicao = {}
+    for a in abastecimentos:
+        maior_hodometro[a.veiculo_id] = max(maior_hodometro.get(a.veiculo_id, 0), a.hodometro)
+        mes = (a.veiculo_id, a.data.year, a.data.month)
+        posicao = (a.veiculo_id, a.data, a.hodometro)
+        ultima_posicao[mes] = max(ultima_posicao.get(mes, posicao), posicao)
+    # Um UPDATE por veículo, só na coluna do hodômetro (sem histórico), na
+    # mesma ordem de pk em que atualizar_consumo_mensal trava os veículos
+    for veiculo_id, hodometro in sorted(maior_hodometro.items()):
+        Veiculo.avancar_hodometro(veiculo_id, hodometro)
+    # A última posição de cada mês basta: o abastecimento seguinte às
+    # anteriores está no mesmo mês
+    atualizar_consumo_mensal(ultima_posicao.values())
+    return maior_hodometro
+
+
+# ==================================================
+# ========= MULTAS (ÓRGÃOS AUTUADORES) =============
+# ==================================================
+
+TAMANHO_AMOSTRA = 20
+
+
+class _Catalogos:
+    """Placas, infrações e setores em memória, carregados uma vez por importação."""
+
+    def __init__(self):
+        self.veiculos = {
+            normalizar_placa(placa): (pk, setor_id)
+            for placa, pk, setor_id in Veiculo.objects.values_list('placa', 'pk', 'setor_id')
+        }
+        self.setores = {
+            pk: (nome, descricao or '') for pk, nome, descricao in Setor.objects.values_list('pk', 'nome', 'descricao')
+        }
+        self.infracoes = {}
+        self.descricoes_infracoes = {}
+        self.pontos_infracoes = {}
+        infracoes = InfracaoTransito.objects.values_list('pk', 'descricao', 'descricao_busca', 'pontos')
+        for pk, descricao, descricao_busca, pontos in infracoes:
+            chave = descricao_busca or normalizar_texto(descricao)
+            # Descrição repetida no catálogo: não dá para escolher, a linha é rejeitada
+            self.infracoes[chave] = None if chave in self.infracoes else pk
+            self.descricoes_infracoes[pk] = descricao
+            self.pontos_infracoes[pk] = pontos
+
+
+def _montar_multa(linha, catalogos, orgao_autuador):
+    """Valida uma linha do arquivo e devolve a Multa (ainda não salva)."""
+    auto_infracao = _primeiro(linha, 'auto_infracao', 'auto', 'numero_auto', 'ait', 'auto_de_infracao')
+    if not auto_infracao or not so_alfanumericos(auto_infracao):
+        raise ValueError("auto de infração não informado")
+    auto_infracao = str(auto_infracao)
+
+    placa = normalizar_placa(_primeiro(linha, 'placa'))
+    if not placa:
+        raise ValueError("placa não informada")
+    if placa not in catalogos.veiculos:
+        raise ValueError(f"placa {placa} não cadastrada")
+    veiculo_id, setor_id = catalogos.veiculos[placa]
+
+    data_hora = converter_data_hora(
+        _primeiro(linha, 'data_hora_infracao', 'data_hora', 'data_infracao', 'data'),
+        _primeiro(linha, 'hora', 'hora_infracao'),
+    )
+
+    infracao_id = None
+    descricao = _primeiro(linha, 'infracao', 'descricao_infracao', 'infracao_descricao', 'descricao')
+    if descricao:
+        chave = normalizar_texto(descricao)
+        if chave not in catalogos.infracoes:
+            raise ValueError(f"infração não cadastrada: {descricao}")
+        infracao_id = catalogos.infracoes[chave]
+        if infracao_id is None:
+            raise ValueError(f"infração com descrição repetida no cadastro: {descricao}")
+
+    local = _primeiro(linha, 'local', 'local_infracao', 'endereco')
+    orgao = _primeiro(linha, 'orgao_autuador', 'orgao', 'autuador') or orgao_autuador
+    if not local or not orgao:
+        raise ValueError("local e órgão autuador são obrigatórios")
+    if len(str(local)) > 200 or len(str(orgao)) > 100:
+        raise ValueError("local ou órgão autuador longo demais")
+
+    # Sem prazo no arquivo a linha volta: inventar um vencimento daria multa vencida no dia
+    prazo = _primeiro(linha, 'prazo_pagamento', 'prazo', 'vencimento', 'data_vencimento')
+    if not prazo:
+        raise ValueError("prazo de pagamento não informado")
+
+    setor_nome, setor_descricao = catalogos.setores.get(setor_id, (None, ''))
+    multa = Multa(
+        auto_infracao=auto_infracao,
+        veiculo_id=veiculo_id,
+        setor_id=setor_id,
+        setor_nome=setor_nome,
+        setor_descricao=setor_descricao[:255],
+        infracao_id=infracao_id,
+        data_hora_infracao=data_hora,
+        local=str(local),
+        orgao_autuador=str(orgao).strip(),
+        prazo_pagamento=converter_data(prazo),
+    )
+    preencher(multa)
+    return multa
+
+
+def importar_multas(arquivo, nome, orgao_autuador=None, usuario=None, simular=False, tamanho_lote=TAMANHO_LOTE):
+    """
+    Importa um arquivo de autuações (DETRAN, trânsito municipal).
+
+    Colunas reconhecidas (cabeçalho sem acento/maiúsculas): auto_infracao/ait,
+    placa, data_hora_infracao/data (e hora, se separada), infracao (descrição
+    do catálogo), local, orgao_autuador (ou o padrão informado) e
+    prazo_pagamento/vencimento (obrigatório).
+
+    O auto é único por órgão autuador: autos já cadastrados para o mesmo
+    órgão (pela coluna indexada auto_infracao_busca) ou repetidos no arquivo
+    não são gravados de novo. O motorista vem da
+    linha do tempo de vínculos e o setor, do veículo. Com simular=True só
+    valida e preenche a amostra, sem gravar nada.
+    """
+    from .cache_modelos import invalidar, invalidar_pks
+    from .utils import CHAVE_SETORES_MULTAS
+    from .vinculos import LinhaDoTempo
+
+    catalogos = _Catalogos()
+    resultado = ResultadoImportacao()
+    chaves_arquivo = set()
+    veiculos, motoristas = set(), set()
+    motivo = f"Importada do arquivo {os.path.basename(nome)}"
+
+    for lote in em_lotes(ler_linhas(arquivo, nome), tamanho_lote):
+        novas = {}
+        for numero, linha in lote:
+            try:
+                multa = _montar_multa(linha, catalogos, orgao_autuador)
+            except (ValueError, ArithmeticError) as e:
+                resultado.rejeitar(numero, linha, str(e))
+                continue
+            chave = _chave_multa(multa)
+            if chave in chaves_arquivo:
+                resultado.rejeitar(numero, linha, "auto de infração repetido no arquivo")
+                continue
+            chaves_arquivo.add(chave)
+            novas[chave] = (numero, linha, multa)
+
+        existentes = _cadastradas(novas)
+        resultado.ja_importados += len(existentes)
+        gravar = [item for chave, item in novas.items() if chave not in existentes]
+
+        # Motorista responsável na hora da infração: uma consulta de vínculos
+        # por lote e uma varredura por veículo
+        instantes = {}
+        for _, _, multa in gravar:
+            instantes.setdefault(multa.veiculo_id, []).append(multa.data_hora_infracao)
+        linha_do_tempo = LinhaDoTempo(instantes)
+        responsaveis = {
+            veiculo_id: linha_do_tempo.responsaveis(veiculo_id, datas) for veiculo_id, datas in instantes.items()
+        }
+        for _, _, multa in gravar:
+            multa.motorista_id = responsaveis[multa.veiculo_id][multa.data_hora_infracao]
+
+        for numero, linha, multa in gravar[:TAMANHO_AMOSTRA - len(resultado.amostra)]:
+            resultado.amostra.append({
+                'linha': numero,
+                'auto_infracao': multa.auto_infracao,
+                'placa': normalizar_placa(_primeiro(linha, 'placa')),
+                'data_hora_infracao': multa.data_hora_infracao,
+                'infracao': catalogos.descricoes_infracoes.get(multa.infracao_id, ''),
+                'setor': multa.setor_nome or '',
+                'motorista': multa.motorista_id,
+            })
+        resultado.importados += len(gravar)
+        if simular or not gravar:
+            continue
+
+        multas = [multa for _, _, multa in gravar]
+        try:
+            _gravar_multas(multas, catalogos, usuario, motivo, tamanho_lote)
+        except IntegrityError:
+            # Outra importação gravou algum destes autos depois da checagem
+            # acima (constraint multa_auto_infracao_unico): o lote voltou
+            # inteiro e é gravado de novo sem eles
+            repetidos = _cadastradas([_chave_multa(multa) for multa in multas])
+            if not repetidos:
+                raise
+            multas = [multa for multa in multas if _chave_multa(multa) not in repetidos]
+            resultado.importados -= len(repetidos)
+            resultado.ja_importados += len(repetidos)
+            for multa in multas:
+                multa.pk = None
+            _gravar_multas(multas, catalogos, usuario, motivo, tamanho_lote)
+        veiculos.update(multa.veiculo_id for multa in multas)
+        motoristas.update(multa.motorista_id for multa in multas if multa.motorista_id)
+
+    nomes = dict(
+        Motorista.objects.filter(pk__in={item['motorista'] for item in resultado.amostra}).values_list('pk', 'nome')
+    )
+    for item in resultado.amostra:
+        item['motorista'] = nomes.get(item['motorista'], '')
+
+    if resultado.importados and not simular:
+        cache.delete(CHAVE_SETORES_MULTAS)
+        invalidar('multa')
+        invalidar_pks('veiculo', veiculos)
+        invalidar_pks('motorista', motoristas)
+    return resultado
+
+
+def _chave_multa(multa):
+    return (multa.orgao_autuador, multa.auto_infracao_busca)
+
+
+def _cadastradas(chaves):
+    """Quais chaves (órgão, auto) já estão no banco, numa consulta pelo índice do auto."""
+    chaves = set(chaves)
+    cadastradas = Multa.objects.filter(auto_infracao_busca__in={auto for _, auto in chaves})
+    return chaves & set(cadastradas.values_list('orgao_autuador', 'auto_infracao_busca'))
+
+
+def _gravar_multas(multas, catalogos, usuario, motivo, tamanho_lote):
+    """Grava um lote de multas novas com histórico, busca e pontos, numa transação."""
+    from .pontuacao import pontuar_novas, somar
+
+    # Pontos na CNH calculados antes de gravar, sem conciliar() depois
+    pontos = pontuar_novas(multas, catalogos.pontos_infracoes)
+    with transaction.atomic():
+        # bulk_create devolve as pks no PostgreSQL (e no SQLite 3.35+)
+        Multa.objects.bulk_create(multas, batch_size=tamanho_lote)
+        # Histórico: uma cópia completa de criação por multa, em lote
+        Multa.history.bulk_history_create(
+            multas, batch_size=tamanho_lote, default_user=usuario, default_change_reason=motivo
+        )
+        # bulk_create não dispara signals: documentos da busca global em lote
+        pks = [multa.pk for multa in multas]
+        indexar(Multa.objects.filter(pk__in=pks))
+        somar(pontos)
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from controle.historico import REGISTROS
+from controle.retencao import TAMANHO_LOTE, arquivar, data_corte, dias_retencao, mover_da_midia
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica a política de retenção do histórico (settings.RETENCAO_HISTORICO): grava os meses "
+        "anteriores ao corte em arquivos .jsonl.gz no storage do histórico e os apaga do banco em lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modelo', help="model_name (ex.: veiculo); padrão: todos")
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help="Linhas apagadas por transação")
+        parser.add_argument('--pausa', type=float, default=0, help="Segundos de espera entre os lotes")
+        parser.add_argument('--simular', action='store_true', help="Só mostra o que seria arquivado")
+
+    def handle(self, *args, **options):
+        if not options['simular']:
+            movidos = mover_da_midia()
+            if movidos:
+                self.stdout.write(f"{movidos} arquivos antigos levados do MEDIA_ROOT para o storage do histórico.")
+
+        models = [m for m in REGISTROS if not options['modelo'] or m._meta.model_name == options['modelo']]
+        for model in models:
+            tabela = model._meta.model_name
+            corte = data_corte(tabela)
+            if corte is None:
+                self.stdout.write(f"{model._meta.verbose_name}: sem retenção configurada.")
+                continue
+
+            inicio = time.perf_counter()
+            totais = arquivar(model, tamanho_lote=options['lote'], pausa=options['pausa'], simular=options['simular'])
+            self.stdout.write(
+                f"{model._meta.verbose_name} (mantém {dias_retencao(tabela)} dias, corte {corte:%d/%m/%Y}): "
+                f"{totais['checkpoints']} cópias completas e {totais['deltas']} deltas em "
+                f"{len(totais['meses'])} meses ({', '.join(totais['meses']) or '-'}); "
+                f"{totais['convertidos']} deltas recentes viraram cópia completa; "
+                f"{time.perf_counter() - inicio:.1f}s"
+            )
+        if options['simular']:
+            self.stdout.write(self.style.WARNING("Simulação: nada foi gravado."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from controle.vinculos import TAMANHO_LOTE, atribuir_motoristas
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche o motorista das multas sem motorista com quem estava vinculado ao veículo "
+        "na data e hora da infração (linha do tempo de VinculoMotorista)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help="Multas por lote")
+        parser.add_argument('--simular', action='store_true', help="Só conta, sem gravar")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        analisadas, atribuidas = atribuir_motoristas(tamanho_lote=options['lote'], simular=options['simular'])
+        self.stdout.write(
+            f"{analisadas} multas sem motorista; {atribuidas} com motorista encontrado "
+            f"({time.perf_counter() - inicio:.1f}s)."
+        )
+        if options['simular']:
+            self.stdout.write(self.style.WARNING("Simulação: nada foi gravado."))
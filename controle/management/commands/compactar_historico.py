@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from controle.historico import CHECKPOINT, REGISTROS, compactar
+
+
+class Command(BaseCommand):
+    help = (
+        "Converte o histórico existente para o formato enxuto: remove registros sem "
+        "alteração e troca alterações intermediárias por deltas (AlteracaoHistorico)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modelo', help="model_name (ex.: veiculo); padrão: todos")
+        parser.add_argument('--checkpoint', type=int, default=CHECKPOINT)
+        parser.add_argument('--lote', type=int, default=500, help="Objetos por transação")
+        parser.add_argument('--simular', action='store_true', help="Só calcula a economia, sem gravar")
+
+    def handle(self, *args, **options):
+        models = [m for m in REGISTROS if not options['modelo'] or m._meta.model_name == options['modelo']]
+        for model in models:
+            tabela = model.history.model._meta.db_table
+            antes = self._tamanho_tabela(tabela)
+            inicio = time.perf_counter()
+            totais = compactar(model, options['checkpoint'], options['lote'], options['simular'])
+            duracao = time.perf_counter() - inicio
+
+            economia = 1 - totais['bytes_depois'] / totais['bytes_antes'] if totais['bytes_antes'] else 0
+            self.stdout.write(
+                f"{model._meta.verbose_name}: {totais['registros']} registros, "
+                f"{totais['sem_alteracao']} sem alteração removidos, {totais['deltas']} convertidos em delta; "
+                f"{totais['bytes_antes'] / 1024:.0f} KB -> {totais['bytes_depois'] / 1024:.0f} KB "
+                f"({economia:.0%} menor) em {duracao:.1f}s"
+            )
+            if antes is not None and not options['simular']:
+                self.stdout.write(
+                    f"  {tabela}: {antes / 1024:.0f} KB -> {self._tamanho_tabela(tabela) / 1024:.0f} KB "
+                    "(o espaço volta ao disco após VACUUM)"
+                )
+        if options['simular']:
+            self.stdout.write(self.style.WARNING("Simulação: nada foi gravado."))
+
+    def _tamanho_tabela(self, tabela):
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_total_relation_size(%s)", [tabela])
+            return cursor.fetchone()[0]
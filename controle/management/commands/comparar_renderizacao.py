@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from weasyprint import HTML
+
+from controle.models import Multa
+from controle.pdfs import html_memorando
+from controle.renderizacao import encerrar_pool, renderizar_varios
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara PDFs por segundo entre a geração inline (HTML().write_pdf() a cada "
+        "memorando) e o pool de workers do renderizacao.py. Não grava nada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantidade', type=int, default=20, help="Memorandos renderizados em cada modo")
+
+    def handle(self, *args, **options):
+        multas = Multa.objects.select_related('veiculo', 'infracao', 'conta_pagamento')[:options['quantidade']]
+        htmls = [html_memorando(multa) for multa in multas]
+        if not htmls:
+            self.stdout.write("Nenhuma multa cadastrada.")
+            return
+
+        inicio = time.perf_counter()
+        for html in htmls:
+            HTML(string=html).write_pdf()
+        inline = time.perf_counter() - inicio
+        self.stdout.write(f"Inline: {len(htmls) / inline:.1f} PDFs/s ({inline:.1f}s)")
+
+        # Primeira chamada sobe os workers; fica fora da medição
+        renderizar_varios(htmls[:1])
+        inicio = time.perf_counter()
+        resultados = renderizar_varios(htmls)
+        pool = time.perf_counter() - inicio
+        falhas = sum(isinstance(r, Exception) for r in resultados)
+        self.stdout.write(f"Pool:   {len(htmls) / pool:.1f} PDFs/s ({pool:.1f}s, {falhas} falhas)")
+        encerrar_pool()
+
+        self.stdout.write(self.style.SUCCESS(f"Ganho: {inline / pool:.1f}x"))
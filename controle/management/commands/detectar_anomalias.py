@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from controle.anomalias import analisar_frota
+from controle.models import AnomaliaAbastecimento
+
+
+class Command(BaseCommand):
+    help = "Analisa todos os abastecimentos da frota e grava as anomalias encontradas para revisão."
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        totais = analisar_frota()
+        duracao = time.perf_counter() - inicio
+
+        nomes = dict(AnomaliaAbastecimento.Tipos.choices)
+        for tipo, quantidade in sorted(totais.items()):
+            self.stdout.write(f"{nomes.get(tipo, tipo)}: {quantidade}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(totais.values())} anomalias encontradas em {duracao:.1f}s."
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from controle import views  # noqa: F401  (registra as views com cache_dependente)
+from controle.cache_modelos import NOMES, estatisticas, zerar_estatisticas
+
+
+class Command(BaseCommand):
+    help = "Acertos e falhas do cache por dependência de models (controle/cache_modelos.py), por view ou trecho."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nome', action='append', default=[], help="Inclui um trecho de template pelo nome")
+        parser.add_argument('--zerar', action='store_true', help="Zera os contadores depois de mostrar")
+
+    def handle(self, *args, **options):
+        NOMES.update(options['nome'])
+        for nome, (acertos, falhas) in estatisticas().items():
+            total = acertos + falhas
+            taxa = f"{acertos / total:.0%}" if total else "-"
+            self.stdout.write(f"{nome}: {acertos} acertos, {falhas} falhas ({taxa})")
+        if options['zerar']:
+            zerar_estatisticas()
+            self.stdout.write(self.style.SUCCESS("Contadores zerados."))
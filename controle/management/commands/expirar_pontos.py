@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from controle.pontuacao import TAMANHO_LOTE, conciliar_todas, expirar, recalcular_totais
+
+
+class Command(BaseCommand):
+    help = (
+        "Tira dos pontos na CNH dos motoristas as multas que passaram de 12 meses "
+        "(rodar diariamente). Com --conciliar-todas, confere multa a multa e refaz os totais."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help="Multas por transação")
+        parser.add_argument('--conciliar-todas', action='store_true', help="Concilia todas as multas, não só as que expiraram")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        if options['conciliar_todas']:
+            total = conciliar_todas(tamanho_lote=options['lote'])
+            recalcular_totais()
+            self.stdout.write(f"{total} multas corrigidas ({time.perf_counter() - inicio:.1f}s).")
+        else:
+            total = expirar(tamanho_lote=options['lote'])
+            self.stdout.write(f"{total} multas saíram da janela de 12 meses ({time.perf_counter() - inicio:.1f}s).")
@@ -0,0 +1,52 @@
+import os
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from controle.exportacao import filtrar_multas, gerar_csv, gerar_xlsx
+from controle.models import Multa
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta multas para .xlsx ou .csv (conforme a extensão do destino) com os filtros "
+        "de listar_multas. Com --medir, informa tempo e pico de memória da exportação."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('destino', help="Arquivo de saída (.xlsx ou .csv)")
+        parser.add_argument('--status_multa')
+        parser.add_argument('--status_pagamento')
+        parser.add_argument('--setor')
+        parser.add_argument('--dominio', default='', help="Prefixo dos links dos documentos")
+        parser.add_argument('--medir', action='store_true', help="Mede tempo e pico de memória")
+
+    def handle(self, *args, **options):
+        multas = filtrar_multas(Multa.objects.all(), options)
+        destino = options['destino']
+
+        if options['medir']:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+
+        if destino.lower().endswith('.csv'):
+            total = -1  # cabeçalho
+            with open(destino, 'w', encoding='utf-8', newline='') as saida:
+                for linha in gerar_csv(multas, options['dominio']):
+                    saida.write(linha)
+                    total += 1
+        else:
+            total = gerar_xlsx(multas, destino, options['dominio'])
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"{total} multas exportadas para {destino}."))
+
+        if options['medir']:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            tamanho = os.path.getsize(destino) / 1024 / 1024
+            self.stdout.write(
+                f"Tempo: {duracao:.1f}s | Pico de memória Python: {pico / 1024 / 1024:.1f} MB | "
+                f"Arquivo: {tamanho:.1f} MB"
+            )
@@ -0,0 +1,63 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from controle.exportacao import filtrar_multas
+from controle.models import Multa
+from controle.pdfs import gerar_memorandos, pdfs_por_setor, unir_pdfs, zip_memorandos
+from controle.renderizacao import encerrar_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera em lote os memorandos das multas (por IDs ou pelos filtros de listar_multas) "
+        "e grava em um diretório um PDF por setor ou um ZIP com um PDF por multa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('saida', help="Diretório de destino")
+        parser.add_argument('--ids', help="IDs separados por vírgula")
+        parser.add_argument('--status_multa')
+        parser.add_argument('--status_pagamento')
+        parser.add_argument('--setor')
+        parser.add_argument('--formato', choices=['setor', 'zip'], default='setor')
+
+    def handle(self, *args, **options):
+        if options['ids']:
+            multas = Multa.objects.filter(pk__in=[int(i) for i in options['ids'].split(',') if i.strip()])
+        else:
+            multas = filtrar_multas(Multa.objects.all(), options)
+        multas = multas.order_by('setor_nome', 'pk')
+        os.makedirs(options['saida'], exist_ok=True)
+
+        inicio = time.perf_counter()
+
+        def progresso(feitos, total):
+            self.stdout.write(f"{feitos}/{total} memorandos ({time.perf_counter() - inicio:.1f}s)")
+
+        try:
+            resultados = gerar_memorandos(multas, progresso)
+        finally:
+            encerrar_pool()
+
+        if options['formato'] == 'zip':
+            destino = os.path.join(options['saida'], 'memorandos.zip')
+            with open(destino, 'wb') as arquivo:
+                for parte in zip_memorandos(resultados):
+                    arquivo.write(parte)
+            self.stdout.write(f"Gravado {destino}")
+        else:
+            for nome, caminhos in pdfs_por_setor(resultados).items():
+                destino = os.path.join(options['saida'], nome)
+                with open(destino, 'wb') as arquivo:
+                    arquivo.write(unir_pdfs(caminhos))
+                self.stdout.write(f"Gravado {destino} ({len(caminhos)} memorandos)")
+
+        falhas = [(multa, erro) for multa, erro in resultados if isinstance(erro, Exception)]
+        for multa, erro in falhas:
+            self.stderr.write(f"Multa {multa.pk}: {erro}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(resultados) - len(falhas)} memorandos gerados, {len(falhas)} falhas, "
+            f"em {time.perf_counter() - inicio:.1f}s."
+        ))
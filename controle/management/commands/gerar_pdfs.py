@@ -0,0 +1,56 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from controle.models import Multa, TermoResponsabilidade
+from controle.pdfs import PASTA_MEMORANDOS, PASTA_TERMOS, caminhos_atuais, pdf_memorando, pdf_termo
+
+
+class Command(BaseCommand):
+    help = (
+        "Pré-gera os PDFs de memorandos e termos de responsabilidade no cache. "
+        "Com --limpar, remove os PDFs gerados que não correspondem mais aos dados atuais."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--somente', choices=['memorandos', 'termos'], help="Gera apenas um dos tipos")
+        parser.add_argument('--limpar', action='store_true', help="Remove PDFs desatualizados")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        falhas = 0
+
+        if options['somente'] != 'termos':
+            multas = Multa.objects.select_related('veiculo', 'infracao', 'conta_pagamento')
+            for multa in multas.iterator():
+                try:
+                    pdf_memorando(multa)
+                except Exception as erro:
+                    falhas += 1
+                    self.stderr.write(f"Multa {multa.pk}: {erro}")
+
+        if options['somente'] != 'memorandos':
+            termos = TermoResponsabilidade.objects.exclude(arquivo='').exclude(arquivo=None)
+            for termo in termos.select_related('veiculo__setor', 'motorista').iterator():
+                try:
+                    pdf_termo(termo)
+                except Exception as erro:
+                    falhas += 1
+                    self.stderr.write(f"Termo {termo.pk}: {erro}")
+
+        if options['limpar']:
+            atuais = caminhos_atuais()
+            removidos = 0
+            for pasta in (PASTA_MEMORANDOS, PASTA_TERMOS):
+                if not default_storage.exists(pasta):
+                    continue
+                for nome in default_storage.listdir(pasta)[1]:
+                    caminho = f"{pasta}{nome}"
+                    if caminho not in atuais:
+                        default_storage.delete(caminho)
+                        removidos += 1
+            self.stdout.write(f"{removidos} PDFs desatualizados removidos.")
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"PDFs atualizados em {duracao:.1f}s ({falhas} falhas)."))
@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controle.importacao import TAMANHO_LOTE, importar_abastecimentos
+
+
+class Command(BaseCommand):
+    help = "Importa um arquivo (CSV/XLSX) de transações do cartão combustível como abastecimentos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do arquivo .csv ou .xlsx")
+        parser.add_argument(
+            '--rejeitados',
+            help="CSV de saída com as linhas rejeitadas (padrão: <arquivo>.rejeitados.csv)",
+        )
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help="Linhas por lote.")
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo']
+        if not os.path.exists(caminho):
+            raise CommandError(f"Arquivo não encontrado: {caminho}")
+
+        with open(caminho, 'rb') as arquivo:
+            resultado = importar_abastecimentos(arquivo, caminho, tamanho_lote=options['lote'])
+
+        self.stdout.write(self.style.SUCCESS(str(resultado)))
+
+        if resultado.rejeitados:
+            destino = options['rejeitados'] or f"{caminho}.rejeitados.csv"
+            with open(destino, 'w', newline='', encoding='utf-8') as saida:
+                resultado.escrever_rejeitados(saida)
+            self.stdout.write(self.style.WARNING(f"Linhas rejeitadas gravadas em {destino}"))
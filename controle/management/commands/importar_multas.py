@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controle.importacao import TAMANHO_LOTE, importar_multas
+
+
+class Command(BaseCommand):
+    help = "Importa um arquivo (CSV/XLSX) de autuações de um órgão autuador como multas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do arquivo .csv ou .xlsx")
+        parser.add_argument('--orgao', help="Órgão autuador das linhas sem a coluna orgao_autuador")
+        parser.add_argument(
+            '--rejeitados',
+            help="CSV de saída com as linhas rejeitadas (padrão: <arquivo>.rejeitados.csv)",
+        )
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help="Linhas por lote.")
+        parser.add_argument('--simular', action='store_true', help="Só valida e mostra a prévia, sem gravar")
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo']
+        if not os.path.exists(caminho):
+            raise CommandError(f"Arquivo não encontrado: {caminho}")
+
+        inicio = time.perf_counter()
+        with open(caminho, 'rb') as arquivo:
+            resultado = importar_multas(
+                arquivo, caminho, orgao_autuador=options['orgao'], simular=options['simular'],
+                tamanho_lote=options['lote'],
+            )
+        duracao = time.perf_counter() - inicio
+
+        if options['simular']:
+            for item in resultado.amostra:
+                self.stdout.write(
+                    f"{item['linha']}: {item['auto_infracao']} {item['placa']} "
+                    f"{item['data_hora_infracao']:%d/%m/%Y %H:%M} {item['infracao']} "
+                    f"{item['setor']} {item['motorista']}"
+                )
+            self.stdout.write(self.style.WARNING(f"Simulação (nada gravado): {resultado} em {duracao:.1f}s"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{resultado} em {duracao:.1f}s"))
+
+        if resultado.rejeitados:
+            destino = options['rejeitados'] or f"{caminho}.rejeitados.csv"
+            with open(destino, 'w', newline='', encoding='utf-8') as saida:
+                resultado.escrever_rejeitados(saida)
+            self.stdout.write(self.style.WARNING(f"Linhas rejeitadas gravadas em {destino}"))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from controle.busca import buscar_global, reindexar_tudo
+
+
+class Command(BaseCommand):
+    help = (
+        "Recria a tabela da busca global (DocumentoBusca) a partir de veículos, condutores, "
+        "multas, termos e abastecimentos. Necessário uma vez após a migração 0038."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medir', help="Termo para medir o tempo da busca depois de indexar")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        totais = reindexar_tudo()
+        resumo = ', '.join(f"{quantidade} {tipo}" for tipo, quantidade in totais.items())
+        self.stdout.write(self.style.SUCCESS(f"Indexados: {resumo} em {time.perf_counter() - inicio:.1f}s."))
+
+        if options['medir']:
+            vezes = 20
+            inicio = time.perf_counter()
+            for _ in range(vezes):
+                resultados = buscar_global(options['medir'])
+            duracao = (time.perf_counter() - inicio) / vezes * 1000
+            self.stdout.write(f"Busca {options['medir']!r}: {len(resultados)} resultados em {duracao:.1f} ms")
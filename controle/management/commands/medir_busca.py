@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from controle.busca import buscar, preencher
+from controle.models import Motorista
+
+NOMES = ['José', 'João', 'Maria', 'Ana', 'Antônio', 'Francisco', 'Luís', 'Conceição', 'Sebastião', 'Márcia']
+SOBRENOMES = ['Silva', 'Souza', 'Araújo', 'Gonçalves', 'Conceição', 'Pereira', 'Simões', 'Lima', 'Brandão']
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a busca de motoristas (icontains antigo x colunas normalizadas) com N motoristas "
+        "gerados numa transação que é desfeita no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantidade', type=int, default=100_000)
+        parser.add_argument('--vezes', type=int, default=20)
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(42)
+        with transaction.atomic():
+            lote = []
+            for i in range(options['quantidade']):
+                cpf = f"{aleatorio.randrange(10 ** 11):011d}"
+                motorista = Motorista(
+                    nome=f"{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}",
+                    cpf=f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}",
+                    cnh_numero=f"9{i:010d}",
+                    telefone="71999999999",
+                )
+                preencher(motorista)  # bulk_create não dispara o pre_save
+                lote.append(motorista)
+                if len(lote) == 5000:
+                    Motorista.objects.bulk_create(lote)
+                    lote = []
+            Motorista.objects.bulk_create(lote)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE controle_motorista")
+            exemplo = Motorista.objects.order_by('?').first()
+
+            termos = [
+                ("nome sem acento", "JOSE SIMOES"),
+                ("CPF sem pontuação", exemplo.cpf_busca[:7]),
+                ("CPF com pontuação", exemplo.cpf[:8]),
+                ("CNH", exemplo.cnh_numero[:8]),
+            ]
+            for descricao, termo in termos:
+                antigo = Motorista.objects.filter(
+                    Q(nome__icontains=termo) | Q(cpf__icontains=termo) | Q(cnh_numero__icontains=termo)
+                )
+                novo = buscar(Motorista.objects.all(), termo)
+                self.stdout.write(
+                    f"{descricao} ({termo!r}): icontains {self._medir(antigo, options['vezes']):.1f} ms "
+                    f"[{antigo.count()}], normalizada {self._medir(novo, options['vezes']):.1f} ms [{novo.count()}]"
+                )
+            transaction.set_rollback(True)
+
+    def _medir(self, consulta, vezes):
+        """Tempo médio (ms) de uma página de 24 resultados."""
+        inicio = time.perf_counter()
+        for _ in range(vezes):
+            list(consulta.order_by('nome', 'id')[:24])
+        return (time.perf_counter() - inicio) / vezes * 1000
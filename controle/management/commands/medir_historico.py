@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from simple_history.models import HistoricalRecords
+
+from controle.historico import REGISTROS
+from controle.models import Veiculo
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o custo de gravação do histórico enxuto (save sem alteração, delta e "
+        "checkpoint) contra a cópia completa do simple_history. Tudo é desfeito no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vezes', type=int, default=200)
+
+    def handle(self, *args, **options):
+        veiculo = Veiculo.objects.first()
+        if veiculo is None:
+            raise CommandError("É preciso ao menos um veículo cadastrado.")
+        registros = REGISTROS[Veiculo]
+        vezes = options['vezes']
+
+        def medir(descricao, alterar, gravar):
+            inicio = time.perf_counter()
+            for i in range(vezes):
+                if alterar:
+                    veiculo.cor = f"cor {i}"
+                gravar()
+            duracao = (time.perf_counter() - inicio) / vezes * 1000
+            self.stdout.write(f"{descricao}: {duracao:.2f} ms por save")
+
+        with transaction.atomic():
+            medir("Cópia completa (simple_history)", True,
+                  lambda: HistoricalRecords.create_historical_record(registros, veiculo, '~'))
+            medir("Enxuto, sem alteração", False,
+                  lambda: registros.create_historical_record(veiculo, '~'))
+            medir("Enxuto, com alteração (delta/checkpoint)", True,
+                  lambda: registros.create_historical_record(veiculo, '~'))
+            transaction.set_rollback(True)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from controle.consumo import reconstruir_consumo_mensal
+
+
+class Command(BaseCommand):
+    help = "Recria do zero o consolidado mensal de consumo (ConsumoMensal) a partir dos abastecimentos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help="Tamanho do lote de leitura/gravação.")
+
+    def handle(self, *args, **options):
+        total = reconstruir_consumo_mensal(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"{total} registros de consumo mensal gerados."))
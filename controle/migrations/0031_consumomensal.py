@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0030_abastecimento_tipo_combustivel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('tipo_combustivel', models.CharField(choices=[('G', 'Gasolina'), ('A', 'Álcool'), ('D', 'Diesel'), ('E', 'Elétrico'), ('H', 'Híbrido'), ('F', 'Flex')], max_length=1)),
+                ('litros', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('km_rodado', models.IntegerField(default=0)),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('veiculo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos_mensais', to='controle.veiculo')),
+            ],
+            options={
+                'ordering': ['-mes'],
+                'indexes': [models.Index(fields=['mes'], name='controle_co_mes_9047ce_idx')],
+                'constraints': [models.UniqueConstraint(fields=('veiculo', 'mes', 'tipo_combustivel'), name='consumo_mensal_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0031_consumomensal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='abastecimento',
+            name='chave_importacao',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0032_abastecimento_chave_importacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeituraHodometro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hodometro', models.PositiveIntegerField()),
+                ('registrado_em', models.DateTimeField(auto_now_add=True)),
+                ('abastecimento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leituras_hodometro', to='controle.abastecimento')),
+                ('veiculo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leituras_hodometro', to='controle.veiculo')),
+            ],
+            options={
+                'ordering': ['-registrado_em'],
+                'indexes': [models.Index(fields=['veiculo', '-registrado_em'], name='controle_le_veiculo_7aebf6_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0033_leiturahodometro'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomaliaAbastecimento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('consumo_veiculo', 'Consumo fora da média do veículo'), ('consumo_modelo', 'Consumo fora do padrão do tipo de modelo'), ('preco_posto', 'Preço por litro fora do padrão do posto'), ('hodometro_regressivo', 'Hodômetro menor que o anterior'), ('capacidade_tanque', 'Litros acima da capacidade do tanque')], max_length=30)),
+                ('valor', models.FloatField(blank=True, null=True)),
+                ('referencia', models.FloatField(blank=True, null=True)),
+                ('detectado_em', models.DateTimeField(auto_now_add=True)),
+                ('revisado', models.BooleanField(default=False)),
+                ('revisado_em', models.DateTimeField(blank=True, null=True)),
+                ('abastecimento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalias', to='controle.abastecimento')),
+                ('revisado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-detectado_em'],
+                'indexes': [models.Index(fields=['revisado', 'tipo'], name='controle_an_revisad_7cff06_idx')],
+                'constraints': [models.UniqueConstraint(fields=('abastecimento', 'tipo'), name='anomalia_abastecimento_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0034_anomaliaabastecimento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='motorista',
+            index=models.Index(fields=['nome', 'id'], name='controle_mo_nome_45f9a1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='motorista',
+            index=models.Index(fields=['cnh_validade', 'id'], name='controle_mo_cnh_val_53f78c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(fields=['-data_hora_infracao', '-id'], name='controle_mu_data_ho_5b667e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(fields=['prazo_pagamento', 'id'], name='controle_mu_prazo_p_308dfb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(fields=['-data_registro', '-id'], name='controle_mu_data_re_08ccd9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='termoresponsabilidade',
+            index=models.Index(fields=['-data_assinatura', '-id'], name='controle_te_data_as_43ada4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['modelo', 'id'], name='controle_ve_modelo_f79aa7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['-created_at', '-id'], name='controle_ve_created_05fc69_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0035_indices_listas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoHistorico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(max_length=40)),
+                ('objeto_id', models.IntegerField()),
+                ('history_date', models.DateTimeField()),
+                ('history_type', models.CharField(default='~', max_length=1)),
+                ('history_change_reason', models.CharField(blank=True, max_length=100, null=True)),
+                ('campos', models.JSONField()),
+                ('history_user', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tabela', 'objeto_id', 'history_date'], name='controle_al_tabela_0b9233_idx'), models.Index(fields=['-history_date', '-id'], name='controle_al_history_94fc0f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:33
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Cópias congeladas dos normalizadores de controle/busca.py: a migração
+# continua valendo mesmo que aquele módulo mude depois
+def normalizar_texto(valor):
+    if not valor:
+        return ''
+    sem_acento = unicodedata.normalize('NFKD', str(valor)).encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acento.lower().split())
+
+
+def so_digitos(valor):
+    return re.sub(r'\D', '', str(valor or ''))
+
+
+def so_alfanumericos(valor):
+    return re.sub(r'[^0-9a-z]', '', normalizar_texto(valor))
+
+
+CAMPOS = {
+    'motorista': {
+        'nome_busca': ('nome', normalizar_texto),
+        'cpf_busca': ('cpf', so_digitos),
+        'cnh_busca': ('cnh_numero', so_digitos),
+    },
+    'veiculo': {'placa_busca': ('placa', so_alfanumericos)},
+    'multa': {'auto_infracao_busca': ('auto_infracao', so_alfanumericos)},
+}
+
+# Colunas com busca "contém": índice trigram no PostgreSQL
+TRIGRAM = [
+    ('controle_motorista', 'nome_busca'),
+    ('controle_veiculo', 'placa_busca'),
+    ('controle_multa', 'auto_infracao_busca'),
+]
+
+
+def preencher_colunas(apps, schema_editor):
+    for model_name, colunas in CAMPOS.items():
+        model = apps.get_model('controle', model_name)
+        lote = []
+        for objeto in model.objects.only('pk', *[campo for campo, _ in colunas.values()]).iterator(chunk_size=2000):
+            for coluna, (campo, normalizador) in colunas.items():
+                setattr(objeto, coluna, normalizador(getattr(objeto, campo)))
+            lote.append(objeto)
+            if len(lote) >= 2000:
+                model.objects.bulk_update(lote, list(colunas))
+                lote = []
+        model.objects.bulk_update(lote, list(colunas))
+
+
+def criar_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for tabela, coluna in TRIGRAM:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {tabela}_{coluna}_trgm ON {tabela} USING gin ({coluna} gin_trgm_ops)"
+        )
+
+
+def remover_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela, coluna in TRIGRAM:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {tabela}_{coluna}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0036_historico_enxuto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='motorista',
+            name='cnh_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='motorista',
+            name='cpf_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=14),
+        ),
+        migrations.AddField(
+            model_name='motorista',
+            name='nome_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='multa',
+            name='auto_infracao_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='veiculo',
+            name='placa_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=10),
+        ),
+        migrations.RunPython(preencher_colunas, migrations.RunPython.noop),
+        migrations.RunPython(criar_indices_trigram, remover_indices_trigram),
+    ]
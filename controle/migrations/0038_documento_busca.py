@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:36
+
+from django.db import migrations, models
+
+
+def criar_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS controle_documentobusca_texto_trgm "
+        "ON controle_documentobusca USING gin (texto gin_trgm_ops)"
+    )
+
+
+def remover_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS controle_documentobusca_texto_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0037_colunas_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('prioridade', models.PositiveSmallIntegerField(default=0)),
+                ('chave', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('texto', models.TextField()),
+                ('titulo', models.CharField(max_length=200)),
+                ('subtitulo', models.CharField(blank=True, max_length=255)),
+                ('url', models.CharField(max_length=200)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='documento_busca_unico')],
+            },
+        ),
+        migrations.RunPython(criar_indice_trigram, remover_indice_trigram),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:38
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Cópia congelada de controle/busca.py: a migração continua valendo mesmo
+# que aquele módulo mude depois
+def normalizar_texto(valor):
+    if not valor:
+        return ''
+    sem_acento = unicodedata.normalize('NFKD', str(valor)).encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acento.lower().split())
+
+
+def preencher_descricao_busca(apps, schema_editor):
+    InfracaoTransito = apps.get_model('controle', 'InfracaoTransito')
+    infracoes = list(InfracaoTransito.objects.only('pk', 'descricao'))
+    for infracao in infracoes:
+        infracao.descricao_busca = normalizar_texto(infracao.descricao)
+    InfracaoTransito.objects.bulk_update(infracoes, ['descricao_busca'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0038_documento_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='infracaotransito',
+            name='descricao_busca',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(preencher_descricao_busca, migrations.RunPython.noop),
+    ]
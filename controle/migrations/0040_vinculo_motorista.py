@@ -0,0 +1,91 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def carga_inicial(apps, schema_editor):
+    """
+    Vínculos a partir do que já existe: cada par atual de Veiculo.motoristas
+    fica aberto desde o primeiro termo do par (ou desde o cadastro do
+    veículo, sem termo). Termos de pares que não estão mais vinculados
+    viram vínculos fechados no termo seguinte do mesmo veículo (ou agora).
+    """
+    Veiculo = apps.get_model('controle', 'Veiculo')
+    TermoResponsabilidade = apps.get_model('controle', 'TermoResponsabilidade')
+    VinculoMotorista = apps.get_model('controle', 'VinculoMotorista')
+    agora = timezone.now()
+
+    termos = {}
+    por_veiculo = {}
+    for termo in TermoResponsabilidade.objects.order_by('data_assinatura', 'id').iterator():
+        termos.setdefault((termo.veiculo_id, termo.motorista_id), termo)
+        por_veiculo.setdefault(termo.veiculo_id, []).append(termo)
+
+    criados = []
+    atuais = Veiculo.motoristas.through.objects.values_list('veiculo_id', 'motorista_id', 'veiculo__created_at')
+    pares_atuais = set()
+    for veiculo_id, motorista_id, criado_em in atuais.iterator():
+        pares_atuais.add((veiculo_id, motorista_id))
+        termo = termos.get((veiculo_id, motorista_id))
+        criados.append(VinculoMotorista(
+            veiculo_id=veiculo_id, motorista_id=motorista_id,
+            inicio=termo.data_assinatura if termo else criado_em,
+            origem='termo' if termo else 'carga', termo=termo,
+        ))
+
+    for veiculo_id, lista in por_veiculo.items():
+        for posicao, termo in enumerate(lista):
+            if (veiculo_id, termo.motorista_id) in pares_atuais:
+                continue
+            seguinte = next((t for t in lista[posicao + 1:] if t.motorista_id != termo.motorista_id), None)
+            criados.append(VinculoMotorista(
+                veiculo_id=veiculo_id, motorista_id=termo.motorista_id, inicio=termo.data_assinatura,
+                fim=seguinte.data_assinatura if seguinte else agora, origem='termo', termo=termo,
+            ))
+    VinculoMotorista.objects.bulk_create(criados, batch_size=1000)
+
+
+def criar_indice_intervalo(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS controle_vinculomotorista_periodo_gist "
+        "ON controle_vinculomotorista USING gist (veiculo_id, tstzrange(inicio, fim, '[)'))"
+    )
+
+
+def remover_indice_intervalo(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS controle_vinculomotorista_periodo_gist")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0039_descricao_busca_infracao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VinculoMotorista',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField(blank=True, null=True)),
+                ('origem', models.CharField(choices=[('termo', 'Termo de responsabilidade'), ('veiculo', 'Edição do veículo'), ('carga', 'Carga inicial')], max_length=10)),
+                ('motorista', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vinculos', to='controle.motorista')),
+                ('termo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vinculos', to='controle.termoresponsabilidade')),
+                ('veiculo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vinculos', to='controle.veiculo')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['veiculo', 'inicio'], name='controle_vi_veiculo_c501a8_idx'), models.Index(fields=['motorista', 'fim'], name='controle_vi_motoris_26919c_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('fim__isnull', True), ('fim__gte', models.F('inicio')), _connector='OR'), name='vinculo_fim_depois_do_inicio')],
+            },
+        ),
+        migrations.RunPython(carga_inicial, migrations.RunPython.noop),
+        migrations.RunPython(criar_indice_intervalo, remover_indice_intervalo),
+    ]
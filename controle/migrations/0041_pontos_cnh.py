@@ -0,0 +1,79 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:48
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+PONTOS_POR_GRAVIDADE = {'leve': 3, 'media': 4, 'grave': 5, 'gravissima': 7}
+
+
+def carga_inicial(apps, schema_editor):
+    """Pontos das infrações pela gravidade e acumulador dos últimos 12 meses."""
+    InfracaoTransito = apps.get_model('controle', 'InfracaoTransito')
+    Motorista = apps.get_model('controle', 'Motorista')
+    Multa = apps.get_model('controle', 'Multa')
+
+    for gravidade, pontos in PONTOS_POR_GRAVIDADE.items():
+        InfracaoTransito.objects.filter(gravidade=gravidade).update(pontos=pontos)
+
+    # Mesmo corte de controle/pontuacao.inicio_janela: 12 meses atrás
+    agora = timezone.now()
+    try:
+        corte = agora.replace(year=agora.year - 1)
+    except ValueError:
+        corte = agora.replace(year=agora.year - 1, day=28)
+    totais = Counter()
+    vigentes = (
+        Multa.objects.filter(motorista__isnull=False, infracao__pontos__gt=0, data_hora_infracao__gt=corte)
+        .values_list('pk', 'motorista_id', 'infracao__pontos')
+    )
+    lote = []
+    for pk, motorista_id, pontos in vigentes.iterator():
+        totais[motorista_id] += pontos
+        lote.append(Multa(pk=pk, pontos_motorista_id=motorista_id, pontos_vigentes=pontos))
+    Multa.objects.bulk_update(lote, ['pontos_motorista', 'pontos_vigentes'], batch_size=1000)
+    Motorista.objects.bulk_update(
+        [Motorista(pk=pk, pontos_cnh=total) for pk, total in totais.items()], ['pontos_cnh'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0040_vinculo_motorista'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='infracaotransito',
+            name='pontos',
+            field=models.PositiveSmallIntegerField(blank=True, default=0, help_text='Pontos na CNH; em branco, usa o padrão da gravidade (3, 4, 5 ou 7).'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='motorista',
+            name='pontos_cnh',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='multa',
+            name='pontos_motorista',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='controle.motorista'),
+        ),
+        migrations.AddField(
+            model_name='multa',
+            name='pontos_vigentes',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='motorista',
+            index=models.Index(fields=['-pontos_cnh', '-id'], name='controle_mo_pontos__631c33_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(condition=models.Q(('pontos_vigentes__gt', 0)), fields=['data_hora_infracao'], name='multa_pontos_vigentes_idx'),
+        ),
+        migrations.RunPython(carga_inicial, migrations.RunPython.noop),
+    ]
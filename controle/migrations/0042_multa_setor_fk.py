@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0041_pontos_cnh'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='multa',
+            old_name='setor',
+            new_name='setor_nome',
+        ),
+        migrations.RenameField(
+            model_name='historicalmulta',
+            old_name='setor',
+            new_name='setor_nome',
+        ),
+        migrations.AlterField(
+            model_name='multa',
+            name='setor_nome',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalmulta',
+            name='setor_nome',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='multa',
+            name='setor',
+            field=models.ForeignKey(blank=True, db_index=False, help_text='Setor do veículo no momento da infração', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='multas', to='controle.setor'),
+        ),
+        migrations.AddField(
+            model_name='historicalmulta',
+            name='setor',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='Setor do veículo no momento da infração', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='controle.setor'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(fields=['setor', '-data_hora_infracao', '-id'], name='controle_mu_setor_i_1903f1_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:12
+
+from django.db import migrations, transaction
+from django.db.models import Case, IntegerField, Value, When
+
+TAMANHO_LOTE = 5000
+
+
+def _ligar_por_nome(model, campo_pk, por_nome):
+    """
+    Preenche setor_id pelo nome congelado, em lotes de TAMANHO_LOTE ids (uma
+    transação e um UPDATE por lote). Nomes que não correspondem a nenhum
+    setor ficam sem chave estrangeira, só com o nome.
+    """
+    nomes = set(
+        model.objects.exclude(setor_nome__isnull=True).order_by()
+        .values_list('setor_nome', flat=True).distinct()
+    )
+    conhecidos = nomes & por_nome.keys()
+    if not conhecidos:
+        return
+    setor_id = Case(
+        *(When(setor_nome=nome, then=Value(por_nome[nome])) for nome in conhecidos),
+        default=Value(None),
+        output_field=IntegerField(),
+    )
+    ultimo = model.objects.order_by(f'-{campo_pk}').values_list(campo_pk, flat=True).first() or 0
+    for inicio in range(0, ultimo + 1, TAMANHO_LOTE):
+        with transaction.atomic():
+            model.objects.filter(
+                **{f'{campo_pk}__gte': inicio, f'{campo_pk}__lt': inicio + TAMANHO_LOTE},
+                setor_nome__in=conhecidos,
+            ).update(setor_id=setor_id)
+
+
+def preencher_setores(apps, schema_editor):
+    """
+    Liga as multas existentes ao Setor. As cópias do histórico também, para
+    a página de diferenças não mostrar uma troca de setor que não houve.
+    """
+    Setor = apps.get_model('controle', 'Setor')
+    AlteracaoHistorico = apps.get_model('controle', 'AlteracaoHistorico')
+
+    por_nome = dict(Setor.objects.values_list('nome', 'pk'))
+    _ligar_por_nome(apps.get_model('controle', 'Multa'), 'id', por_nome)
+    _ligar_por_nome(apps.get_model('controle', 'HistoricalMulta'), 'history_id', por_nome)
+
+    # Deltas do histórico enxuto gravados com o nome antigo do campo
+    alteracoes = AlteracaoHistorico.objects.filter(tabela='multa', campos__has_key='setor')
+    while True:
+        lote = list(alteracoes.order_by('pk')[:TAMANHO_LOTE])
+        if not lote:
+            break
+        for alteracao in lote:
+            alteracao.campos['setor_nome'] = alteracao.campos.pop('setor')
+        with transaction.atomic():
+            AlteracaoHistorico.objects.bulk_update(lote, ['campos'])
+
+
+class Migration(migrations.Migration):
+    # Só a carga: cada lote roda na sua própria transação, sem segurar a
+    # tabela de multas durante a migração inteira (o esquema fica na 0042)
+    atomic = False
+
+    dependencies = [
+        ('controle', '0042_multa_setor_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_setores, migrations.RunPython.noop),
+    ]
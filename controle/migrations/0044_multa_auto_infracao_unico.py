@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def separar_repetidos(apps, schema_editor):
+    """
+    Antes de criar a constraint, autos repetidos no mesmo órgão ficam na
+    multa mais antiga; as outras ganham o sufixo "(repetido #pk)" no número,
+    que continua visível para quem for conferir qual delas vale.
+    """
+    Multa = apps.get_model('controle', 'Multa')
+    grupos = (
+        Multa.objects.exclude(auto_infracao_busca='').values('orgao_autuador', 'auto_infracao_busca')
+        .annotate(total=Count('id'), primeira=Min('id')).filter(total__gt=1).order_by()
+    )
+    repetidas = []
+    for grupo in grupos:
+        multas = Multa.objects.filter(
+            orgao_autuador=grupo['orgao_autuador'], auto_infracao_busca=grupo['auto_infracao_busca'],
+        ).exclude(pk=grupo['primeira'])
+        for multa in multas.only('pk', 'auto_infracao', 'auto_infracao_busca'):
+            # Mesmo valor que busca.so_alfanumericos daria para o número novo
+            multa.auto_infracao = f"{multa.auto_infracao} (repetido #{multa.pk})"
+            multa.auto_infracao_busca = f"{multa.auto_infracao_busca}repetido{multa.pk}"
+            repetidas.append(multa)
+    Multa.objects.bulk_update(repetidas, ['auto_infracao', 'auto_infracao_busca'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0043_preencher_setor_multas'),
+    ]
+
+    operations = [
+        migrations.RunPython(separar_repetidos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='multa',
+            constraint=models.UniqueConstraint(condition=models.Q(('auto_infracao_busca', ''), _negated=True), fields=('orgao_autuador', 'auto_infracao_busca'), name='multa_auto_infracao_unico'),
+        ),
+    ]
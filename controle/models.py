@@ -1,8 +1,25 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from simple_history.models import HistoricalRecords
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .historico import HistoricoEnxuto
+
+
+def _preservar_acumuladores(instancia, kwargs, campos):
+    """
+    Em alterações, grava todos os campos menos os acumuladores, que são
+    mantidos com UPDATE ... SET x = x + n (controle/pontuacao.py): um objeto
+    carregado antes da última atualização não volta o valor.
+    """
+    if instancia._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return
+    kwargs['update_fields'] = [
+        campo.name for campo in instancia._meta.concrete_fields
+        if not campo.primary_key and campo.name not in campos
+    ]
 
 class Setor(models.Model):
     # Nome do setor/departamento, único para evitar duplicidade
@@ -164,14 +181,23 @@ class Veiculo(models.Model):
     )
 
     setor = models.ForeignKey(Setor, on_delete=models.CASCADE, related_name='veiculos', null=True)
-    history = HistoricalRecords()
+
+    # Coluna de busca normalizada (controle/busca.py), preenchida no save
+    placa_busca = models.CharField(max_length=10, blank=True, default='', editable=False, db_index=True)
+
+    history = HistoricoEnxuto(excluded_fields=['placa_busca'])
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL,
                                    null=True,               # permite ficar vazio
                                    blank=True,
                                    on_delete=models.SET_NULL
     )
 
-
+    class Meta:
+        # Ordenações da lista de veículos (paginação por cursor)
+        indexes = [
+            models.Index(fields=['modelo', 'id']),
+            models.Index(fields=['-created_at', '-id']),
+        ]
 
     def __str__(self):
         """
@@ -179,6 +205,30 @@ class Veiculo(models.Model):
         Útil para exibir no admin e em listas.
         """
         return f"{self.placa} - {self.marca} {self.modelo}"
+
+    @classmethod
+    def avancar_hodometro(cls, veiculo_id, hodometro, abastecimento=None):
+        """
+        Avança o hodômetro do veículo com um único UPDATE condicional
+        (GREATEST), sem save(): não altera updated_at nem gera histórico.
+        Leituras concorrentes nunca fazem o hodômetro voltar.
+        Registra a leitura em LeituraHodometro quando houve avanço, na
+        mesma transação: o lock do UPDATE só é solto depois do INSERT, então
+        as leituras ficam na ordem em que o hodômetro avançou.
+        """
+        with transaction.atomic():
+            avancou = cls.objects.filter(
+                models.Q(hodometro__lt=hodometro) | models.Q(hodometro__isnull=True),
+                pk=veiculo_id,
+            ).update(hodometro=Greatest(Coalesce(F('hodometro'), Value(0)), Value(hodometro)))
+
+            if avancou:
+                LeituraHodometro.objects.create(
+                    veiculo_id=veiculo_id,
+                    hodometro=hodometro,
+                    abastecimento=abastecimento,
+                )
+        return bool(avancou)
     
 class Motorista(models.Model):
     # Dados pessoais
@@ -224,7 +274,23 @@ class Motorista(models.Model):
         null=True                               # Permite Campo Vazio no Banco
     )
 
-    history = HistoricalRecords()
+    # Colunas de busca normalizadas (controle/busca.py), preenchidas no save
+    nome_busca = models.CharField(max_length=100, blank=True, default='', editable=False, db_index=True)
+    cpf_busca = models.CharField(max_length=14, blank=True, default='', editable=False, db_index=True)
+    cnh_busca = models.CharField(max_length=20, blank=True, default='', editable=False, db_index=True)
+
+    # Pontos na CNH das multas dos últimos 12 meses (controle/pontuacao.py)
+    pontos_cnh = models.PositiveIntegerField(default=0, editable=False)
+
+    history = HistoricoEnxuto(excluded_fields=['nome_busca', 'cpf_busca', 'cnh_busca', 'pontos_cnh'])
+
+    class Meta:
+        # Ordenações da lista de motoristas (paginação por cursor)
+        indexes = [
+            models.Index(fields=['nome', 'id']),
+            models.Index(fields=['cnh_validade', 'id']),
+            models.Index(fields=['-pontos_cnh', '-id']),
+        ]
 
     def __str__(self):
         """
@@ -232,7 +298,20 @@ class Motorista(models.Model):
         Útil para exibir no admin e em listas.
         """
         return f"{self.nome}"
-    
+
+    def save(self, *args, **kwargs):
+        _preservar_acumuladores(self, kwargs, ('pontos_cnh',))
+        super().save(*args, **kwargs)
+
+    @property
+    def faixa_pontos(self):
+        """Maior limite de pontos (20, 30 ou 40) atingido nos últimos 12 meses, ou None."""
+        return next((limite for limite in LIMITES_PONTOS if self.pontos_cnh >= limite), None)
+
+
+# Limites de pontos da CNH em 12 meses (CTB, art. 261), do maior para o menor
+LIMITES_PONTOS = (40, 30, 20)
+
 class ManutencaoVeiculo(models.Model):
     veiculo = models.ForeignKey('Veiculo', on_delete=models.CASCADE, related_name='manutencoes')
     
@@ -259,11 +338,23 @@ class ManutencaoVeiculo(models.Model):
 from django.db import models
 from django.utils import timezone
 
+class MultaQuerySet(models.QuerySet):
+
+    def com_infracao(self):
+        """Traz valor e gravidade da infração na mesma consulta."""
+        return self.annotate(
+            valor_infracao=F('infracao__valor'),
+            gravidade_infracao=F('infracao__gravidade'),
+        )
+
+
 class Multa(models.Model):
 
     numero_memorando = models.PositiveIntegerField(blank=True, null=True,)
 
     auto_infracao = models.CharField(blank=True, null=True)
+    # Coluna de busca normalizada (controle/busca.py), preenchida no save
+    auto_infracao_busca = models.CharField(max_length=100, blank=True, default='', editable=False, db_index=True)
 
     veiculo = models.ForeignKey(
         'Veiculo',
@@ -271,13 +362,20 @@ class Multa(models.Model):
         related_name='multas'
     )
 
-    # 🔑 Setor congelado no momento do registro
-    setor = models.CharField(
-        max_length=100,
-        help_text="Setor do veículo no momento da infração",
+    # Setor responsável, para filtrar e agrupar (o índice composto do Meta
+    # começa pela chave estrangeira, dispensando o índice simples)
+    setor = models.ForeignKey(
+        Setor,
+        on_delete=models.SET_NULL,
         null=True,
         blank=True,
+        db_index=False,
+        related_name='multas',
+        help_text="Setor do veículo no momento da infração"
     )
+    # 🔑 Nome e descrição do setor congelados no registro (valem para o memorando,
+    # mesmo que o setor seja renomeado depois)
+    setor_nome = models.CharField(max_length=100, null=True, blank=True)
     setor_descricao = models.CharField(max_length=255, blank=True)
 
     motorista = models.ForeignKey(
@@ -350,7 +448,19 @@ class Multa(models.Model):
 
     data_registro = models.DateTimeField(auto_now_add=True)
 
-    history = HistoricalRecords()
+    # Pontos desta multa somados hoje em Motorista.pontos_cnh, e para quem
+    # (controle/pontuacao.py); zerados quando a infração sai da janela de 12 meses
+    pontos_vigentes = models.PositiveSmallIntegerField(default=0, editable=False)
+    pontos_motorista = models.ForeignKey(
+        'Motorista',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+
+    history = HistoricoEnxuto(excluded_fields=['auto_infracao_busca', 'pontos_vigentes', 'pontos_motorista'])
 
     conta_pagamento = models.ForeignKey(
         'ContaPagamento',
@@ -360,6 +470,30 @@ class Multa(models.Model):
         null=True, blank=True
     )
 
+    objects = MultaQuerySet.as_manager()
+
+    class Meta:
+        # Ordenações da lista de multas (paginação por cursor)
+        indexes = [
+            models.Index(fields=['-data_hora_infracao', '-id']),
+            models.Index(fields=['prazo_pagamento', 'id']),
+            models.Index(fields=['-data_registro', '-id']),
+            # Multas de um setor na ordem da lista
+            models.Index(fields=['setor', '-data_hora_infracao', '-id']),
+            # Só as multas com pontos ainda contados, para expirar_pontos
+            models.Index(fields=['data_hora_infracao'], condition=models.Q(pontos_vigentes__gt=0),
+                         name='multa_pontos_vigentes_idx'),
+        ]
+        constraints = [
+            # Um auto de infração por órgão autuador (numerações de órgãos
+            # diferentes podem coincidir; multas sem auto ficam de fora)
+            models.UniqueConstraint(
+                fields=['orgao_autuador', 'auto_infracao_busca'],
+                condition=~models.Q(auto_infracao_busca=''),
+                name='multa_auto_infracao_unico',
+            ),
+        ]
+
     def clean(self):
         if self.status_multa == 'recebido' and not self.documento_recebido:
             raise ValidationError("É obrigatório anexar o documento com carimbo de recebido.")
@@ -369,21 +503,34 @@ class Multa(models.Model):
 
     def save(self, *args, **kwargs):
         # Se for uma multa nova e o setor ainda não foi preenchido, copia do veículo
-        if not self.pk and not self.setor:
-            self.setor = str(self.veiculo.setor)
-            self.setor_descricao = str(self.veiculo.setor.descricao)
+        if not self.pk and not self.setor_id:
+            self.setor_id = self.veiculo.setor_id
+        if not self.pk and not self.setor_nome:
+            self.congelar_setor()
         self.full_clean()  # garante validações
+        _preservar_acumuladores(self, kwargs, ('pontos_vigentes', 'pontos_motorista'))
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.veiculo.placa} - {self.setor}"
+        return f"{self.veiculo.placa} - {self.setor_nome}"
+
+    def congelar_setor(self):
+        """Copia nome e descrição do setor atual para os campos congelados."""
+        self.setor_nome = self.setor.nome if self.setor else None
+        self.setor_descricao = (self.setor.descricao or '') if self.setor else ''
 
+    # Listas anotam valor_infracao/gravidade_infracao (Multa.objects.com_infracao())
+    # para não carregar a infração de cada linha
     @property
     def valor(self):
+        if hasattr(self, 'valor_infracao'):
+            return self.valor_infracao
         return self.infracao.valor
 
     @property
     def gravidade(self):
+        if hasattr(self, 'gravidade_infracao'):
+            return self.gravidade_infracao
         return self.infracao.gravidade
 
 class TermoResponsabilidade(models.Model):
@@ -392,12 +539,59 @@ class TermoResponsabilidade(models.Model):
     arquivo = models.FileField(upload_to='documentos/veiculos/termo/', blank=True, null=True)
     data_assinatura = models.DateTimeField(auto_now_add=True)
     
-    history = HistoricalRecords()  # Adicione essa linha
+    history = HistoricoEnxuto()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-data_assinatura', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.veiculo} - {self.motorista}"
 
 
+class VinculoMotorista(models.Model):
+    """
+    Período em que um motorista esteve vinculado a um veículo
+    (controle/vinculos.py). Sem fim, o vínculo está em aberto. Responde
+    "quem respondia pelo veículo em tal data/hora" para as multas.
+    """
+    class ORIGEM_CHOICES(models.TextChoices):
+        TERMO = 'termo', 'Termo de responsabilidade'
+        VEICULO = 'veiculo', 'Edição do veículo'
+        CARGA = 'carga', 'Carga inicial'
+
+    veiculo = models.ForeignKey(Veiculo, on_delete=models.CASCADE, related_name='vinculos')
+    motorista = models.ForeignKey(Motorista, on_delete=models.CASCADE, related_name='vinculos')
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField(null=True, blank=True)
+    origem = models.CharField(max_length=10, choices=ORIGEM_CHOICES.choices)
+    termo = models.ForeignKey(
+        TermoResponsabilidade,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='vinculos'
+    )
+
+    class Meta:
+        # No PostgreSQL há também um índice GiST em (veiculo, tstzrange(inicio, fim)) (migração 0040)
+        indexes = [
+            models.Index(fields=['veiculo', 'inicio']),
+            models.Index(fields=['motorista', 'fim']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(fim__isnull=True) | models.Q(fim__gte=models.F('inicio')),
+                name='vinculo_fim_depois_do_inicio',
+            ),
+        ]
+
+    def __str__(self):
+        fim = f"{self.fim:%d/%m/%Y %H:%M}" if self.fim else "atual"
+        return f"{self.veiculo} - {self.motorista} ({self.inicio:%d/%m/%Y %H:%M} a {fim})"
+
+
 class InfracaoTransito(models.Model):
     descricao = models.CharField(max_length=255)  # Ex: "Avançar sinal vermelho"
     gravidade = models.CharField(max_length=50, choices=[
@@ -407,10 +601,24 @@ class InfracaoTransito(models.Model):
         ('gravissima', 'Gravíssima'),
     ])
     valor = models.DecimalField(max_digits=10, decimal_places=2)
+    pontos = models.PositiveSmallIntegerField(
+        blank=True,
+        help_text="Pontos na CNH; em branco, usa o padrão da gravidade (3, 4, 5 ou 7)."
+    )
+    # Coluna de busca normalizada (controle/busca.py), preenchida no save
+    descricao_busca = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+
+    # Pontos por gravidade (CTB, art. 259)
+    PONTOS_POR_GRAVIDADE = {'leve': 3, 'media': 4, 'grave': 5, 'gravissima': 7}
 
     def __str__(self):
         return f"{self.descricao} ({self.gravidade})"
 
+    def save(self, *args, **kwargs):
+        if self.pontos is None:
+            self.pontos = self.PONTOS_POR_GRAVIDADE.get(self.gravidade, 0)
+        super().save(*args, **kwargs)
+
 class ContaPagamento(models.Model):
     banco = models.CharField(
         max_length=100,
@@ -438,7 +646,60 @@ class ContaPagamento(models.Model):
         return f"{self.favorecido}"
 
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, Max, OuterRef, Subquery, Value, When, Window
+from django.db.models.functions import Cast, Coalesce, Lag, Round
+
+
+class AbastecimentoQuerySet(models.QuerySet):
+
+    def com_consumo(self, data_inicio=None, data_fim=None):
+        """
+        Anota hodometro_anterior, km_rodado e km_por_litro de cada
+        abastecimento em uma única consulta (LAG por veículo).
+
+        O período é aplicado depois da janela, para que o primeiro
+        abastecimento do período ainda enxergue o anterior a ele. A janela
+        em si só percorre, por veículo, do último abastecimento antes de
+        data_inicio em diante, e não o histórico inteiro.
+        """
+        qs = self
+        if data_fim:
+            qs = qs.filter(data__lte=data_fim)
+        if data_inicio:
+            ultimo_antes = (
+                self.filter(veiculo_id=OuterRef('veiculo_id'), data__lt=data_inicio)
+                .order_by('-data').values('data')[:1]
+            )
+            qs = qs.filter(data__gte=Coalesce(Subquery(ultimo_antes), Value(data_inicio)))
+
+        qs = qs.annotate(
+            hodometro_anterior=Window(
+                Lag('hodometro', default=Value(0)),
+                partition_by=[F('veiculo_id')],
+                order_by=[F('data').asc(), F('hodometro').asc()],
+            ),
+        ).annotate(
+            km_rodado=F('hodometro') - F('hodometro_anterior'),
+            km_por_litro=Case(
+                When(litros__gt=0, then=Round(
+                    Cast(F('hodometro') - F('hodometro_anterior'), FloatField())
+                    / Cast('litros', FloatField()),
+                    2,
+                )),
+                default=None,
+                output_field=FloatField(),
+            ),
+        )
+
+        if data_inicio:
+            # Filtro sobre uma expressão de janela vai para a consulta externa,
+            # depois do LAG; um filtro em "data" cortaria o histórico anterior.
+            qs = qs.annotate(
+                data_janela=Window(Max('data'), partition_by=[F('pk')]),
+            ).filter(data_janela__gte=data_inicio)
+        return qs
+
 
 class Abastecimento(models.Model):
     # Veículo que foi abastecido
@@ -486,6 +747,16 @@ class Abastecimento(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Identificador da transação importada do cartão combustível (evita duplicar
+    # abastecimentos quando o mesmo arquivo é importado de novo)
+    chave_importacao = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
     # Tipo de combustível abastecido
     TIPO_COMBUSTIVEL_CHOICES = [
         ('G', 'Gasolina'),
@@ -502,6 +773,8 @@ class Abastecimento(models.Model):
         help_text="Tipo de combustível abastecido"
     )
 
+    objects = AbastecimentoQuerySet.as_manager()
+
     class Meta:
         # Ordenar abastecimentos da data mais recente para a mais antiga
         ordering = ['-data']
@@ -511,29 +784,254 @@ class Abastecimento(models.Model):
         return f"Abastecimento de {self.veiculo.placa} em {self.data}"
 
     def save(self, *args, **kwargs):
+        from .consumo import atualizar_consumo_mensal
+
         # Calcula o valor por litro automaticamente antes de salvar
         if self.litros > 0 and self.valor_total:
             self.valor_litro = round(self.valor_total / self.litros, 2)
         else:
             self.valor_litro = 0
 
-        # Atualiza o hodômetro do veículo
-        if self.veiculo and self.hodometro > self.veiculo.hodometro:
-            self.veiculo.hodometro = self.hodometro
-            self.veiculo.save()
+        with transaction.atomic():
+            # Posição antiga (veículo, data, hodômetro) para corrigir o consolidado
+            anterior = None
+            if self.pk:
+                anterior = Abastecimento.objects.filter(pk=self.pk).values_list(
+                    'veiculo_id', 'data', 'hodometro'
+                ).first()
 
-        super().save(*args, **kwargs)
+            super().save(*args, **kwargs)
+
+            # Atualiza o hodômetro do veículo
+            if Veiculo.avancar_hodometro(self.veiculo_id, self.hodometro, abastecimento=self):
+                if Abastecimento.veiculo.is_cached(self):
+                    self.veiculo.hodometro = max(self.veiculo.hodometro or 0, self.hodometro)
+
+            posicoes = [(self.veiculo_id, self.data, self.hodometro)]
+            if anterior:
+                posicoes.append(anterior)
+            atualizar_consumo_mensal(posicoes, ignorar_pk=self.pk)
+
+    def delete(self, *args, **kwargs):
+        from .consumo import atualizar_consumo_mensal
+
+        with transaction.atomic():
+            posicao = (self.veiculo_id, self.data, self.hodometro)
+            resultado = super().delete(*args, **kwargs)
+            atualizar_consumo_mensal([posicao])
+        return resultado
 
     def km_anterior(self):
-        # Busca o abastecimento anterior deste veículo
+        # Busca o abastecimento anterior deste veículo.
+        # Para listas use Abastecimento.objects.com_consumo(), que faz o mesmo
+        # cálculo para todas as linhas de uma vez (mesma ordem: data, hodômetro).
+        if hasattr(self, 'hodometro_anterior'):
+            return self.hodometro_anterior
         anterior = Abastecimento.objects.filter(
+            models.Q(data__lt=self.data) | models.Q(data=self.data, hodometro__lt=self.hodometro),
             veiculo=self.veiculo,
-            data__lt=self.data
-        ).order_by('-data').first()
+        ).order_by('-data', '-hodometro').first()
         return anterior.hodometro if anterior else 0
 
     def media_km_litro(self):
+        if hasattr(self, 'km_por_litro'):
+            return self.km_por_litro
         km_ant = self.km_anterior()
         if self.litros > 0:
             return round((self.hodometro - km_ant) / float(self.litros), 2)
-        return None
\ No newline at end of file
+        return None
+
+
+class LeituraHodometro(models.Model):
+    """
+    Registro compacto de cada avanço do hodômetro de um veículo.
+    Substitui o snapshot completo de HistoricalVeiculo nessas alterações.
+    """
+    veiculo = models.ForeignKey(
+        'Veiculo',
+        on_delete=models.CASCADE,
+        related_name='leituras_hodometro'
+    )
+    hodometro = models.PositiveIntegerField()
+
+    # Abastecimento que originou a leitura (vazio em importações em lote)
+    abastecimento = models.ForeignKey(
+        'Abastecimento',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='leituras_hodometro'
+    )
+    registrado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-registrado_em']
+        indexes = [
+            models.Index(fields=['veiculo', '-registrado_em']),
+        ]
+
+    def __str__(self):
+        return f"{self.veiculo.placa} - {self.hodometro} km em {self.registrado_em:%d/%m/%Y %H:%M}"
+
+
+class AnomaliaAbastecimento(models.Model):
+    """
+    Abastecimento marcado pela análise da frota (controle/anomalias.py)
+    para conferência manual.
+    """
+    class Tipos(models.TextChoices):
+        CONSUMO_VEICULO = 'consumo_veiculo', 'Consumo fora da média do veículo'
+        CONSUMO_MODELO = 'consumo_modelo', 'Consumo fora do padrão do tipo de modelo'
+        PRECO_POSTO = 'preco_posto', 'Preço por litro fora do padrão do posto'
+        HODOMETRO_REGRESSIVO = 'hodometro_regressivo', 'Hodômetro menor que o anterior'
+        CAPACIDADE_TANQUE = 'capacidade_tanque', 'Litros acima da capacidade do tanque'
+
+    abastecimento = models.ForeignKey(
+        'Abastecimento',
+        on_delete=models.CASCADE,
+        related_name='anomalias'
+    )
+    tipo = models.CharField(max_length=30, choices=Tipos.choices)
+
+    # Valor observado (km/L, R$/L, km ou litros) e o valor de referência
+    valor = models.FloatField(null=True, blank=True)
+    referencia = models.FloatField(null=True, blank=True)
+
+    detectado_em = models.DateTimeField(auto_now_add=True)
+
+    revisado = models.BooleanField(default=False)
+    revisado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    revisado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-detectado_em']
+        constraints = [
+            models.UniqueConstraint(fields=['abastecimento', 'tipo'], name='anomalia_abastecimento_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['revisado', 'tipo']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.abastecimento}"
+
+
+class ConsumoMensal(models.Model):
+    """
+    Consolidado mensal de abastecimentos por veículo e combustível.
+    Mantido por Abastecimento.save()/delete(); para refazer do zero use
+    o comando recalcular_consumo_mensal.
+    """
+    veiculo = models.ForeignKey(
+        'Veiculo',
+        on_delete=models.CASCADE,
+        related_name='consumos_mensais'
+    )
+
+    # Primeiro dia do mês de referência
+    mes = models.DateField()
+
+    tipo_combustivel = models.CharField(
+        max_length=1,
+        choices=Abastecimento.TIPO_COMBUSTIVEL_CHOICES,
+    )
+
+    litros = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    # Km rodados desde o abastecimento anterior (qualquer combustível)
+    km_rodado = models.IntegerField(default=0)
+
+    # Quantidade de abastecimentos no mês
+    quantidade = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-mes']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['veiculo', 'mes', 'tipo_combustivel'],
+                name='consumo_mensal_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['mes']),
+        ]
+
+    def __str__(self):
+        return f"{self.veiculo.placa} - {self.mes:%m/%Y} ({self.get_tipo_combustivel_display()})"
+
+    @property
+    def km_por_litro(self):
+        if self.litros and self.km_rodado:
+            return round(self.km_rodado / float(self.litros), 2)
+        return None
+
+
+class AlteracaoHistorico(models.Model):
+    """
+    Alteração intermediária de um objeto com histórico enxuto
+    (controle/historico.py): só os campos que mudaram, em JSON, relativos
+    à versão anterior. As versões completas (checkpoints) continuam nas
+    tabelas Historical* do django-simple-history.
+    """
+    # model_name do modelo (ex.: 'veiculo') e id do objeto
+    tabela = models.CharField(max_length=40)
+    objeto_id = models.IntegerField()
+
+    history_date = models.DateTimeField()
+    history_type = models.CharField(max_length=1, default='~')
+    history_user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_constraint=False,
+        related_name='+'
+    )
+    history_change_reason = models.CharField(max_length=100, null=True, blank=True)
+
+    # {attname: valor} dos campos alterados
+    campos = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tabela', 'objeto_id', 'history_date']),
+            models.Index(fields=['-history_date', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.tabela} #{self.objeto_id} em {self.history_date:%d/%m/%Y %H:%M}"
+
+
+class DocumentoBusca(models.Model):
+    """
+    Documento da busca global (controle/busca.py): uma linha por veículo,
+    condutor, multa, termo ou abastecimento, com o texto normalizado de
+    tudo o que identifica o objeto. Mantido pelos signals de cada modelo.
+    """
+    tipo = models.CharField(max_length=20)
+    objeto_id = models.BigIntegerField()
+    # Ordem dos tipos quando a relevância empata (veículo primeiro)
+    prioridade = models.PositiveSmallIntegerField(default=0)
+
+    # Identificador principal normalizado (placa, CPF, auto de infração)
+    chave = models.CharField(max_length=100, blank=True, db_index=True)
+    texto = models.TextField()
+
+    titulo = models.CharField(max_length=200)
+    subtitulo = models.CharField(max_length=255, blank=True)
+    url = models.CharField(max_length=200)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='documento_busca_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.objeto_id}: {self.titulo}"
@@ -0,0 +1,187 @@
+"""
+Paginação por cursor (keyset) para as listas do sistema.
+
+Em vez de OFFSET, cada página guarda no parâmetro "cursor" os valores das
+colunas de ordenação do último (ou primeiro) item exibido, e a página
+seguinte é buscada com WHERE (colunas) > (valores). Com um índice sobre
+as colunas de ordenação, o custo de qualquer página é o mesmo com mil ou
+um milhão de linhas.
+
+Uso na view:
+
+    pagina = paginar(request, queryset, ORDENACOES_VEICULO, padrao='placa')
+    contexto = {"veiculo": pagina, "pagina": pagina}
+
+e no template: {% include "controle/paginacao.html" %}
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+TAMANHO_PADRAO = 24
+TAMANHO_MAXIMO = 100
+
+PROXIMA = 'p'
+ANTERIOR = 'a'
+
+
+class Ordenacao:
+    """
+    Ordenação disponível para uma lista: rótulo exibido e campos do model.
+    A chave primária é acrescentada no fim para desempatar e tornar a
+    ordem estável. Só campos do próprio model e não nulos.
+    """
+
+    def __init__(self, rotulo, *campos):
+        self.rotulo = rotulo
+        nomes = [c.lstrip('-') for c in campos]
+        if 'pk' not in nomes and 'id' not in nomes:
+            campos += ('-pk' if campos[-1].startswith('-') else 'pk',)
+        self.campos = campos
+
+    def invertida(self):
+        return tuple(c[1:] if c.startswith('-') else f'-{c}' for c in self.campos)
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder corta datas em milissegundos; o cursor precisa do valor exato
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def codificar_cursor(direcao, ordenar, valores):
+    """
+    Valor do parâmetro "cursor": direção (PROXIMA/ANTERIOR), chave da
+    ordenação e os valores das colunas de ordenação do item de referência,
+    em JSON e base64 para caber na URL. Lido por decodificar_cursor().
+    """
+    dados = json.dumps([direcao, ordenar, valores], cls=_CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, ordenar, conversores):
+    """
+    Inverso de codificar_cursor(). Devolve (direcao, valores) ou None se o
+    cursor for inválido ou de outra ordenação. conversores: uma função por
+    valor (ex.: campo.to_python).
+    """
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direcao, ordenar_cursor, valores = json.loads(dados)
+        if direcao not in (PROXIMA, ANTERIOR) or ordenar_cursor != ordenar or len(valores) != len(conversores):
+            return None
+        return direcao, [converter(valor) for converter, valor in zip(conversores, valores)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _campo(model, campo):
+    nome = campo.lstrip('-')
+    return model._meta.pk if nome == 'pk' else model._meta.get_field(nome)
+
+
+def _valores(objeto, campos):
+    return [getattr(objeto, _campo(type(objeto), c).attname) for c in campos]
+
+
+def depois_de(campos, valores):
+    """
+    Filtro dos itens depois de valores na ordem de campos, para usar com
+    order_by(*campos). (a, b, pk) > (x, y, z) respeitando a direção de cada
+    campo: a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)
+    """
+    condicao = Q()
+    iguais = Q()
+    for campo, valor in zip(campos, valores):
+        nome = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        condicao |= iguais & Q(**{f'{nome}__{operador}': valor})
+        iguais &= Q(**{nome: valor})
+    return condicao
+
+
+class Pagina:
+    """Itens de uma página e os links para a anterior e a próxima."""
+
+    def __init__(self, itens, request, ordenar, ordenacoes, tamanho):
+        self.itens = itens
+        self.ordenar = ordenar
+        self.ordenacoes = [(chave, o.rotulo) for chave, o in ordenacoes.items()]
+        self.tamanho = tamanho
+        self.url_anterior = None
+        self.url_proxima = None
+        self._request = request
+        self._campos = ordenacoes[ordenar].campos
+
+    def _url(self, direcao, objeto):
+        parametros = self._request.GET.copy()
+        parametros['cursor'] = codificar_cursor(direcao, self.ordenar, _valores(objeto, self._campos))
+        return f"?{parametros.urlencode()}"
+
+    @property
+    def tem_outras_paginas(self):
+        return bool(self.url_anterior or self.url_proxima)
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def __bool__(self):
+        return bool(self.itens)
+
+
+def tamanho_pagina(request, padrao=TAMANHO_PADRAO):
+    try:
+        tamanho = int(request.GET.get('por_pagina', padrao))
+    except ValueError:
+        tamanho = padrao
+    return max(1, min(tamanho, TAMANHO_MAXIMO))
+
+
+def paginar(request, queryset, ordenacoes, padrao=None, tamanho=TAMANHO_PADRAO):
+    """
+    Aplica ordenação (?ordenar=) e paginação por cursor (?cursor=) ao queryset.
+    Os demais parâmetros da URL (filtros) são mantidos nos links.
+    """
+    ordenar = request.GET.get('ordenar')
+    if ordenar not in ordenacoes:
+        ordenar = padrao or next(iter(ordenacoes))
+    ordenacao = ordenacoes[ordenar]
+    campos = ordenacao.campos
+    tamanho = tamanho_pagina(request, tamanho)
+
+    cursor = request.GET.get('cursor')
+    conversores = [_campo(queryset.model, c).to_python for c in campos]
+    posicao = decodificar_cursor(cursor, ordenar, conversores) if cursor else None
+
+    if posicao and posicao[0] == ANTERIOR:
+        # Página anterior: percorre na ordem inversa e desvira o resultado
+        invertidos = ordenacao.invertida()
+        itens = list(
+            queryset.filter(depois_de(invertidos, posicao[1])).order_by(*invertidos)[:tamanho + 1]
+        )
+        ha_mais = len(itens) > tamanho
+        itens = itens[:tamanho][::-1]
+        tem_anterior, tem_proxima = ha_mais, True
+    else:
+        if posicao:
+            queryset = queryset.filter(depois_de(campos, posicao[1]))
+        itens = list(queryset.order_by(*campos)[:tamanho + 1])
+        ha_mais = len(itens) > tamanho
+        itens = itens[:tamanho]
+        tem_anterior, tem_proxima = posicao is not None, ha_mais
+
+    pagina = Pagina(itens, request, ordenar, ordenacoes, tamanho)
+    if itens and tem_anterior:
+        pagina.url_anterior = pagina._url(ANTERIOR, itens[0])
+    if itens and tem_proxima:
+        pagina.url_proxima = pagina._url(PROXIMA, itens[-1])
+    return pagina
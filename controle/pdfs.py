@@ -0,0 +1,243 @@
+"""
+Cache dos PDFs gerados pelo sistema (memorando da multa e termo de
+responsabilidade). A geração em si fica em renderizacao.py.
+
+Renderizar o HTML do template é barato; o caro é o WeasyPrint. Por isso o
+HTML é renderizado sempre e o seu hash SHA-256 vira o nome do PDF no
+storage: o HTML já reflete a versão do template e todos os campos usados
+(multa, veículo, conta, termo...). Se o arquivo com esse hash existe, é
+servido direto; qualquer edição ou mudança no template gera um hash novo
+e, portanto, um PDF novo.
+"""
+import hashlib
+import io
+import zipfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+from django.utils.text import slugify
+from pypdf import PdfWriter
+
+from .models import Multa, TermoResponsabilidade
+from .renderizacao import renderizar_pdf, renderizar_varios
+
+# Multas renderizadas por rodada no pool (geração em lote)
+LOTE_RENDERIZACAO = 32
+
+# Aumentar quando mudar algo que afete o PDF e não o HTML (ex.: versão do WeasyPrint)
+VERSAO = '1'
+
+PASTA_MEMORANDOS = 'documentos/multas/memorandos/gerados/'
+PASTA_TERMOS = 'documentos/veiculos/termo/gerados/'
+
+
+def _hash(html):
+    return hashlib.sha256(f"{VERSAO}\n{html}".encode()).hexdigest()
+
+
+def _salvar_pdf(caminho, conteudo):
+    nome = default_storage.save(caminho, ContentFile(conteudo))
+    if nome != caminho:
+        # Outra requisição gravou o mesmo PDF ao mesmo tempo
+        default_storage.delete(nome)
+
+
+def _obter_pdf(caminho, gerar):
+    """Devolve o caminho do PDF no storage, gerando-o apenas se ainda não existe."""
+    if not default_storage.exists(caminho):
+        _salvar_pdf(caminho, gerar())
+    return caminho
+
+
+# ==================================================
+# ================= MEMORANDO ======================
+# ==================================================
+
+def html_memorando(multa):
+    return render_to_string("controle/memorando.html", {"multa": multa})
+
+
+def pdf_memorando(multa):
+    """
+    Caminho do memorando da multa no storage (gerado se necessário).
+    Também preenche Multa.memorando, salvo se o usuário enviou um arquivo próprio.
+    """
+    html = html_memorando(multa)
+    caminho = _obter_pdf(_caminho_memorando(html), lambda: renderizar_pdf(html))
+    _vincular_memorando(multa, caminho)
+    return caminho
+
+
+def _caminho_memorando(html):
+    return f"{PASTA_MEMORANDOS}{_hash(html)}.pdf"
+
+
+def _vincular_memorando(multa, caminho):
+    anterior = multa.memorando.name if multa.memorando else ''
+    if anterior != caminho and (not anterior or anterior.startswith(PASTA_MEMORANDOS)):
+        # update() para não gerar histórico nem passar pelo full_clean do save()
+        Multa.objects.filter(pk=multa.pk).update(memorando=caminho)
+        multa.memorando.name = caminho
+        if anterior and not Multa.objects.filter(memorando=anterior).exists():
+            default_storage.delete(anterior)
+
+
+# ==================================================
+# ================== TERMO =========================
+# ==================================================
+
+def _html_termo(termo, assinatura):
+    return render_to_string("controle/termo_responsabilidade.html", {
+        'motorista': termo.motorista,
+        'veiculo': termo.veiculo,
+        'data_hoje': termo.data_assinatura.strftime("%d/%m/%Y"),
+        'assinatura': assinatura,
+    })
+
+
+def html_termo(termo):
+    # A assinatura é resolvida pelo url_fetcher a partir do storage
+    return _html_termo(termo, termo.arquivo.url)
+
+
+def pdf_termo(termo):
+    """Caminho do termo de responsabilidade no storage (gerado se necessário)."""
+    html = html_termo(termo)
+    return _obter_pdf(f"{PASTA_TERMOS}{_hash(html)}.pdf", lambda: renderizar_pdf(html))
+
+
+def caminhos_atuais():
+    """Caminhos dos PDFs que correspondem ao estado atual dos dados (para limpeza)."""
+    caminhos = set()
+    for multa in Multa.objects.select_related('veiculo', 'infracao', 'conta_pagamento').iterator():
+        caminhos.add(_caminho_memorando(html_memorando(multa)))
+    for termo in TermoResponsabilidade.objects.exclude(arquivo='').exclude(arquivo=None).select_related(
+        'veiculo__setor', 'motorista'
+    ).iterator():
+        caminhos.add(f"{PASTA_TERMOS}{_hash(html_termo(termo))}.pdf")
+    return caminhos
+
+
+# ==================================================
+# ============ MEMORANDOS EM LOTE ==================
+# ==================================================
+
+def gerar_memorandos(multas, progresso=None):
+    """
+    Gera os memorandos de várias multas, renderizando em paralelo no pool
+    apenas os que ainda não estão no cache. A falha de uma multa não
+    interrompe as demais. progresso(feitos, total) é chamado a cada rodada.
+    Devolve [(multa, caminho ou exceção)] na ordem das multas.
+    """
+    multas = list(multas.select_related('veiculo', 'infracao', 'conta_pagamento'))
+    resultados = []
+    for inicio in range(0, len(multas), LOTE_RENDERIZACAO):
+        lote = multas[inicio:inicio + LOTE_RENDERIZACAO]
+        pendentes = []
+        for multa in lote:
+            try:
+                html = html_memorando(multa)
+            except Exception as erro:
+                resultados.append((multa, erro))
+                continue
+            caminho = _caminho_memorando(html)
+            resultados.append((multa, caminho))
+            if not default_storage.exists(caminho):
+                pendentes.append((len(resultados) - 1, html))
+
+        pdfs = renderizar_varios([html for _, html in pendentes])
+        for (posicao, _), pdf in zip(pendentes, pdfs):
+            multa, caminho = resultados[posicao]
+            if isinstance(pdf, Exception):
+                resultados[posicao] = (multa, pdf)
+            else:
+                _salvar_pdf(caminho, pdf)
+
+        for multa, caminho in resultados[inicio:]:
+            if not isinstance(caminho, Exception):
+                _vincular_memorando(multa, caminho)
+        if progresso:
+            progresso(len(resultados), len(multas))
+    return resultados
+
+
+def _por_setor(resultados):
+    setores = {}
+    for multa, caminho in resultados:
+        if not isinstance(caminho, Exception):
+            setores.setdefault(multa.setor_nome or 'sem-setor', []).append(caminho)
+    return setores
+
+
+def nome_arquivo_setor(setor):
+    return f"memorandos_{slugify(setor) or 'sem-setor'}.pdf"
+
+
+def unir_pdfs(caminhos):
+    """Concatena os PDFs do storage em um só (bytes)."""
+    escritor = PdfWriter()
+    for caminho in caminhos:
+        with default_storage.open(caminho, 'rb') as f:
+            escritor.append(f)
+    saida = io.BytesIO()
+    escritor.write(saida)
+    escritor.close()
+    return saida.getvalue()
+
+
+def pdfs_por_setor(resultados):
+    """{nome do arquivo: [caminhos]} com um PDF unificado por setor."""
+    return {nome_arquivo_setor(setor): caminhos for setor, caminhos in _por_setor(resultados).items()}
+
+
+def _falhas(resultados):
+    return [
+        f"Multa {multa.pk} ({multa.veiculo.placa}): {caminho}"
+        for multa, caminho in resultados
+        if isinstance(caminho, Exception)
+    ]
+
+
+class _Saida:
+    """Arquivo só de escrita que acumula bytes para um gerador (zip sem seek)."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados, self.partes = b''.join(self.partes), []
+        return dados
+
+
+def zip_memorandos(resultados, unificar=False):
+    """
+    Gera o ZIP em partes (para StreamingHttpResponse): um PDF por multa em
+    pastas por setor ou, com unificar=True, um PDF por setor. As multas com
+    falha são listadas em falhas.txt.
+    """
+    saida = _Saida()
+    with zipfile.ZipFile(saida, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+        if unificar:
+            for nome, caminhos in pdfs_por_setor(resultados).items():
+                arquivo_zip.writestr(nome, unir_pdfs(caminhos))
+                yield saida.esvaziar()
+        else:
+            for multa, caminho in resultados:
+                if isinstance(caminho, Exception):
+                    continue
+                pasta = slugify(multa.setor_nome or '') or 'sem-setor'
+                with default_storage.open(caminho, 'rb') as origem:
+                    arquivo_zip.writestr(f"{pasta}/memorando_{multa.pk}.pdf", origem.read())
+                yield saida.esvaziar()
+        falhas = _falhas(resultados)
+        if falhas:
+            arquivo_zip.writestr('falhas.txt', "\n".join(falhas))
+    yield saida.esvaziar()
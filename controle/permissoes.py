@@ -0,0 +1,84 @@
+"""
+Autorização sem consultas repetidas.
+
+Os nomes dos grupos do usuário são lidos do banco uma vez e guardados em
+dois níveis: no próprio objeto (request.user vive só durante a requisição)
+e no cache, por usuário, sob um carimbo de versão. Mudanças de participação
+(user.groups) apagam a entrada dos usuários afetados; renomear ou excluir
+um grupo troca o carimbo, invalidando todas de uma vez (controle/signals.py).
+
+O carimbo é o instante em nanossegundos, como em cache_modelos.versoes: se
+o cache o expulsar, o próximo é novo e nunca devolve à vida as entradas de
+um carimbo antigo. As entradas também expiram sozinhas em TEMPO_GRUPOS.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+ADMINISTRADOR = 'Administrador'
+CHAVE_VERSAO = 'controle:grupos:versao'
+TEMPO_GRUPOS = getattr(settings, 'PERMISSOES_TEMPO_GRUPOS', 15 * 60)  # segundos
+
+
+def _versao():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, time.time_ns(), None)
+        versao = cache.get(CHAVE_VERSAO)
+    # Expulso de novo entre o add e o get: um carimbo só desta leitura
+    return time.time_ns() if versao is None else versao
+
+
+def _no_commit(funcao):
+    """Roda agora e, dentro de uma transação, de novo no commit (como cache_modelos._trocar)."""
+    funcao()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(funcao)
+
+
+def _chave(user_id):
+    return f"controle:grupos:{_versao()}:{user_id}"
+
+
+def grupos(user):
+    """Conjunto com os nomes dos grupos do usuário (vazio para anônimos)."""
+    if not user.is_authenticated:
+        return frozenset()
+    nomes = getattr(user, '_grupos_controle', None)
+    if nomes is None:
+        chave = _chave(user.pk)
+        nomes = cache.get(chave)
+        if nomes is None:
+            nomes = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(chave, nomes, TEMPO_GRUPOS)
+        user._grupos_controle = nomes
+    return nomes
+
+
+def tem_grupo(user, nome):
+    return nome in grupos(user)
+
+
+def invalidar_usuarios(user_ids):
+    """Descarta os grupos guardados desses usuários (participação mudou)."""
+    user_ids = list(user_ids)
+    _no_commit(lambda: cache.delete_many([_chave(user_id) for user_id in user_ids]))
+
+
+def invalidar_todos():
+    """Troca o carimbo de versão: todas as entradas deixam de valer."""
+    _no_commit(lambda: cache.set(CHAVE_VERSAO, time.time_ns(), None))
+
+
+# ==================================================
+# ================== VEÍCULOS ======================
+# ==================================================
+
+def pode_alterar_veiculo(user, veiculo):
+    """
+    Quem cadastrou o veículo ou um superusuário. Compara pela chave
+    estrangeira, sem carregar o usuário criador.
+    """
+    return user.is_superuser or (user.is_authenticated and veiculo.created_by_id == user.pk)
@@ -0,0 +1,148 @@
+"""
+Pontos na CNH dos últimos 12 meses, por motorista.
+
+Motorista.pontos_cnh é um acumulador: cada multa guarda quantos pontos
+seus estão somados nele (pontos_vigentes) e em qual motorista
+(pontos_motorista). conciliar() compara isso com o que deveria estar
+valendo (pontos da infração, para o motorista da multa, se a infração está
+na janela de 12 meses) e aplica só a diferença, com UPDATE ... SET
+pontos_cnh = pontos_cnh + n. Criar, reatribuir, mudar a infração ou excluir
+uma multa custa uma consulta e alguns UPDATEs, sem somar o histórico.
+
+A janela anda sozinha: expirar_pontos (diário) concilia só as multas com
+pontos ainda contados que ficaram mais velhas que 12 meses, pelo índice
+parcial multa_pontos_vigentes_idx.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Motorista, Multa
+
+TAMANHO_LOTE = 1000
+
+
+def inicio_janela(agora=None):
+    """Instante a partir do qual (exclusive) as infrações ainda contam pontos: 12 meses atrás."""
+    agora = agora or timezone.now()
+    try:
+        return agora.replace(year=agora.year - 1)
+    except ValueError:  # 29 de fevereiro
+        return agora.replace(year=agora.year - 1, day=28)
+
+
+def _somar(deltas):
+    """Aplica {motorista_id: +/- pontos} num UPDATE só."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    Motorista.objects.filter(pk__in=deltas).update(pontos_cnh=F('pontos_cnh') + Case(
+        *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+def conciliar(multa_ids, agora=None):
+    """Acerta o acumulador para as multas informadas. Devolve quantas mudaram."""
+    from .cache_modelos import invalidar_pks
+
+    corte = inicio_janela(agora)
+    deltas = Counter()
+    alteradas = []
+    with transaction.atomic():
+        linhas = (
+            Multa.objects.select_for_update(of=('self',)).filter(pk__in=multa_ids)
+            .values_list('pk', 'motorista_id', 'infracao__pontos', 'data_hora_infracao',
+                         'pontos_motorista_id', 'pontos_vigentes')
+        )
+        for pk, motorista_id, pontos, data, motorista_anterior, pontos_anteriores in linhas:
+            vigentes = (pontos or 0) if motorista_id and data > corte else 0
+            beneficiado = motorista_id if vigentes else None
+            if (beneficiado, vigentes) == (motorista_anterior, pontos_anteriores):
+                continue
+            if motorista_anterior:
+                deltas[motorista_anterior] -= pontos_anteriores
+            if beneficiado:
+                deltas[beneficiado] += vigentes
+            alteradas.append(Multa(pk=pk, pontos_motorista_id=beneficiado, pontos_vigentes=vigentes))
+        Multa.objects.bulk_update(alteradas, ['pontos_motorista', 'pontos_vigentes'])
+        _somar(deltas)
+    if deltas:
+        invalidar_pks('motorista', deltas)
+    return len(alteradas)
+
+
+def pontuar_novas(multas, pontos_infracao, agora=None):
+    """
+    Multas ainda não gravadas, para bulk_create (sem signals): preenche
+    pontos_vigentes/pontos_motorista como conciliar() faria, a partir de
+    {infracao_id: pontos}. Devolve {motorista_id: pontos} para somar().
+    """
+    corte = inicio_janela(agora)
+    deltas = Counter()
+    for multa in multas:
+        vigentes = pontos_infracao.get(multa.infracao_id) or 0
+        if not multa.motorista_id or multa.data_hora_infracao <= corte:
+            vigentes = 0
+        multa.pontos_vigentes = vigentes
+        multa.pontos_motorista_id = multa.motorista_id if vigentes else None
+        if vigentes:
+            deltas[multa.motorista_id] += vigentes
+    return deltas
+
+
+def somar(deltas):
+    """Soma nos acumuladores os pontos devolvidos por pontuar_novas()."""
+    from .cache_modelos import invalidar_pks
+
+    _somar(deltas)
+    if deltas:
+        invalidar_pks('motorista', deltas)
+
+
+def descontar(multa_id):
+    """Multa sendo excluída (pre_delete, na mesma transação): tira os pontos que ela ainda somava."""
+    gravado = Multa.objects.filter(pk=multa_id).values_list('pontos_motorista_id', 'pontos_vigentes').first()
+    if gravado and gravado[0] and gravado[1]:
+        _somar({gravado[0]: -gravado[1]})
+
+
+def expirar(agora=None, tamanho_lote=TAMANHO_LOTE):
+    """Tira do acumulador as multas que saíram da janela de 12 meses. Devolve quantas."""
+    corte = inicio_janela(agora)
+    total = 0
+    while True:
+        ids = list(
+            Multa.objects.filter(pontos_vigentes__gt=0, data_hora_infracao__lte=corte)
+            .order_by('data_hora_infracao').values_list('pk', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            return total
+        total += conciliar(ids, agora)
+
+
+def recalcular_totais():
+    """Refaz Motorista.pontos_cnh somando pontos_vigentes das multas (conferência, não rotina)."""
+    soma = (
+        Multa.objects.filter(pontos_motorista=OuterRef('pk')).order_by()
+        .values('pontos_motorista').annotate(total=Sum('pontos_vigentes')).values('total')
+    )
+    return Motorista.objects.update(pontos_cnh=Coalesce(Subquery(soma), Value(0)))
+
+
+def conciliar_todas(multas=None, tamanho_lote=TAMANHO_LOTE):
+    """Concilia as multas (todas, por padrão) em lotes. Devolve quantas mudaram."""
+    ids = (Multa.objects.all() if multas is None else multas).order_by('pk').values_list('pk', flat=True)
+    lote, total = [], 0
+    for pk in ids.iterator(chunk_size=tamanho_lote):
+        lote.append(pk)
+        if len(lote) == tamanho_lote:
+            total += conciliar(lote)
+            lote = []
+    if lote:
+        total += conciliar(lote)
+    return total
@@ -0,0 +1,158 @@
+"""
+Quitação de multas em lote.
+
+O financeiro envia um ZIP com os comprovantes, cada arquivo com o nome do
+auto de infração ou do id da multa (A-123456.pdf, 42.pdf), e as multas do
+lote. Os nomes são casados em memória com as multas (uma consulta), os
+arquivos vão para o storage e as multas casadas passam a "pago" numa
+transação, com bulk_update e os deltas do histórico em lote, sem o
+full_clean() e o save() de cada uma. O que não casar volta no resultado.
+"""
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .busca import so_alfanumericos
+from .models import Multa
+
+EXTENSOES = ('.pdf', '.jpg', '.jpeg', '.png')
+TAMANHO_MAXIMO = getattr(settings, 'QUITACAO_TAMANHO_MAXIMO', 10 * 1024 * 1024)  # bytes por comprovante
+
+
+class ResultadoQuitacao:
+    """Multas quitadas, arquivos recusados e multas do lote que ficaram sem comprovante."""
+
+    def __init__(self):
+        self.quitadas = []         # (multa_id, auto_infracao, arquivo)
+        self.recusados = []        # (arquivo, motivo)
+        self.sem_comprovante = []  # (multa_id, auto_infracao)
+
+    def recusar(self, arquivo, motivo):
+        self.recusados.append((arquivo, motivo))
+
+    def __str__(self):
+        return (
+            f"{len(self.quitadas)} quitadas, {len(self.recusados)} arquivos recusados, "
+            f"{len(self.sem_comprovante)} multas sem comprovante"
+        )
+
+
+def _arquivos(zip_comprovantes):
+    """ZipInfo dos arquivos do ZIP, sem pastas e sem os arquivos ocultos do macOS/Windows."""
+    for info in zip_comprovantes.infolist():
+        nome = os.path.basename(info.filename)
+        if info.is_dir() or not nome or nome.startswith('.') or info.filename.startswith('__MACOSX/'):
+            continue
+        yield info, nome
+
+
+def casar(zip_comprovantes, candidatas, resultado):
+    """
+    {multa_id: (ZipInfo, nome)} dos comprovantes que casam com as multas
+    pendentes de candidatas ({id: (auto_infracao, status_pagamento)}). O
+    nome do arquivo vale primeiro como auto de infração, depois como id.
+    """
+    por_auto = {}
+    for pk, (auto_infracao, _) in candidatas.items():
+        chave = so_alfanumericos(auto_infracao)
+        if chave:
+            # Auto repetido no lote: o nome do arquivo não decide
+            por_auto[chave] = None if chave in por_auto else pk
+
+    casados = {}
+    for info, nome in _arquivos(zip_comprovantes):
+        base, extensao = os.path.splitext(nome)
+        if extensao.lower() not in EXTENSOES:
+            resultado.recusar(nome, f"extensão não aceita (use {', '.join(EXTENSOES)})")
+            continue
+        if info.file_size > TAMANHO_MAXIMO:
+            resultado.recusar(nome, "arquivo grande demais")
+            continue
+        chave = so_alfanumericos(base)
+        if chave in por_auto:
+            pk = por_auto[chave]
+            if pk is None:
+                resultado.recusar(nome, "mais de uma multa do lote com esse auto de infração")
+                continue
+        elif base.strip().isdigit() and int(base) in candidatas:
+            pk = int(base)
+        else:
+            resultado.recusar(nome, "nenhuma multa do lote com esse auto de infração ou id")
+            continue
+        if candidatas[pk][1] == 'pago':
+            resultado.recusar(nome, f"multa #{pk} já está paga")
+        elif pk in casados:
+            resultado.recusar(nome, f"outro comprovante já casou com a multa #{pk} ({casados[pk][1]})")
+        else:
+            casados[pk] = (info, nome)
+    return casados
+
+
+def quitar_em_lote(arquivo_zip, multas, usuario=None):
+    """
+    Quita as multas do queryset com os comprovantes do ZIP. Devolve um
+    ResultadoQuitacao; levanta zipfile.BadZipFile se o arquivo não for ZIP.
+    """
+    from .cache_modelos import invalidar, invalidar_pks
+    from .historico import registrar_alteracoes
+
+    resultado = ResultadoQuitacao()
+    candidatas, veiculos = {}, {}
+    for pk, auto_infracao, status, veiculo_id in multas.order_by().values_list(
+        'pk', 'auto_infracao', 'status_pagamento', 'veiculo_id'
+    ):
+        candidatas[pk] = (auto_infracao or '', status)
+        veiculos[pk] = veiculo_id
+
+    campo = Multa._meta.get_field('comprovante_pagamento')
+    gravados = {}
+    with zipfile.ZipFile(arquivo_zip) as zip_comprovantes:
+        casados = casar(zip_comprovantes, candidatas, resultado)
+        try:
+            for pk, (info, nome) in casados.items():
+                gravados[pk] = default_storage.save(
+                    campo.generate_filename(None, nome), ContentFile(zip_comprovantes.read(info))
+                )
+
+            with transaction.atomic():
+                # Só as que continuam pendentes (outra quitação pode ter corrido no meio)
+                pendentes = set(
+                    Multa.objects.select_for_update().filter(pk__in=gravados, status_pagamento='pendente')
+                    .values_list('pk', flat=True)
+                )
+                Multa.objects.bulk_update(
+                    [Multa(pk=pk, status_pagamento='pago', comprovante_pagamento=gravados[pk]) for pk in pendentes],
+                    ['status_pagamento', 'comprovante_pagamento'],
+                    batch_size=500,
+                )
+                # bulk_update não dispara signals nem histórico
+                registrar_alteracoes(
+                    Multa,
+                    {pk: {'status_pagamento': 'pago', 'comprovante_pagamento': gravados[pk]} for pk in pendentes},
+                    usuario=usuario,
+                    motivo="Quitação em lote",
+                )
+        except Exception:
+            for caminho in gravados.values():
+                default_storage.delete(caminho)
+            raise
+
+    for pk, caminho in gravados.items():
+        if pk in pendentes:
+            resultado.quitadas.append((pk, candidatas[pk][0], casados[pk][1]))
+        else:
+            default_storage.delete(caminho)
+            resultado.recusar(casados[pk][1], f"multa #{pk} foi paga durante a quitação")
+    resultado.sem_comprovante = [
+        (pk, auto_infracao) for pk, (auto_infracao, status) in candidatas.items()
+        if status == 'pendente' and pk not in casados
+    ]
+
+    if pendentes:
+        invalidar('multa', pendentes)
+        invalidar_pks('veiculo', {veiculos[pk] for pk in pendentes})
+    return resultado
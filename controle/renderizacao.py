@@ -0,0 +1,228 @@
+"""
+Renderização de PDFs com WeasyPrint em processos dedicados.
+
+Cada chamada inline de HTML(...).write_pdf() recarrega fontes e estilos e,
+no memorando e no termo, baixava o logo da prefeitura do site oficial
+dentro da requisição. Aqui os PDFs são gerados por um pool de processos
+que ficam "quentes": cada worker mantém uma FontConfiguration e um cache
+em memória das imagens e CSS usados pelos templates. O url_fetcher
+resolve tudo localmente:
+
+- /static/...  -> arquivos estáticos do projeto (finders);
+- /media/...   -> default_storage (assinaturas, documentos);
+- URLs externas conhecidas (ASSETS_EXTERNOS) -> arquivo estático
+  equivalente. Nada é baixado: qualquer outra URL externa, ou um
+  equivalente ausente, faz a renderização falhar.
+
+Configuração (settings, todas opcionais):
+
+- PDF_WORKERS: número de processos (padrão: até 4). 0 renderiza no
+  próprio processo, útil em desenvolvimento.
+- PDF_TIMEOUT: segundos por PDF (padrão 30). No estouro só aquele PDF
+  falha com ErroRenderizacao; os demais do lote continuam nos outros
+  workers e, no fim do lote, o pool é trocado por um novo (o antigo
+  termina o que outras requisições já tinham enviado antes de ser
+  encerrado).
+"""
+import atexit
+import mimetypes
+import multiprocessing
+import os
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.storage import default_storage
+from weasyprint import HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+# Base fictícia para as URLs relativas dos templates; nunca acessada pela rede
+BASE_URL = 'https://fleetmanager.local/'
+
+# Imagens externas que templates antigos (ou sobrescritos) ainda podem
+# citar e o arquivo estático equivalente; os templates atuais usam {% static %}
+ASSETS_EXTERNOS = {
+    'https://www.laurodefreitas.ba.gov.br/site/LogoLauro_Horizontal1.jpg': 'controle/img/logo-prefeitura.png',
+}
+
+# Recicla os workers periodicamente (WeasyPrint acumula memória)
+TAREFAS_POR_WORKER = 200
+
+
+class ErroRenderizacao(Exception):
+    pass
+
+
+# ==================================================
+# ============ ASSETS (em cada worker) =============
+# ==================================================
+
+def _tipo(caminho):
+    return mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+
+
+@lru_cache(maxsize=256)
+def _carregar(url):
+    """(bytes, mime) do recurso, lido localmente. Fica em cache durante a vida do worker."""
+    caminho = url[len(BASE_URL) - 1:] if url.startswith(BASE_URL) else None
+
+    if caminho and caminho.startswith(settings.STATIC_URL):
+        arquivo = finders.find(caminho[len(settings.STATIC_URL):])
+        if not arquivo:
+            raise ErroRenderizacao(f"Arquivo estático não encontrado: {caminho}")
+        with open(arquivo, 'rb') as f:
+            return f.read(), _tipo(arquivo)
+
+    if caminho and caminho.startswith(settings.MEDIA_URL):
+        nome = caminho[len(settings.MEDIA_URL):]
+        with default_storage.open(nome, 'rb') as f:
+            return f.read(), _tipo(nome)
+
+    if url in ASSETS_EXTERNOS:
+        arquivo = finders.find(ASSETS_EXTERNOS[url])
+        if not arquivo:
+            raise ErroRenderizacao(f"Equivalente estático de {url} não encontrado: {ASSETS_EXTERNOS[url]}")
+        with open(arquivo, 'rb') as f:
+            return f.read(), _tipo(arquivo)
+
+    raise ErroRenderizacao(f"Recurso externo não permitido no PDF: {url}")
+
+
+# Recursos recusados no PDF em andamento. O WeasyPrint só registra no log a
+# imagem que o url_fetcher não entregou; _renderizar levanta o erro depois.
+_recusados = threading.local()
+
+
+def url_fetcher(url, *args, **kwargs):
+    if url.startswith('data:'):
+        return default_url_fetcher(url, *args, **kwargs)
+    try:
+        conteudo, mime = _carregar(url)
+    except ErroRenderizacao as erro:
+        getattr(_recusados, 'erros', []).append(erro)
+        raise
+    return {'string': conteudo, 'mime_type': mime, 'redirected_url': url}
+
+
+# ==================================================
+# ==================== WORKERS =====================
+# ==================================================
+
+_fontes = None
+
+
+def _iniciar_worker():
+    global _fontes
+    import django
+    django.setup()
+    _fontes = FontConfiguration()
+
+
+def _renderizar(html):
+    """Gera o PDF no processo atual, reaproveitando fontes e assets."""
+    global _fontes
+    if _fontes is None:
+        _fontes = FontConfiguration()
+    _recusados.erros = []
+    try:
+        pdf = HTML(string=html, base_url=BASE_URL, url_fetcher=url_fetcher).write_pdf(font_config=_fontes)
+    finally:
+        erros, _recusados.erros = _recusados.erros, []
+    if erros:
+        raise erros[0]
+    return pdf
+
+
+def _quantidade_workers():
+    return getattr(settings, 'PDF_WORKERS', min(4, os.cpu_count() or 1))
+
+
+_pool = None
+_trava = threading.Lock()
+
+
+def _obter_pool():
+    global _pool
+    with _trava:
+        if _pool is None:
+            # spawn: não herda conexões nem travas do processo do servidor
+            contexto = multiprocessing.get_context('spawn')
+            _pool = contexto.Pool(
+                _quantidade_workers(),
+                initializer=_iniciar_worker,
+                maxtasksperchild=TAREFAS_POR_WORKER,
+            )
+            atexit.register(encerrar_pool)
+        return _pool
+
+
+def _reciclar_pool(pool, espera):
+    """
+    Tira o pool de uso (as próximas chamadas criam outro) e o encerra
+    depois de `espera` segundos: as tarefas de outras requisições ainda
+    em andamento terminam, e o worker travado é morto no fim.
+    """
+    global _pool
+    with _trava:
+        if _pool is pool:
+            _pool = None
+    pool.close()
+    encerramento = threading.Timer(espera, pool.terminate)
+    encerramento.daemon = True
+    encerramento.start()
+
+
+def encerrar_pool():
+    """Finaliza os workers (comandos e testes)."""
+    global _pool
+    with _trava:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+def renderizar_pdf(html, timeout=None):
+    """Bytes do PDF do HTML informado."""
+    resultado = renderizar_varios([html], timeout)[0]
+    if isinstance(resultado, Exception):
+        raise resultado
+    return resultado
+
+
+def renderizar_varios(htmls, timeout=None):
+    """
+    Renderiza vários HTMLs em paralelo nos workers, na mesma ordem.
+    Cada item é o PDF (bytes) ou a exceção que impediu a sua geração.
+    """
+    timeout = timeout or getattr(settings, 'PDF_TIMEOUT', 30)
+    if _quantidade_workers() <= 0:
+        resultados = []
+        for html in htmls:
+            try:
+                resultados.append(_renderizar(html))
+            except Exception as erro:
+                resultados.append(erro)
+        return resultados
+
+    pool = _obter_pool()
+    tarefas = [pool.apply_async(_renderizar, (html,)) for html in htmls]
+    resultados, travados = [], 0
+    for tarefa in tarefas:
+        # Com todos os workers travados, as tarefas na fila não andam mais
+        if travados >= _quantidade_workers() and not tarefa.ready():
+            resultados.append(ErroRenderizacao("Geração do PDF cancelada: todos os workers travaram."))
+            continue
+        try:
+            resultados.append(tarefa.get(timeout))
+        except multiprocessing.TimeoutError:
+            # Só esta multa falha; um worker travado não pode ser
+            # interrompido isoladamente, então o pool é trocado no fim
+            travados += 1
+            resultados.append(ErroRenderizacao(f"Tempo limite de {timeout}s excedido na geração do PDF."))
+        except Exception as erro:
+            resultados.append(erro)
+    if travados:
+        _reciclar_pool(pool, timeout)
+    return resultados
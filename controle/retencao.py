@@ -0,0 +1,345 @@
+"""
+Retenção do histórico: o recente fica no banco, o antigo vai para arquivos
+mensais compactados no storage.
+
+Política por modelo (dias mantidos no banco) em settings.RETENCAO_HISTORICO,
+por exemplo {'veiculo': 365, 'multa': 730}. Modelos fora do dicionário usam
+RETENCAO_PADRAO; None desliga o arquivamento do modelo.
+
+Os registros anteriores ao primeiro dia do mês de corte (checkpoints das
+tabelas Historical* e deltas de AlteracaoHistorico) são gravados em
+historico/arquivo/<modelo>/<AAAA-MM>.jsonl.gz, uma linha JSON por
+registro, e depois apagados do banco em lotes pequenos, cada um na sua
+transação. Um arquivo já existente é mesclado (sem duplicar), então o
+processo pode ser repetido após uma interrupção.
+
+O histórico tem nomes, CPF e CNH: os arquivos ficam num storage próprio,
+fora do MEDIA_ROOT (que é servido publicamente), ver armazenamento().
+"""
+import gzip
+import io
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .historico import campos_rastreados, estado_em, serializar
+from .models import AlteracaoHistorico
+
+RETENCAO_PADRAO = 365
+PASTA_ARQUIVO = 'historico/'
+PASTA_MIDIA_ANTIGA = 'historico/arquivo/'  # onde os arquivos ficavam no default_storage
+TAMANHO_LOTE = 1000
+CHAVE_MESES = 'controle:retencao:meses'
+TEMPO_MESES = 10 * 60  # segundos
+
+
+def armazenamento():
+    """
+    Storage dos arquivos: o alias 'historico' de settings.STORAGES ou, sem
+    ele, a pasta settings.RETENCAO_PASTA (padrão BASE_DIR/arquivo_historico),
+    que não deve ficar dentro do MEDIA_ROOT.
+    """
+    if 'historico' in settings.STORAGES:
+        return storages['historico']
+    pasta = getattr(settings, 'RETENCAO_PASTA', None) or os.path.join(settings.BASE_DIR, 'arquivo_historico')
+    return FileSystemStorage(location=pasta)
+
+
+def dias_retencao(tabela):
+    return getattr(settings, 'RETENCAO_HISTORICO', {}).get(tabela, RETENCAO_PADRAO)
+
+
+def data_corte(tabela, hoje=None):
+    """Primeiro dia do mês que contém (hoje - retenção): só meses inteiros são arquivados."""
+    dias = dias_retencao(tabela)
+    if dias is None:
+        return None
+    limite = (hoje or timezone.localdate()) - timedelta(days=dias)
+    return timezone.make_aware(datetime(limite.year, limite.month, 1))
+
+
+def _caminho(tabela, mes):
+    return f"{PASTA_ARQUIVO}{tabela}/{mes:%Y-%m}.jsonl.gz"
+
+
+def _proximo_mes(mes):
+    return mes.replace(year=mes.year + 1, month=1) if mes.month == 12 else mes.replace(month=mes.month + 1)
+
+
+# ==================================================
+# ================= ARQUIVAMENTO ===================
+# ==================================================
+
+def _preservar_reconstrucao(model, corte):
+    """
+    Deltas recentes dependem do checkpoint anterior. Para objetos cujo
+    primeiro registro após o corte é um delta, esse delta vira uma cópia
+    completa (mesma data, usuário e motivo) antes de o passado ser arquivado.
+    """
+    tabela = model._meta.model_name
+    campos = campos_rastreados(model)
+    primeiros_deltas = dict(
+        AlteracaoHistorico.objects.filter(tabela=tabela, history_date__gte=corte)
+        .order_by().values('objeto_id').annotate(primeiro=Min('history_date')).values_list('objeto_id', 'primeiro')
+    )
+    primeiros_checkpoints = dict(
+        model.history.filter(history_date__gte=corte, id__in=list(primeiros_deltas)).order_by()
+        .values('id').annotate(primeiro=Min('history_date')).values_list('id', 'primeiro')
+    )
+    convertidos = 0
+    for objeto_id, data in primeiros_deltas.items():
+        checkpoint = primeiros_checkpoints.get(objeto_id)
+        if checkpoint is not None and checkpoint <= data:
+            continue
+        delta = AlteracaoHistorico.objects.filter(
+            tabela=tabela, objeto_id=objeto_id, history_date=data
+        ).order_by('id').first()
+        estado = estado_em(model, objeto_id, delta.history_date)
+        if estado is None:
+            continue
+        with transaction.atomic():
+            model.history.model.objects.create(
+                history_date=delta.history_date,
+                history_type=delta.history_type,
+                history_user_id=delta.history_user_id,
+                history_change_reason=delta.history_change_reason,
+                **{campo.attname: estado[campo.attname] for campo in campos},
+            )
+            delta.delete()
+        convertidos += 1
+    return convertidos
+
+
+def _linhas_do_mes(model, inicio, fim):
+    """Registros (checkpoints e deltas) do mês, já no formato do arquivo."""
+    campos = campos_rastreados(model)
+    checkpoints = model.history.filter(history_date__gte=inicio, history_date__lt=fim).order_by('history_id')
+    for registro in checkpoints.iterator(chunk_size=TAMANHO_LOTE):
+        yield {
+            'fonte': 'checkpoint',
+            'id': registro.history_id,
+            'objeto_id': registro.id,
+            'history_date': registro.history_date,
+            'history_type': registro.history_type,
+            'history_user_id': registro.history_user_id,
+            'history_change_reason': registro.history_change_reason,
+            'campos': {campo.attname: serializar(campo, getattr(registro, campo.attname)) for campo in campos},
+        }
+    deltas = AlteracaoHistorico.objects.filter(
+        tabela=model._meta.model_name, history_date__gte=inicio, history_date__lt=fim
+    ).order_by('id')
+    for delta in deltas.iterator(chunk_size=TAMANHO_LOTE):
+        yield {
+            'fonte': 'delta',
+            'id': delta.id,
+            'objeto_id': delta.objeto_id,
+            'history_date': delta.history_date,
+            'history_type': delta.history_type,
+            'history_user_id': delta.history_user_id,
+            'history_change_reason': delta.history_change_reason,
+            'campos': delta.campos,
+        }
+
+
+def _copia_nova(caminho):
+    return f"{caminho}.novo"
+
+
+def _recuperar(caminho):
+    """
+    Completa uma troca interrompida em _gravar_arquivo: a cópia nova
+    (sempre completa) vira o arquivo do mês se ele sumiu; se ele já foi
+    regravado, a cópia sobrando é descartada.
+    """
+    storage = armazenamento()
+    nova = _copia_nova(caminho)
+    if not storage.exists(nova):
+        return
+    if not storage.exists(caminho):
+        with storage.open(nova, 'rb') as arquivo:
+            storage.save(caminho, ContentFile(arquivo.read()))
+    storage.delete(nova)
+
+
+def _gravar_arquivo(caminho, linhas):
+    """
+    Grava (ou mescla com o existente) o arquivo do mês. Devolve os ids
+    gravados por fonte. Na mescla, o arquivo antigo só é apagado depois
+    que a cópia mesclada está salva: linhas de execuções anteriores só
+    existem no arquivo.
+    """
+    _recuperar(caminho)
+    storage = armazenamento()
+    gravados = {'checkpoint': [], 'delta': []}
+    vistos, novos = set(), 0
+    saida = io.BytesIO()
+    with gzip.GzipFile(fileobj=saida, mode='wb') as arquivo:
+        if storage.exists(caminho):
+            for linha in ler_arquivo(caminho):
+                vistos.add((linha['fonte'], linha['id']))
+                arquivo.write(json.dumps(linha, cls=DjangoJSONEncoder).encode() + b'\n')
+        for linha in linhas:
+            chave = (linha['fonte'], linha['id'])
+            gravados[linha['fonte']].append(linha['id'])
+            if chave in vistos:
+                continue
+            arquivo.write(json.dumps(linha, cls=DjangoJSONEncoder).encode() + b'\n')
+            vistos.add(chave)
+            novos += 1
+    if not novos:
+        return gravados
+    cache.delete(CHAVE_MESES)
+    if not storage.exists(caminho):
+        storage.save(caminho, ContentFile(saida.getvalue()))
+        return gravados
+    # O storage não troca arquivos atomicamente: a cópia nova fica salva
+    # antes de apagar o antigo, e _recuperar termina a troca se algo falhar
+    nova = storage.save(_copia_nova(caminho), ContentFile(saida.getvalue()))
+    storage.delete(caminho)
+    storage.save(caminho, ContentFile(saida.getvalue()))
+    storage.delete(nova)
+    return gravados
+
+
+def _apagar_em_lotes(consulta, campo, ids, tamanho_lote, pausa):
+    for inicio in range(0, len(ids), tamanho_lote):
+        with transaction.atomic():
+            consulta.filter(**{f'{campo}__in': ids[inicio:inicio + tamanho_lote]}).delete()
+        if pausa:
+            time.sleep(pausa)
+
+
+def arquivar(model, hoje=None, tamanho_lote=TAMANHO_LOTE, pausa=0, simular=False):
+    """
+    Arquiva os meses anteriores ao corte do modelo. Devolve
+    {'meses': [...], 'checkpoints': n, 'deltas': n, 'convertidos': n}.
+    """
+    tabela = model._meta.model_name
+    totais = {'meses': [], 'checkpoints': 0, 'deltas': 0, 'convertidos': 0}
+    corte = data_corte(tabela, hoje)
+    if corte is None:
+        return totais
+
+    antigos = [
+        model.history.filter(history_date__lt=corte).aggregate(m=Min('history_date'))['m'],
+        AlteracaoHistorico.objects.filter(tabela=tabela, history_date__lt=corte).aggregate(m=Min('history_date'))['m'],
+    ]
+    antigos = [d for d in antigos if d]
+    if not antigos:
+        return totais
+
+    if not simular:
+        totais['convertidos'] = _preservar_reconstrucao(model, corte)
+
+    primeira = timezone.localtime(min(antigos))
+    mes = timezone.make_aware(datetime(primeira.year, primeira.month, 1))
+    while mes < corte:
+        fim = _proximo_mes(mes)
+        if simular:
+            checkpoints = model.history.filter(history_date__gte=mes, history_date__lt=fim).count()
+            deltas = AlteracaoHistorico.objects.filter(
+                tabela=tabela, history_date__gte=mes, history_date__lt=fim
+            ).count()
+        else:
+            gravados = _gravar_arquivo(_caminho(tabela, mes), _linhas_do_mes(model, mes, fim))
+            _apagar_em_lotes(model.history.all(), 'history_id', gravados['checkpoint'], tamanho_lote, pausa)
+            _apagar_em_lotes(AlteracaoHistorico.objects.all(), 'id', gravados['delta'], tamanho_lote, pausa)
+            checkpoints, deltas = len(gravados['checkpoint']), len(gravados['delta'])
+        if checkpoints or deltas:
+            totais['meses'].append(f"{mes:%Y-%m}")
+            totais['checkpoints'] += checkpoints
+            totais['deltas'] += deltas
+        mes = fim
+    return totais
+
+
+# ==================================================
+# =================== LEITURA ======================
+# ==================================================
+
+def _ler(storage, caminho):
+    with storage.open(caminho, 'rb') as bruto:
+        with gzip.GzipFile(fileobj=bruto) as arquivo:
+            for linha in arquivo:
+                yield json.loads(linha)
+
+
+def ler_arquivo(caminho):
+    storage = armazenamento()
+    if not storage.exists(caminho) and storage.exists(_copia_nova(caminho)):
+        caminho = _copia_nova(caminho)  # troca interrompida (_recuperar)
+    return _ler(storage, caminho)
+
+
+def _listar_meses():
+    storage = armazenamento()
+    meses = set()
+    if not storage.exists(PASTA_ARQUIVO):
+        return []
+    for tabela in storage.listdir(PASTA_ARQUIVO)[0]:
+        for nome in storage.listdir(f"{PASTA_ARQUIVO}{tabela}/")[1]:
+            if nome.endswith(('.jsonl.gz', '.jsonl.gz.novo')):
+                meses.add(nome[:7])
+    return sorted(meses, reverse=True)
+
+
+def meses_arquivados():
+    """
+    Meses (AAAA-MM) com algum arquivo, do mais recente ao mais antigo. A
+    listagem das pastas fica TEMPO_MESES no cache (o filtro da tela de logs
+    a usa a cada carregamento); um mês novo arquivado a descarta.
+    """
+    meses = cache.get(CHAVE_MESES)
+    if meses is None:
+        meses = _listar_meses()
+        cache.set(CHAVE_MESES, meses, TEMPO_MESES)
+    return meses
+
+
+def registros_arquivados(mes, tabelas):
+    """
+    Registros arquivados do mês (AAAA-MM) das tabelas informadas, na ordem
+    do arquivo, com 'tabela' e a data já convertida. Lê só os arquivos pedidos.
+    """
+    storage = armazenamento()
+    inicio = date.fromisoformat(f"{mes}-01")
+    for tabela in tabelas:
+        caminho = _caminho(tabela, inicio)
+        if not storage.exists(caminho) and not storage.exists(_copia_nova(caminho)):
+            continue
+        for linha in ler_arquivo(caminho):
+            linha['tabela'] = tabela
+            linha['history_date'] = parse_datetime(linha['history_date'])
+            yield linha
+
+
+def mover_da_midia():
+    """
+    Leva para armazenamento() os arquivos gravados por versões anteriores
+    em PASTA_MIDIA_ANTIGA do default_storage (público) e os apaga de lá.
+    Devolve quantos foram movidos.
+    """
+    if not default_storage.exists(PASTA_MIDIA_ANTIGA):
+        return 0
+    movidos = 0
+    for tabela in default_storage.listdir(PASTA_MIDIA_ANTIGA)[0]:
+        for nome in default_storage.listdir(f"{PASTA_MIDIA_ANTIGA}{tabela}/")[1]:
+            if not nome.endswith(('.jsonl.gz', '.jsonl.gz.novo')):
+                continue
+            origem = f"{PASTA_MIDIA_ANTIGA}{tabela}/{nome}"
+            # Mescla com o que já estiver no destino (a cópia .novo tem as mesmas linhas)
+            _gravar_arquivo(f"{PASTA_ARQUIVO}{tabela}/{nome.removesuffix('.novo')}", _ler(default_storage, origem))
+            default_storage.delete(origem)
+            movidos += 1
+    return movidos
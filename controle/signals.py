@@ -0,0 +1,140 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .busca import indexar_objeto, preencher, remover
+from .cache_modelos import invalidar, invalidar_objeto, modelos as modelos_cache, pais_no_banco
+from .models import Abastecimento, InfracaoTransito, Motorista, Multa, Setor, TermoResponsabilidade, Veiculo, VinculoMotorista
+from .permissoes import invalidar_todos, invalidar_usuarios
+from . import pontuacao, vinculos
+from .utils import CHAVE_SETORES_MULTAS
+
+
+@receiver([post_save, post_delete], sender=Multa)
+@receiver([post_save, post_delete], sender=Setor)
+def limpar_setores_multas(sender, **kwargs):
+    """Multa salva ou excluída, ou setor renomeado: a lista de setores do filtro pode mudar."""
+    cache.delete(CHAVE_SETORES_MULTAS)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def limpar_grupos_usuarios(sender, instance, action, reverse, pk_set, **kwargs):
+    """Participação em grupos mudou: descarta os grupos guardados dos usuários afetados."""
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidar_usuarios([instance.pk])
+    elif pk_set is not None:
+        invalidar_usuarios(pk_set)
+    else:  # group.user_set.clear()
+        invalidar_todos()
+
+
+@receiver([post_save, post_delete], sender=Group)
+def limpar_grupos_todos(sender, raw=False, **kwargs):
+    """Grupo renomeado ou excluído: troca o carimbo de versão de todos."""
+    if not raw:
+        invalidar_todos()
+
+
+@receiver(post_save, sender=Multa)
+def conciliar_pontos_multa(sender, instance, raw=False, **kwargs):
+    """Multa criada ou alterada (motorista, infração, data): acerta os pontos na CNH."""
+    if not raw:
+        pontuacao.conciliar([instance.pk])
+
+
+@receiver(pre_delete, sender=Multa)
+def descontar_pontos_multa(sender, instance, **kwargs):
+    pontuacao.descontar(instance.pk)
+
+
+@receiver(post_save, sender=InfracaoTransito)
+def conciliar_pontos_infracao(sender, instance, created, raw=False, **kwargs):
+    """Pontos da infração podem ter mudado: concilia as multas dela ainda na janela."""
+    if not created and not raw:
+        pontuacao.conciliar_todas(
+            Multa.objects.filter(infracao=instance, data_hora_infracao__gt=pontuacao.inicio_janela())
+        )
+
+
+@receiver(post_save, sender=TermoResponsabilidade)
+def abrir_vinculo_termo(sender, instance, created, raw=False, **kwargs):
+    """Termo assinado: o motorista passa a responder pelo veículo a partir da assinatura."""
+    if created and not raw:
+        vinculos.abrir([instance.veiculo_id], [instance.motorista_id], instance.data_assinatura,
+                       VinculoMotorista.ORIGEM_CHOICES.TERMO, instance)
+
+
+@receiver(m2m_changed, sender=Veiculo.motoristas.through)
+def atualizar_vinculos(sender, instance, action, reverse, pk_set, **kwargs):
+    """Motoristas adicionados ou retirados do veículo abrem ou fecham vínculos na linha do tempo."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        if reverse:
+            vinculos.fechar(motorista_ids=[instance.pk])
+        else:
+            vinculos.fechar(veiculo_ids=[instance.pk])
+        return
+    veiculo_ids, motorista_ids = (list(pk_set), [instance.pk]) if reverse else ([instance.pk], list(pk_set))
+    if action == 'post_add':
+        vinculos.abrir(veiculo_ids, motorista_ids)
+    else:
+        vinculos.fechar(veiculo_ids, motorista_ids)
+
+
+@receiver(pre_save, sender=Motorista)
+@receiver(pre_save, sender=Veiculo)
+@receiver(pre_save, sender=Multa)
+@receiver(pre_save, sender=InfracaoTransito)
+def preencher_colunas_busca(sender, instance, **kwargs):
+    """Mantém as colunas normalizadas de controle/busca.py iguais aos campos originais."""
+    preencher(instance)
+
+
+INDEXADOS = [Veiculo, Motorista, Multa, TermoResponsabilidade, Abastecimento]
+
+
+def atualizar_documento_busca(sender, instance, raw=False, **kwargs):
+    """Mantém o DocumentoBusca da busca global em dia com o objeto salvo."""
+    if not raw:
+        indexar_objeto(instance)
+
+
+def remover_documento_busca(sender, instance, **kwargs):
+    remover(sender, instance.pk)
+
+
+for model in INDEXADOS:
+    post_save.connect(atualizar_documento_busca, sender=model, dispatch_uid=f'busca_global_{model.__name__}')
+    post_delete.connect(remover_documento_busca, sender=model, dispatch_uid=f'busca_global_remover_{model.__name__}')
+
+
+def guardar_pais_anteriores(sender, instance, raw=False, **kwargs):
+    """Antes de alterar, lembra os pais gravados: se a chave estrangeira mudar, o pai antigo também é invalidado."""
+    if not raw:
+        instance._pais_anteriores = pais_no_banco(instance)
+
+
+def invalidar_cache_modelos(sender, instance, **kwargs):
+    """Troca os carimbos de controle/cache_modelos.py do objeto, do model e dos pais."""
+    invalidar_objeto(instance, getattr(instance, '_pais_anteriores', ()))
+
+
+def invalidar_cache_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Vínculo muitos-para-muitos mudou (ex.: motoristas do veículo): invalida os dois lados."""
+    if not action.startswith('post_'):
+        return
+    invalidar(instance._meta.model_name, [instance.pk])
+    invalidar(model._meta.model_name, pk_set or ())
+
+
+for model in modelos_cache():
+    pre_save.connect(guardar_pais_anteriores, sender=model, dispatch_uid=f'cache_modelos_pre_{model.__name__}')
+    post_save.connect(invalidar_cache_modelos, sender=model, dispatch_uid=f'cache_modelos_{model.__name__}')
+    post_delete.connect(invalidar_cache_modelos, sender=model, dispatch_uid=f'cache_modelos_remover_{model.__name__}')
+    for campo in model._meta.local_many_to_many:
+        m2m_changed.connect(invalidar_cache_m2m, sender=campo.remote_field.through,
+                            dispatch_uid=f'cache_modelos_m2m_{model.__name__}_{campo.name}')
@@ -0,0 +1,35 @@
+// Autocomplete para <select data-autocomplete="url"> (controle/widgets.py):
+// cria uma caixa de busca antes do select e troca as opções não
+// selecionadas pelos resultados do endpoint JSON.
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("select[data-autocomplete]").forEach(function (select) {
+        const busca = document.createElement("input");
+        busca.type = "search";
+        busca.className = "form-control form-control-sm mb-1";
+        busca.placeholder = "Digite para buscar...";
+        select.parentNode.insertBefore(busca, select);
+
+        let espera = null;
+        busca.addEventListener("input", function () {
+            clearTimeout(espera);
+            espera = setTimeout(function () {
+                const termo = busca.value.trim();
+                if (termo.length < 2) return;
+                fetch(select.dataset.autocomplete + "?q=" + encodeURIComponent(termo))
+                    .then(resposta => resposta.json())
+                    .then(function (dados) {
+                        Array.from(select.options).forEach(function (opcao) {
+                            if (!opcao.selected && opcao.value !== "") opcao.remove();
+                        });
+                        const presentes = new Set(Array.from(select.options).map(opcao => opcao.value));
+                        dados.resultados.forEach(function (item) {
+                            if (!presentes.has(String(item.id))) select.add(new Option(item.texto, item.id));
+                        });
+                        if (!select.multiple && dados.resultados.length === 1) {
+                            select.value = dados.resultados[0].id;
+                        }
+                    });
+            }, 250);
+        });
+    });
+});
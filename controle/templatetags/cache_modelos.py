@@ -0,0 +1,46 @@
+"""
+{% cache_modelos 'nome' 'motorista' veiculo=veiculo.pk %} ... {% endcache_modelos %}
+
+Guarda o trecho renderizado até um dos models posicionais ou um dos
+objetos informados por nome=pk mudar (controle/cache_modelos.py). O
+trecho varia por usuário.
+"""
+from django import template
+
+from ..cache_modelos import em_cache
+
+register = template.Library()
+
+
+class CacheModelosNode(template.Node):
+    def __init__(self, nodelist, nome, modelos, objetos):
+        self.nodelist = nodelist
+        self.nome = nome
+        self.modelos = modelos
+        self.objetos = objetos
+
+    def render(self, context):
+        dependencias = [modelo.resolve(context) for modelo in self.modelos]
+        dependencias += [f"{tabela}:{pk.resolve(context)}" for tabela, pk in self.objetos.items()]
+        usuario = getattr(context.get('request'), 'user', None)
+        return em_cache(
+            self.nome.resolve(context), dependencias, lambda: self.nodelist.render(context),
+            variacao=(getattr(usuario, 'pk', None),),
+        )
+
+
+@register.tag('cache_modelos')
+def cache_modelos(parser, token):
+    partes = token.split_contents()
+    if len(partes) < 3:
+        raise template.TemplateSyntaxError("'cache_modelos' precisa de um nome e ao menos uma dependência.")
+    nodelist = parser.parse(('endcache_modelos',))
+    parser.delete_first_token()
+    modelos, objetos = [], {}
+    for parte in partes[2:]:
+        tabela, igual, valor = parte.partition('=')
+        if igual:
+            objetos[tabela] = parser.compile_filter(valor)
+        else:
+            modelos.append(parser.compile_filter(parte))
+    return CacheModelosNode(nodelist, parser.compile_filter(partes[1]), modelos, objetos)
@@ -1,3 +1,2047 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from pypdf import PdfReader, PdfWriter
+
+from . import (
+    auditoria, busca, cache_modelos, diferencas, importacao, pdfs, permissoes, pontuacao, quitacao, renderizacao,
+    retencao, views, vinculos,
+)
+from .anomalias import Historico, detectar
+from .consumo import reconstruir_consumo_mensal
+from .exportacao import CABECALHO, TEXTO_LINK, filtrar_multas, gerar_csv, gerar_xlsx
+from .forms import AbastecimentoForm, TrocaSetorForm
+from .historico import CHECKPOINT, campos_rastreados, compactar, estado_em, versoes
+from .models import (
+    Abastecimento, AlteracaoHistorico, AnomaliaAbastecimento, ConsumoMensal, DocumentoBusca, InfracaoTransito,
+    LeituraHodometro, Motorista, Multa, Setor, TermoResponsabilidade, Veiculo, VinculoMotorista,
+)
+from .paginacao import ANTERIOR, PROXIMA, Ordenacao, codificar_cursor, decodificar_cursor, paginar
+from .permissoes import ADMINISTRADOR
+from .utils import grupo_administrador
+
+
+def pasta_temporaria(teste, configuracao='MEDIA_ROOT'):
+    """A configuração (MEDIA_ROOT, RETENCAO_PASTA...) numa pasta temporária, apagada no fim do teste."""
+    pasta = tempfile.mkdtemp()
+    teste.addCleanup(shutil.rmtree, pasta)
+    ajuste = override_settings(**{configuracao: pasta})
+    ajuste.enable()
+    teste.addCleanup(ajuste.disable)
+    return pasta
+
+
+def em_paralelo(teste, chamadas):
+    """
+    Roda as chamadas em threads (cada uma com a sua conexão), largando todas
+    ao mesmo tempo. Devolve os resultados na ordem; falha o teste se alguma
+    levantar exceção.
+    """
+    largada = threading.Barrier(len(chamadas))
+    resultados, erros = [None] * len(chamadas), []
+
+    def rodar(indice, chamada):
+        try:
+            largada.wait()
+            resultados[indice] = chamada()
+        except Exception as erro:
+            erros.append(erro)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=rodar, args=item) for item in enumerate(chamadas)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    teste.assertEqual(erros, [])
+    return resultados
+
+
+def dia(numero, hora=0):
+    """Instante fixo no fuso local: 1º/03/2026 mais `numero` dias, na hora informada."""
+    return timezone.make_aware(datetime(2026, 3, 1, hora)) + timedelta(days=numero)
+
+
+def criar_veiculo(placa, **campos):
+    """Veículo com os campos obrigatórios preenchidos a partir da placa."""
+    campos.setdefault('setor', Setor.objects.get_or_create(nome='Frota')[0])
+    campos.setdefault('modelo', 'Strada')
+    return Veiculo.objects.create(
+        placa=placa, renavam=f'R{placa}', chassi=f'C{placa}', marca='Fiat', ano=2020, ano_modelo=2020, **campos
+    )
+
+
+def criar_motorista(cpf, **campos):
+    """Motorista com os campos obrigatórios preenchidos a partir do CPF."""
+    campos.setdefault('nome', f'Motorista {cpf}')
+    campos.setdefault('cnh_numero', f'CNH{cpf}')
+    return Motorista.objects.create(cpf=cpf, telefone='71999990000', **campos)
+
+
+def criar_multa(veiculo, **campos):
+    """Multa gravada pelo save() (signals, histórico e pontos, como na tela)."""
+    campos.setdefault('local', 'Av. Sete de Setembro')
+    campos.setdefault('orgao_autuador', 'TRANSALVADOR')
+    multa = Multa(veiculo=veiculo, **campos)
+    multa.save()
+    return multa
+
+
+def arquivo_csv(*linhas):
+    """Arquivo CSV (separado por ';') como os enviados para importação; a primeira linha é o cabeçalho."""
+    return io.BytesIO('\n'.join(';'.join(str(valor) for valor in linha) for linha in linhas).encode())
+
+
+# ==================================================
+# ==================== HODÔMETRO ===================
+# ==================================================
+
+class AvancarHodometroConcorrenteTests(TransactionTestCase):
+    """Leituras simultâneas do mesmo veículo nunca fazem o hodômetro voltar."""
+
+    RODADAS = 20
+
+    def setUp(self):
+        # Cada thread abre a sua conexão: o SQLite em memória não é compartilhado
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("banco de teste em memória não aceita conexões simultâneas")
+
+    def _em_paralelo(self, veiculo_id, leituras):
+        """Chama avancar_hodometro em uma thread por leitura, todas ao mesmo tempo."""
+        resultados = em_paralelo(self, [lambda h=h: Veiculo.avancar_hodometro(veiculo_id, h) for h in leituras])
+        return [hodometro for hodometro, avancou in zip(leituras, resultados) if avancou]
+
+    def test_maior_leitura_vence(self):
+        for rodada in range(self.RODADAS):
+            veiculo = criar_veiculo(f'HOD{rodada:04d}', hodometro=1000)
+
+            avancos = self._em_paralelo(veiculo.pk, [5000, 3000])
+
+            veiculo.refresh_from_db()
+            self.assertEqual(veiculo.hodometro, 5000)
+            # 5000 sempre avança; 3000 só se chegou primeiro
+            self.assertIn(5000, avancos)
+            self.assertIn(sorted(avancos), ([5000], [3000, 5000]))
+            # Uma leitura por avanço, na ordem em que avançaram: nunca decrescente
+            leituras = list(
+                LeituraHodometro.objects.filter(veiculo=veiculo).order_by('pk').values_list('hodometro', flat=True)
+            )
+            self.assertEqual(sorted(leituras), sorted(avancos))
+            self.assertEqual(leituras, sorted(leituras))
+
+    def test_leitura_menor_nao_registra(self):
+        veiculo = criar_veiculo('HOD9999', hodometro=8000)
+
+        self.assertEqual(self._em_paralelo(veiculo.pk, [5000, 3000, 8000]), [])
+
+        veiculo.refresh_from_db()
+        self.assertEqual(veiculo.hodometro, 8000)
+        self.assertFalse(LeituraHodometro.objects.filter(veiculo=veiculo).exists())
+
+
+# ==================================================
+# ================ CONSUMO MENSAL ==================
+# ==================================================
+
+class ConsumoMensalTests(TestCase):
+    """O consolidado mantido a cada abastecimento bate com a reconstrução completa."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.veiculo = criar_veiculo('CON0001')
+
+    def abastecer(self, data, hodometro, litros=40, tipo='G'):
+        abastecimento = Abastecimento(
+            veiculo=self.veiculo, data=data, hodometro=hodometro, litros=Decimal(litros),
+            valor_total=Decimal(litros) * Decimal('6.10'), tipo_combustivel=tipo,
+        )
+        abastecimento.save()
+        return abastecimento
+
+    def totais(self):
+        return {
+            (c.mes, c.tipo_combustivel): (c.litros, c.km_rodado, c.quantidade)
+            for c in ConsumoMensal.objects.filter(veiculo=self.veiculo)
+        }
+
+    def conferir(self, esperado=None):
+        incremental = self.totais()
+        reconstruir_consumo_mensal()
+        self.assertEqual(incremental, self.totais())
+        if esperado is not None:
+            self.assertEqual(incremental, esperado)
+
+    def test_incluir_alterar_excluir(self):
+        self.abastecer(date(2026, 1, 10), 1000)
+        janeiro = self.abastecer(date(2026, 1, 20), 1400)
+        fevereiro = self.abastecer(date(2026, 2, 5), 1800, litros=30)
+        self.abastecer(date(2026, 2, 20), 2300, tipo='D')
+        self.conferir({
+            (date(2026, 1, 1), 'G'): (Decimal('80.00'), 400, 2),   # o primeiro não tem km anterior
+            (date(2026, 2, 1), 'G'): (Decimal('30.00'), 400, 1),
+            (date(2026, 2, 1), 'D'): (Decimal('40.00'), 500, 1),
+        })
+
+        # Incluído no fim de janeiro: muda o km do primeiro de fevereiro
+        self.abastecer(date(2026, 1, 25), 1600)
+        self.conferir()
+        self.assertEqual(self.totais()[(date(2026, 2, 1), 'G')][1], 200)
+
+        fevereiro.data = date(2026, 3, 2)
+        fevereiro.save()
+        self.conferir()
+        self.assertNotIn((date(2026, 2, 1), 'G'), self.totais())
+
+        janeiro.delete()
+        self.conferir()
+        self.assertEqual(self.totais()[(date(2026, 1, 1), 'G')], (Decimal('80.00'), 600, 2))
+
+
+class ConsumoMensalConcorrenteTests(TransactionTestCase):
+    """Gravações simultâneas no mesmo veículo e mês não perdem abastecimentos do consolidado."""
+
+    RODADAS = 20
+
+    def setUp(self):
+        # Precisa de SELECT ... FOR UPDATE de verdade (PostgreSQL)
+        if not connection.features.has_select_for_update:
+            self.skipTest("banco sem SELECT ... FOR UPDATE")
+
+    def abastecimento(self, veiculo, data, hodometro):
+        return Abastecimento(
+            veiculo=veiculo, data=data, hodometro=hodometro, litros=Decimal('40'),
+            valor_total=Decimal('244'), tipo_combustivel='G',
+        )
+
+    def test_dois_abastecimentos_no_mesmo_mes(self):
+        for rodada in range(self.RODADAS):
+            veiculo = criar_veiculo(f'CMC{rodada:04d}')
+            self.abastecimento(veiculo, date(2026, 3, 1), 1000).save()
+            alterado = self.abastecimento(veiculo, date(2026, 3, 5), 1200)
+            alterado.save()
+
+            alterado.litros = Decimal('50')
+            em_paralelo(self, [
+                self.abastecimento(veiculo, date(2026, 3, 10), 1500).save,
+                self.abastecimento(veiculo, date(2026, 3, 20), 1900).save,
+                alterado.save,
+            ])
+
+            consumo = ConsumoMensal.objects.get(veiculo=veiculo, mes=date(2026, 3, 1), tipo_combustivel='G')
+            self.assertEqual((consumo.quantidade, consumo.litros, consumo.km_rodado), (4, Decimal('170'), 900))
+
+
+class ComConsumoTests(TestCase):
+    """Km anterior, km rodado e km/l pela janela LAG, com o período aplicado depois dela."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hoje = timezone.localdate()
+        cls.inicio = cls.hoje - timedelta(days=30)   # período padrão da lista de abastecimentos
+        cls.strada = criar_veiculo('CCO0001')
+        cls.hilux = criar_veiculo('CCO0002')
+        for veiculo, dias, hodometro in [
+            (cls.strada, 400, 100), (cls.strada, 60, 1000), (cls.strada, 45, 1250), (cls.strada, 45, 1300),
+            (cls.strada, 20, 1600), (cls.strada, 10, 2000), (cls.hilux, 40, 500), (cls.hilux, 5, 800),
+        ]:
+            cls.abastecer(veiculo, cls.hoje - timedelta(days=dias), hodometro)
+
+    @staticmethod
+    def abastecer(veiculo, data, hodometro):
+        Abastecimento(veiculo=veiculo, data=data, hodometro=hodometro, litros=Decimal('40'),
+                      valor_total=Decimal('244'), tipo_combustivel='G').save()
+
+    def consumo(self, abastecimentos):
+        return {
+            (a.veiculo.placa, a.hodometro): (a.hodometro_anterior, a.km_rodado, a.km_por_litro)
+            for a in abastecimentos
+        }
+
+    def test_primeiro_do_periodo_enxerga_o_anterior(self):
+        self.assertEqual(self.consumo(Abastecimento.objects.com_consumo(self.inicio)), {
+            ('CCO0001', 1600): (1300, 300, 7.5),    # o maior do dia anterior ao período
+            ('CCO0001', 2000): (1600, 400, 10.0),
+            ('CCO0002', 800): (500, 300, 7.5),
+        })
+        self.assertEqual(self.consumo(Abastecimento.objects.com_consumo(self.inicio, self.hoje - timedelta(days=15))),
+                         {('CCO0001', 1600): (1300, 300, 7.5)})
+        # Sem período, o primeiro de cada veículo parte do zero
+        todos = self.consumo(Abastecimento.objects.com_consumo())
+        self.assertEqual((todos[('CCO0001', 100)], todos[('CCO0002', 500)]), ((0, 100, 2.5), (0, 500, 12.5)))
+
+    def test_filtro_por_placa_mantem_a_janela_do_veiculo(self):
+        filtrados = Abastecimento.objects.filter(veiculo__placa='CCO0002').com_consumo(self.inicio)
+        self.assertEqual(self.consumo(filtrados), {('CCO0002', 800): (500, 300, 7.5)})
+
+    def test_janela_comeca_no_ultimo_antes_do_periodo(self):
+        consulta = str(Abastecimento.objects.com_consumo(self.inicio).query)
+        self.assertIn('COALESCE', consulta.upper())
+        # Abastecimento de anos atrás não muda nada
+        self.abastecer(self.strada, self.hoje - timedelta(days=900), 10)
+        self.assertEqual(self.consumo(Abastecimento.objects.filter(veiculo=self.strada).com_consumo(self.inicio)),
+                         {('CCO0001', 1600): (1300, 300, 7.5), ('CCO0001', 2000): (1600, 400, 10.0)})
+
+    def test_lista_em_consultas_constantes(self):
+        usuario = User.objects.create_user('abastecedor')
+        usuario.groups.add(Group.objects.create(name=ADMINISTRADOR))
+        self.client.force_login(usuario)
+
+        def consultas(**filtros):
+            with CaptureQueriesContext(connection) as contexto:
+                resposta = self.client.get(reverse('abastecimentos'), filtros)
+            return resposta, len(contexto)
+
+        consultas()   # a primeira requisição ainda guarda os grupos do usuário no cache
+        resposta, poucas = consultas(placa='cco0001')
+        self.assertEqual([(a.hodometro, a.hodometro_anterior) for a in resposta.context['abastecimentos']],
+                         [(2000, 1600), (1600, 1300)])
+        for numero in range(10):
+            self.abastecer(self.hilux, self.hoje - timedelta(days=4), 900 + numero * 100)
+            self.abastecer(self.strada, self.hoje - timedelta(days=3), 2100 + numero * 100)
+
+        resposta, muitas = consultas()
+        self.assertEqual(len(resposta.context['abastecimentos']), 23)
+        self.assertEqual(muitas, poucas)
+
+
+class ImportarAbastecimentosTests(TestCase):
+    """Cartão combustível em lote: reimportação sem duplicar, hodômetro e consolidado mensal em dia."""
+
+    CABECALHO = ['Placa', 'Data', 'KM', 'Litros', 'Valor Total', 'Combustível', 'Posto', 'NSU']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.strada = criar_veiculo('ABS0001', hodometro=1000)
+        cls.hilux = criar_veiculo('ABS0002')
+
+    def importar(self, *linhas, tamanho_lote=importacao.TAMANHO_LOTE):
+        return importacao.importar_abastecimentos(arquivo_csv(self.CABECALHO, *linhas), 'cartao.csv',
+                                                  tamanho_lote=tamanho_lote)
+
+    def totais(self, veiculo):
+        return {
+            (c.mes, c.tipo_combustivel): (c.litros, c.km_rodado, c.quantidade)
+            for c in ConsumoMensal.objects.filter(veiculo=veiculo)
+        }
+
+    def test_reimportar_o_mesmo_arquivo(self):
+        linhas = [
+            ['ABS-0001', '10/01/2026', '1200', '40,00', '244,00', 'Gasolina', 'Posto A', '9001'],
+            ['abs0001', '20/01/2026', '1600', '35', '213.50', 'gasolina', 'Posto A', '9002'],
+            ['ABS0002', '2026-01-15', '300', '50', '310', 'Diesel S10', '', ''],
+        ]
+        primeira = self.importar(*linhas)
+        consumo = self.totais(self.strada)
+
+        segunda = self.importar(*linhas)
+
+        self.assertEqual((primeira.importados, primeira.ja_importados, primeira.rejeitados), (3, 0, []))
+        self.assertEqual((segunda.importados, segunda.ja_importados, segunda.rejeitados), (0, 3, []))
+        self.assertEqual(Abastecimento.objects.count(), 3)
+        self.assertEqual(self.totais(self.strada), consumo)
+        self.assertEqual(DocumentoBusca.objects.filter(tipo='abastecimento').count(), 3)
+
+    def test_chave_pela_transacao_ou_pelo_conteudo(self):
+        mesmo_conteudo = ['ABS0001', '10/01/2026', '1200', '40', '244', 'G', 'Posto A']
+        resultado = self.importar(
+            mesmo_conteudo + ['9001'],
+            mesmo_conteudo + ['9002'],      # outra transação com os mesmos dados: vale
+            mesmo_conteudo + [''],
+            mesmo_conteudo + [''],          # sem NSU, mesmo conteúdo: repetida
+        )
+
+        self.assertEqual(resultado.importados, 3)
+        self.assertEqual([(numero, motivo) for numero, _, motivo in resultado.rejeitados],
+                         [(5, "transação repetida no arquivo")])
+        chaves = sorted(Abastecimento.objects.values_list('chave_importacao', flat=True))
+        self.assertEqual(chaves[-2:], ['cartao:9001', 'cartao:9002'])
+        self.assertEqual(len(chaves[0]), 64)
+
+        # A transação manda: reenviada com outro valor continua sendo a mesma
+        corrigida = self.importar(['ABS0001', '10/01/2026', '1200', '40', '250', 'G', 'Posto A', '9001'])
+        self.assertEqual((corrigida.importados, corrigida.ja_importados), (0, 1))
+
+    def test_hodometro_e_consumo_mensal(self):
+        resultado = self.importar(
+            ['ABS0001', '20/01/2026', '1500', '40', '244', 'G', '', ''],
+            ['ABS0001', '10/01/2026', '1200', '40', '244', 'G', '', ''],
+            ['ABS0002', '15/01/2026', '300', '50', '310', 'D', '', ''],
+            ['ABS0001', '05/02/2026', '1900', '30', '183', 'G', '', ''],
+            ['ABS0001', '01/12/2025', '900', '40', '244', 'G', '', ''],   # abaixo do hodômetro atual
+            tamanho_lote=2,
+        )
+
+        self.assertEqual(resultado.importados, 5)
+        self.strada.refresh_from_db()
+        self.hilux.refresh_from_db()
+        self.assertEqual((self.strada.hodometro, self.hilux.hodometro), (1900, 300))
+        # Uma leitura por lote que avançou o hodômetro (o maior do lote)
+        self.assertEqual(
+            sorted(LeituraHodometro.objects.filter(veiculo=self.strada).values_list('hodometro', flat=True)),
+            [1500, 1900],
+        )
+        esperado = {
+            (date(2025, 12, 1), 'G'): (Decimal('40.00'), 0, 1),
+            (date(2026, 1, 1), 'G'): (Decimal('80.00'), 600, 2),
+            (date(2026, 2, 1), 'G'): (Decimal('30.00'), 400, 1),
+        }
+        self.assertEqual(self.totais(self.strada), esperado)
+        reconstruir_consumo_mensal()
+        self.assertEqual(self.totais(self.strada), esperado)
+        self.assertEqual(self.totais(self.hilux), {(date(2026, 1, 1), 'D'): (Decimal('50.00'), 0, 1)})
+
+    def test_escrever_rejeitados(self):
+        resultado = self.importar(
+            ['XYZ9999', '10/01/2026', '1200', '40', '244', 'G', '', ''],
+            ['ABS0001', '10/01/2026', '-5', '40', '244', 'G', '', ''],
+            ['ABS0001', '10/01/2026', '1200', '40', '244', 'Querosene', '', ''],
+            ['ABS0001', '32/01/2026', '1200', '40', '244', 'G', '', ''],
+        )
+        destino = io.StringIO()
+        resultado.escrever_rejeitados(destino)
+
+        linhas = list(csv.reader(io.StringIO(destino.getvalue()), delimiter=';'))
+        self.assertEqual(linhas[0], ['linha', 'motivo', 'placa', 'data', 'km', 'litros', 'valor_total', 'combustivel',
+                                     'posto', 'nsu'])
+        self.assertEqual([linha[:3] for linha in linhas[1:]], [
+            ['2', 'placa XYZ9999 não cadastrada', 'XYZ9999'],
+            ['3', 'hodômetro negativo', 'ABS0001'],
+            ['4', 'combustível desconhecido: querosene', 'ABS0001'],
+            ['5', "data inválida: '32/01/2026'", 'ABS0001'],
+        ])
+        self.assertFalse(Abastecimento.objects.exists())
+
+
+# ==================================================
+# =================== ANOMALIAS ====================
+# ==================================================
+
+class DetectarAnomaliasTests(SimpleTestCase):
+    """Regras vetorizadas sobre um histórico montado em memória."""
+
+    def setUp(self):
+        self.linhas = []
+
+    def abastecimentos(self, veiculo, hodometros, litros, modelo='HATCH', precos=None, posto='SHELL', tipo='G'):
+        """Acrescenta os abastecimentos do veículo e devolve os ids, na ordem."""
+        precos = precos or [6.10 + 0.01 * (n % 3) for n in range(len(hodometros))]
+        ids = []
+        for hodometro, quantidade, preco in zip(hodometros, litros, precos):
+            ids.append(len(self.linhas) + 1)
+            self.linhas.append((ids[-1], veiculo, modelo, hodometro, quantidade, preco, posto, tipo))
+        return ids
+
+    def detectar(self):
+        return {(pk, tipo): (valor, referencia) for pk, tipo, valor, referencia in detectar(Historico(self.linhas))}
+
+    def test_regras(self):
+        tipos = AnomaliaAbastecimento.Tipos
+        # Uns 10 km/L; o 9º rende o dobro
+        consumo = self.abastecimentos(1, [1000 + 400 * n for n in range(12)], [40, 41] * 4 + [20] + [40, 41, 40])
+        regressivo = self.abastecimentos(2, [5000, 5400, 5300, 5700], [40, 40, 40, 40])
+        preco = self.abastecimentos(
+            3, [1000 + 400 * n for n in range(8)], [40] * 8, precos=[6.10, 6.11, 6.12, 6.10, 9.50, 6.11, 6.12, 6.10]
+        )
+        tanque = self.abastecimentos(4, [1000, 1400, 1800, 1810], [40, 40, 40, 80])
+        normal = self.abastecimentos(5, [1000 + 400 * n for n in range(12)], [40, 41] * 6)
+
+        encontradas = self.detectar()
+
+        self.assertIn((consumo[8], tipos.CONSUMO_VEICULO), encontradas)
+        self.assertEqual(encontradas[(regressivo[2], tipos.HODOMETRO_REGRESSIVO)], (5300, 5400))
+        self.assertEqual(encontradas[(preco[4], tipos.PRECO_POSTO)][0], 9.5)
+        self.assertIn((tanque[3], tipos.CAPACIDADE_TANQUE), encontradas)
+        for pk in normal:
+            self.assertFalse([tipo for (outro, tipo) in encontradas if outro == pk], pk)
+        # O primeiro abastecimento de cada veículo não tem com o que comparar
+        self.assertFalse([tipo for (pk, tipo) in encontradas if pk in (consumo[0], regressivo[0], tanque[0])])
+
+    def test_historico_vazio(self):
+        self.assertEqual(self.detectar(), {})
+
+
+# ==================================================
+# ===================== BUSCA ======================
+# ==================================================
+
+class BuscaNormalizadaTests(TestCase):
+    """buscar() nas colunas normalizadas, nas listas de condutores e veículos e no admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jose = criar_motorista('123.456.789-01', nome='José da Silva', cnh_numero='55500011122')
+        cls.joao = criar_motorista('98712345600', nome='JOÃO  Souza', cnh_numero='12399988877')
+        cls.vizinho = criar_motorista('12400000000', nome='Maria Lima')   # logo depois do prefixo 123
+        cls.strada = criar_veiculo('ABC1D23')
+        cls.hilux = criar_veiculo('XYZ9A99', modelo='Hilux')
+        cls.admin = User.objects.create_superuser('raiz', 'raiz@frota.local', 'senha')
+
+    def motoristas(self, termo):
+        return set(busca.buscar(Motorista.objects.all(), termo))
+
+    def test_nome_sem_acento_e_sem_caixa(self):
+        self.assertEqual(self.motoristas('JOSE'), {self.jose})
+        self.assertEqual(self.motoristas('joao souza'), {self.joao})
+        self.assertEqual(self.motoristas('silva jose'), {self.jose})   # todas as palavras, em qualquer ordem
+        self.assertEqual(self.motoristas('jo'), {self.jose, self.joao})
+
+    def test_cpf_com_ou_sem_pontuacao(self):
+        for termo in ('123.456', '123456', '123.456.789-01', '12345678901'):
+            self.assertEqual(self.motoristas(termo), {self.jose}, termo)
+        # O prefixo vale para CPF e CNH
+        self.assertEqual(self.motoristas('1239'), {self.joao})
+
+    def test_minimo_de_digitos(self):
+        self.assertEqual(busca.TAMANHO_MINIMO_DOCUMENTO, 3)
+        self.assertEqual(self.motoristas('12'), set())
+        self.assertEqual(self.motoristas('1.2-'), set())
+        self.assertEqual(self.motoristas('124'), {self.vizinho})
+        self.assertEqual(self.motoristas('  '), {self.jose, self.joao, self.vizinho})
+
+    def test_prefixo_como_intervalo(self):
+        self.assertEqual(busca.q_prefixo('cpf_busca', '123'), Q(cpf_busca__gte='123', cpf_busca__lt='124'))
+        # Último dígito 9: o limite é o caractere seguinte, não "1240"
+        self.assertEqual(busca.q_prefixo('cpf_busca', '1239'), Q(cpf_busca__gte='1239', cpf_busca__lt='123:'))
+        self.assertEqual(set(Motorista.objects.filter(busca.q_prefixo('cpf_busca', '123'))), {self.jose})
+
+    def test_placa(self):
+        veiculos = Veiculo.objects.all()
+        self.assertEqual(list(busca.buscar(veiculos, 'abc-1d')), [self.strada])
+        self.assertEqual(list(busca.buscar(veiculos, '9a9')), [self.hilux])
+        self.assertEqual(list(busca.buscar(veiculos, '--')), [])
+
+    def test_listas_de_condutores_e_veiculos(self):
+        self.client.force_login(self.admin)
+
+        resposta = self.client.get(reverse('lista_motorista'), {'q': 'JOSE'})
+        self.assertEqual(list(resposta.context['motoristas']), [self.jose])
+        self.assertEqual(resposta.context['query'], 'JOSE')
+
+        resposta = self.client.get(reverse('listar_veiculo'), {'q': 'abc 1d'})
+        self.assertEqual(list(resposta.context['veiculo']), [self.strada])
+
+    def test_busca_do_admin(self):
+        request = RequestFactory().get('/admin/')
+        request.user = self.admin
+        veiculos = admin.site._registry[Veiculo]
+
+        resultado, distintos = veiculos.get_search_results(request, Veiculo.objects.all(), 'xyz9')
+        self.assertEqual((list(resultado), distintos), ([self.hilux], False))
+        # campos_busca_extra continuam com icontains
+        resultado, _ = veiculos.get_search_results(request, Veiculo.objects.all(), 'hilu')
+        self.assertEqual(list(resultado), [self.hilux])
+        resultado, _ = admin.site._registry[Motorista].get_search_results(request, Motorista.objects.all(), ' ')
+        self.assertEqual(resultado.count(), 3)
+
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('admin:controle_motorista_changelist'), {'q': 'JOSE'})
+        self.assertEqual(list(resposta.context['cl'].result_list), [self.jose])
+
+
+class BuscaGlobalTests(TestCase):
+    """Documentos de busca mantidos pelos signals e resultados misturados por relevância."""
+
+    def setUp(self):
+        self.veiculo = criar_veiculo('RCU9D17')
+        self.motorista = criar_motorista('12345678900', nome='José Conceição')
+        self.multa = criar_multa(self.veiculo, auto_infracao='AI-778899', motorista=self.motorista)
+        self.termo = TermoResponsabilidade.objects.create(veiculo=self.veiculo, motorista=self.motorista)
+        self.abastecimento = Abastecimento.objects.create(
+            veiculo=self.veiculo, data=dia(0), hodometro=1000, litros=Decimal('40'),
+            valor_total=Decimal('244'), tipo_combustivel='G', posto='Posto Paralela',
+        )
+
+    def tipos(self, termo):
+        return [(documento.tipo, documento.objeto_id) for documento in busca.buscar_global(termo)]
+
+    def test_placa_traz_o_veiculo_primeiro_e_quem_o_cita(self):
+        with self.assertNumQueries(1):
+            resultados = self.tipos('rcu-9d17')
+
+        self.assertEqual(resultados[0], ('veiculo', self.veiculo.pk))
+        self.assertCountEqual(resultados[1:], [
+            ('multa', self.multa.pk),
+            ('termo', self.termo.pk),
+            ('abastecimento', self.abastecimento.pk),
+        ])
+
+    def test_documentos_e_nomes_normalizados(self):
+        self.assertEqual(self.tipos('123.456.789-00')[0], ('motorista', self.motorista.pk))
+        self.assertEqual(self.tipos('ai 778899')[0], ('multa', self.multa.pk))
+        self.assertIn(('motorista', self.motorista.pk), self.tipos('JOSE conceicao'))
+        self.assertEqual(self.tipos('paralela'), [('abastecimento', self.abastecimento.pk)])
+        self.assertEqual(self.tipos('   '), [])
+
+    def test_renomear_reindexa_os_documentos_que_citam(self):
+        self.veiculo.placa = 'ABC1D23'
+        self.veiculo.save()
+
+        # criar_veiculo() monta RENAVAM e chassi com a placa original
+        self.assertEqual(self.tipos('RCU9D17'), [('veiculo', self.veiculo.pk)])
+        self.assertCountEqual(self.tipos('ABC1D23'), [
+            ('veiculo', self.veiculo.pk), ('multa', self.multa.pk),
+            ('termo', self.termo.pk), ('abastecimento', self.abastecimento.pk),
+        ])
+
+    def test_excluir_remove_o_documento(self):
+        self.abastecimento.delete()
+        self.multa.delete()
+
+        self.assertFalse(DocumentoBusca.objects.filter(tipo__in=['multa', 'abastecimento']).exists())
+        self.assertEqual(busca.reindexar_tudo()['veiculo'], 1)
+        self.assertEqual(DocumentoBusca.objects.count(), 3)
+
+    def test_view_em_json(self):
+        self.client.force_login(User.objects.create_user('busca'))
+
+        resposta = self.client.get(reverse('busca_global'), {'q': 'AI778899', 'formato': 'json'})
+
+        primeiro = resposta.json()['resultados'][0]
+        self.assertEqual(primeiro['tipo'], 'Multa')
+        self.assertEqual(primeiro['url'], reverse('detalhar_multa', args=[self.multa.pk]))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AutocompleteTests(TestCase):
+    """Prefixo indexado, limite de resultados e cache curto das caixas de seleção."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.veiculos = [criar_veiculo(f'RCU{n:04d}') for n in range(busca.LIMITE_AUTOCOMPLETE + 5)]
+        cls.outro = criar_veiculo('ABC1D23')
+        cls.jose = criar_motorista('12345678900', nome='José Conceição')
+        cls.maria = criar_motorista('98765432100', nome='Maria José')
+        InfracaoTransito.objects.create(descricao='Avançar o sinal vermelho', gravidade='grave', valor=195.23)
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, tipo, termo):
+        return [resultado['id'] for resultado in busca.autocompletar(tipo, termo)]
+
+    def test_placa_por_prefixo_com_limite(self):
+        self.assertEqual(self.ids('veiculo', 'rcu-'), [v.pk for v in self.veiculos[:busca.LIMITE_AUTOCOMPLETE]])
+        self.assertEqual(self.ids('veiculo', 'abc1'), [self.outro.pk])
+        self.assertEqual(self.ids('veiculo', '1d23'), [])  # só o começo da placa
+
+    def test_motorista_por_nome_ou_documento(self):
+        self.assertEqual(self.ids('motorista', 'JOSE'), [self.jose.pk])
+        self.assertEqual(self.ids('motorista', '987.654'), [self.maria.pk])
+        self.assertEqual(self.ids('motorista', '98'), [])  # poucos dígitos
+        self.assertEqual(self.ids('motorista', 'j'), [])
+        self.assertEqual(
+            busca.autocompletar('infracao', 'sinal avancar'),
+            [{'id': InfracaoTransito.objects.get().pk, 'texto': 'Avançar o sinal vermelho (Grave)'}],
+        )
+
+    def test_termo_repetido_vem_do_cache(self):
+        resultados = busca.autocompletar('motorista', 'José')
+        with self.assertNumQueries(0):
+            self.assertEqual(busca.autocompletar('motorista', ' jose '), resultados)
+
+    def test_view(self):
+        url = reverse('autocomplete', args=['veiculo'])
+        self.assertEqual(self.client.get(url, {'q': 'abc'}).status_code, 302)  # login_required
+        self.client.force_login(User.objects.create_user('campo'))
+
+        resposta = self.client.get(url, {'q': 'abc'})
+
+        self.assertEqual(resposta.json(), {'resultados': [{'id': self.outro.pk, 'texto': 'ABC1D23 - Fiat Strada'}]})
+        self.assertEqual(resposta['Cache-Control'], f'private, max-age={busca.CACHE_AUTOCOMPLETE}')
+        self.assertEqual(self.client.get(reverse('autocomplete', args=['setor']), {'q': 'abc'}).status_code, 404)
+
+    def test_formulario_so_carrega_as_opcoes_escolhidas(self):
+        vazio = str(AbastecimentoForm()['veiculo'])
+        self.assertEqual(vazio.count('<option'), 1)
+        self.assertIn(f'data-autocomplete="{reverse("autocomplete", args=["veiculo"])}"', vazio)
+
+        form = AbastecimentoForm({'veiculo': self.outro.pk, 'abastecido_por': self.jose.pk})
+        html = str(form['veiculo'])
+        self.assertEqual(html.count('<option'), 2)
+        self.assertIn(f'<option value="{self.outro.pk}" selected>ABC1D23 - Fiat Strada</option>', html)
+        with CaptureQueriesContext(connection) as consultas:
+            form.full_clean()
+        self.assertEqual(form.cleaned_data['veiculo'], self.outro)
+        # Só buscas pela chave escolhida, nunca a tabela inteira
+        self.assertTrue(all('"id" = ' in consulta['sql'] for consulta in consultas.captured_queries))
+
+
+# ==================================================
+# ===================== MULTAS =====================
+# ==================================================
+
+# Sem cache: a segunda requisição mediria o cache, não a consulta da lista
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class ListarMultasConsultasTests(TestCase):
+    """A lista de multas faz o mesmo número de consultas com 10 ou 10.000 multas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('fiscal', password='x')
+        setores = [Setor.objects.create(nome=f'Setor {n}') for n in range(5)]
+        cls.veiculos = [criar_veiculo(f'MUL{n:04d}', setor=setores[n % 5]) for n in range(20)]
+        cls.motoristas = [criar_motorista(f'{n:011d}') for n in range(10)]
+        cls.infracoes = [
+            InfracaoTransito.objects.create(descricao=f'Infração {n}', gravidade='leve', valor=88.38, pontos=3)
+            for n in range(5)
+        ]
+
+    def _criar_multas(self, quantidade):
+        Multa.objects.bulk_create(
+            [
+                Multa(
+                    veiculo=self.veiculos[n % 20], setor=self.veiculos[n % 20].setor,
+                    setor_nome=self.veiculos[n % 20].setor.nome, motorista=self.motoristas[n % 10],
+                    infracao=self.infracoes[n % 5], auto_infracao=f'A{n:08d}',
+                    local='Av. Sete', orgao_autuador='TRANSALVADOR',
+                )
+                for n in range(quantidade)
+            ],
+            batch_size=1000,
+        )
+
+    def _consultas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('listar_multas'), {'por_pagina': 100})
+        self.assertEqual(resposta.status_code, 200)
+        return len(consultas), len(resposta.context['multas'])
+
+    def test_consultas_constantes(self):
+        self.client.force_login(self.usuario)
+        self._criar_multas(10)
+        poucas, exibidas = self._consultas()
+        self.assertEqual(exibidas, 10)
+
+        self._criar_multas(10000 - 10)
+        with self.assertNumQueries(poucas):
+            resposta = self.client.get(reverse('listar_multas'), {'por_pagina': 100})
+        self.assertEqual(len(resposta.context['multas']), 100)
+
+
+class ExportarMultasTests(TestCase):
+    """XLSX e CSV gerados em blocos, com os filtros de listar_multas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        saude = Setor.objects.create(nome='Saúde')
+        educacao = Setor.objects.create(nome='Educação')
+        cls.primeira = criar_multa(criar_veiculo('EXP0001', setor=saude), auto_infracao='E-1',
+                                   data_hora_infracao=dia(1), notificacao_infracao='documentos/multas/e1.pdf')
+        cls.segunda = criar_multa(criar_veiculo('EXP0002', setor=educacao), auto_infracao='E-2',
+                                  data_hora_infracao=dia(2), status_pagamento='pago',
+                                  comprovante_pagamento='documentos/multas/comprovantes/e2.pdf')
+        cls.terceira = criar_multa(criar_veiculo('EXP0003', setor=saude), auto_infracao='E-3',
+                                   data_hora_infracao=dia(3))
+        cls.saude = saude
+
+    def test_csv(self):
+        conteudo = ''.join(gerar_csv(Multa.objects.all(), 'https://frota', tamanho_lote=2))
+        linhas = list(csv.reader(io.StringIO(conteudo), delimiter=';'))
+
+        self.assertEqual(linhas[0], ['\ufeff' + CABECALHO[0]] + CABECALHO[1:])
+        self.assertEqual([int(linha[0]) for linha in linhas[1:]], [self.terceira.pk, self.segunda.pk, self.primeira.pk])
+        self.assertEqual(linhas[3][1:3], ['EXP0001', 'Saúde'])
+        self.assertEqual(linhas[3][-1], 'https://frota/media/documentos/multas/e1.pdf')
+        self.assertEqual(linhas[3][-3:-1], ['', ''])
+
+    def test_xlsx(self):
+        arquivo = io.BytesIO()
+        total = gerar_xlsx(Multa.objects.all(), arquivo, 'https://frota', tamanho_lote=2)
+        arquivo.seek(0)
+        linhas = list(load_workbook(arquivo).active.values)
+
+        self.assertEqual(total, 3)
+        self.assertEqual(list(linhas[0]), CABECALHO)
+        self.assertEqual([linha[0] for linha in linhas[1:]], [self.terceira.pk, self.segunda.pk, self.primeira.pk])
+        url = 'https://frota/media/documentos/multas/comprovantes/e2.pdf'
+        self.assertEqual(linhas[2][-2], f'=HYPERLINK("{url}","{TEXTO_LINK}")')
+
+    def test_filtros(self):
+        def pks(**parametros):
+            return set(filtrar_multas(Multa.objects.all(), parametros).values_list('pk', flat=True))
+
+        self.assertEqual(pks(setor=str(self.saude.pk)), {self.primeira.pk, self.terceira.pk})
+        self.assertEqual(pks(setor='Saúde', status_pagamento='pendente'), {self.primeira.pk, self.terceira.pk})
+        self.assertEqual(pks(status_pagamento='pago'), {self.segunda.pk})
+        self.assertEqual(pks(q='e-2'), {self.segunda.pk})
+        self.assertEqual(len(pks(setor='todos', status_multa='todos')), 3)
+
+    def test_view_csv(self):
+        usuario = User.objects.create_user('gestor')
+        usuario.groups.add(Group.objects.create(name=ADMINISTRADOR))
+        self.client.force_login(usuario)
+
+        resposta = self.client.get(reverse('exportar_multas_csv'), {'status_pagamento': 'pago'})
+
+        self.assertTrue(resposta.streaming)
+        self.assertEqual(resposta['Content-Disposition'], 'attachment; filename=multas.csv')
+        linhas = b''.join(resposta.streaming_content).decode().splitlines()
+        self.assertEqual(len(linhas), 2)
+        self.assertTrue(linhas[1].startswith(f'{self.segunda.pk};EXP0002;'))
+
+
+class SetorMultaTests(TestCase):
+    """Setor da multa como chave estrangeira, com nome e descrição congelados na data da multa."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.frota = Setor.objects.create(nome='Frota', descricao='Frota municipal')
+        cls.obras = Setor.objects.create(nome='Obras', descricao='Secretaria de Obras')
+        cls.multa = criar_multa(criar_veiculo('SET0001', setor=cls.frota), auto_infracao='S-1')
+        cls.de_obras = criar_multa(criar_veiculo('SET0002', setor=cls.obras), auto_infracao='S-2')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('setorial'))
+
+    def test_nova_multa_congela_o_setor_do_veiculo(self):
+        self.assertEqual((self.multa.setor, self.multa.setor_nome, self.multa.setor_descricao),
+                         (self.frota, 'Frota', 'Frota municipal'))
+
+    def test_trocar_setor(self):
+        resposta = self.client.post(reverse('trocar_setor', args=[self.multa.pk]),
+                                    {'setor': self.obras.pk, 'setor_descricao': 'digitada na tela'})
+
+        self.assertRedirects(resposta, reverse('listar_multas'), fetch_redirect_response=False)
+        self.multa.refresh_from_db()
+        self.assertEqual((self.multa.setor, self.multa.setor_nome, self.multa.setor_descricao),
+                         (self.obras, 'Obras', 'Secretaria de Obras'))
+
+        # Setor é obrigatório na troca
+        form = TrocaSetorForm({'setor': ''}, instance=self.multa)
+        self.assertIn('setor', form.errors)
+
+    def test_renomear_setor_nao_muda_multas_antigas(self):
+        self.frota.nome, self.frota.descricao = 'Frota Central', 'Nova descrição'
+        self.frota.save()
+
+        self.multa.refresh_from_db()
+        self.assertEqual((self.multa.setor, self.multa.setor_nome, self.multa.setor_descricao),
+                         (self.frota, 'Frota', 'Frota municipal'))
+        nova = criar_multa(self.multa.veiculo, auto_infracao='S-3')
+        self.assertEqual(nova.setor_nome, 'Frota Central')
+
+    def test_listar_multas_filtra_pelo_id_do_setor(self):
+        resposta = self.client.get(reverse('listar_multas'), {'setor': self.obras.pk})
+
+        self.assertEqual([m.pk for m in resposta.context['multas']], [self.de_obras.pk])
+        self.assertEqual(resposta.context['setores'], [(self.frota.pk, 'Frota'), (self.obras.pk, 'Obras')])
+        self.assertContains(resposta, f'<option value="{self.obras.pk}" selected>Obras</option>', html=True)
+
+    def test_migracao_liga_multas_e_historico_pelo_nome(self):
+        migracao = importlib.import_module('controle.migrations.0043_preencher_setor_multas')
+        extinta = criar_multa(self.multa.veiculo, auto_infracao='S-4')
+        # Como antes da 0042: só o nome, sem chave estrangeira
+        Multa.objects.update(setor=None)
+        Multa.objects.filter(pk=extinta.pk).update(setor_nome='Extinto')
+        Multa.history.update(setor=None)
+        delta = AlteracaoHistorico.objects.create(
+            tabela='multa', objeto_id=self.multa.pk, history_date=dia(1), history_type='~',
+            campos={'setor': 'Obras', 'local': 'Av. Paralela'},
+        )
+
+        migracao.preencher_setores(django_apps, None)
+
+        self.assertEqual(dict(Multa.objects.values_list('pk', 'setor')),
+                         {self.multa.pk: self.frota.pk, self.de_obras.pk: self.obras.pk, extinta.pk: None})
+        self.assertEqual(set(Multa.history.values_list('setor_nome', 'setor')),
+                         {('Frota', self.frota.pk), ('Obras', self.obras.pk)})
+        delta.refresh_from_db()
+        self.assertEqual(delta.campos, {'setor_nome': 'Obras', 'local': 'Av. Paralela'})
+
+
+class CachePdfTests(TestCase):
+    """Memorandos guardados pelo hash do HTML: só renderiza o que mudou."""
+
+    PDF = b'%PDF-1.7 teste'
+
+    def setUp(self):
+        pasta_temporaria(self)
+        self.infracao = InfracaoTransito.objects.create(
+            descricao='Estacionar em local proibido', gravidade='leve', valor=88.38
+        )
+        self.multa = criar_multa(criar_veiculo('PDF0001'), auto_infracao='P-1', infracao=self.infracao)
+        renderizar = mock.patch.object(pdfs, 'renderizar_pdf', return_value=self.PDF)
+        self.renderizar = renderizar.start()
+        self.addCleanup(renderizar.stop)
+
+    def test_reaproveita_enquanto_o_html_nao_muda(self):
+        caminho = pdfs.pdf_memorando(self.multa)
+        self.assertEqual(pdfs.pdf_memorando(Multa.objects.get(pk=self.multa.pk)), caminho)
+
+        self.assertEqual(self.renderizar.call_count, 1)
+        self.assertTrue(caminho.startswith(pdfs.PASTA_MEMORANDOS))
+        self.assertEqual(Multa.objects.get(pk=self.multa.pk).memorando.name, caminho)
+        with default_storage.open(caminho, 'rb') as arquivo:
+            self.assertEqual(arquivo.read(), self.PDF)
+
+    def test_edicao_gera_novo_e_apaga_o_antigo(self):
+        antigo = pdfs.pdf_memorando(self.multa)
+        self.multa.local = 'Av. Paralela'
+        self.multa.save()
+
+        novo = pdfs.pdf_memorando(self.multa)
+
+        self.assertNotEqual(novo, antigo)
+        self.assertEqual(self.renderizar.call_count, 2)
+        self.assertFalse(default_storage.exists(antigo))
+        self.assertEqual(Multa.objects.get(pk=self.multa.pk).memorando.name, novo)
+
+    def test_memorando_enviado_pelo_usuario_fica(self):
+        assinado = 'documentos/multas/memorandos/assinado.pdf'
+        Multa.objects.filter(pk=self.multa.pk).update(memorando=assinado)
+        self.multa.refresh_from_db()
+
+        pdfs.pdf_memorando(self.multa)
+
+        self.assertEqual(Multa.objects.get(pk=self.multa.pk).memorando.name, assinado)
+
+    def test_lote_renderiza_so_os_pendentes(self):
+        outra = criar_multa(criar_veiculo('PDF0002'), auto_infracao='P-2', infracao=self.infracao)
+        pdfs.pdf_memorando(self.multa)
+        erro = RuntimeError("falhou")
+        with mock.patch.object(pdfs, 'renderizar_varios', return_value=[erro]) as renderizar_varios:
+            resultados = dict(pdfs.gerar_memorandos(Multa.objects.filter(pk__in=[self.multa.pk, outra.pk])))
+
+        renderizar_varios.assert_called_once_with([pdfs.html_memorando(outra)])
+        self.assertEqual(resultados[self.multa], Multa.objects.get(pk=self.multa.pk).memorando.name)
+        self.assertIs(resultados[outra], erro)
+
+
+def pdf_em_branco():
+    """PDF válido de uma página, no lugar do WeasyPrint."""
+    escritor, saida = PdfWriter(), io.BytesIO()
+    escritor.add_blank_page(width=72, height=72)
+    escritor.write(saida)
+    return saida.getvalue()
+
+
+def paginas(conteudo):
+    return len(PdfReader(io.BytesIO(conteudo)).pages)
+
+
+class TarefaFalsa:
+    """AsyncResult com o resultado pronto ou travado (get estoura o tempo)."""
+
+    def __init__(self, pdf=None):
+        self.pdf = pdf
+
+    def ready(self):
+        return self.pdf is not None
+
+    def get(self, timeout):
+        if self.pdf is None:
+            raise multiprocessing.TimeoutError
+        return self.pdf
+
+
+@override_settings(PDF_WORKERS=2, PDF_TIMEOUT=5)
+class RenderizarVariosTests(SimpleTestCase):
+    """O tempo estourado de um PDF não derruba o resto do lote nem o pool no meio dele."""
+
+    def renderizar(self, tarefas):
+        pool = mock.Mock(apply_async=mock.Mock(side_effect=tarefas))
+        with mock.patch.object(renderizacao, '_obter_pool', return_value=pool), \
+                mock.patch.object(renderizacao, '_reciclar_pool') as reciclar:
+            resultados = renderizacao.renderizar_varios(['<p>'] * len(tarefas))
+        return resultados, pool, reciclar
+
+    def test_so_o_pdf_travado_falha(self):
+        resultados, pool, reciclar = self.renderizar([TarefaFalsa(b'1'), TarefaFalsa(), TarefaFalsa(b'3')])
+
+        self.assertEqual(resultados[0], b'1')
+        self.assertIsInstance(resultados[1], renderizacao.ErroRenderizacao)
+        self.assertEqual(resultados[2], b'3')
+        reciclar.assert_called_once_with(pool, 5)
+
+    def test_todos_os_workers_travados_cancela_a_fila(self):
+        resultados, _, _ = self.renderizar([TarefaFalsa(), TarefaFalsa(), TarefaFalsa(), TarefaFalsa(b'4')])
+
+        self.assertTrue(all(isinstance(r, renderizacao.ErroRenderizacao) for r in resultados[:3]))
+        self.assertIn('todos os workers', str(resultados[2]))
+        self.assertEqual(resultados[3], b'4')  # já estava pronto
+
+    def test_reciclar_so_encerra_depois_da_espera(self):
+        pool = mock.Mock()
+        renderizacao._pool = pool
+        self.addCleanup(setattr, renderizacao, '_pool', None)
+        with mock.patch.object(renderizacao.threading, 'Timer') as temporizador:
+            renderizacao._reciclar_pool(pool, 5)
+
+        self.assertIsNone(renderizacao._pool)
+        pool.close.assert_called_once_with()
+        pool.terminate.assert_not_called()
+        temporizador.assert_called_once_with(5, pool.terminate)
+
+
+class MemorandosEmLoteTests(TestCase):
+    """Um PDF unificado por setor ou um ZIP por multa, com as falhas listadas."""
+
+    def setUp(self):
+        pasta_temporaria(self)
+        infracao = InfracaoTransito.objects.create(descricao='Estacionar em local proibido', gravidade='leve',
+                                                   valor=88.38)
+        obras = Setor.objects.create(nome='Obras')
+        self.frota = [criar_multa(criar_veiculo(f'LOT000{n}'), infracao=infracao) for n in range(3)]
+        self.obras = [criar_multa(criar_veiculo('LOT0009', setor=obras), infracao=infracao)]
+        renderizar = mock.patch.object(pdfs, 'renderizar_varios', side_effect=lambda htmls: [
+            pdf_em_branco() for _ in htmls
+        ])
+        self.renderizar = renderizar.start()
+        self.addCleanup(renderizar.stop)
+        self.client.force_login(User.objects.create_user('frota'))
+
+    def gerar(self, multas, **dados):
+        return self.client.post(reverse('memorandos_em_lote'), {'multas': [m.pk for m in multas], **dados})
+
+    def conteudo_zip(self, resposta):
+        arquivo = zipfile.ZipFile(io.BytesIO(b''.join(resposta.streaming_content)))
+        return {nome: arquivo.read(nome) for nome in arquivo.namelist()}
+
+    def test_um_setor_vira_um_pdf(self):
+        resposta = self.gerar(self.frota)
+
+        self.assertEqual(resposta['Content-Type'], 'application/pdf')
+        self.assertIn('memorandos_frota.pdf', resposta['Content-Disposition'])
+        self.assertEqual(paginas(resposta.content), 3)
+
+    def test_varios_setores_um_pdf_por_setor(self):
+        arquivos = self.conteudo_zip(self.gerar(self.frota + self.obras))
+
+        self.assertEqual({nome: paginas(pdf) for nome, pdf in arquivos.items()},
+                         {'memorandos_frota.pdf': 3, 'memorandos_obras.pdf': 1})
+
+    def test_zip_por_multa_com_falhas(self):
+        self.renderizar.side_effect = lambda htmls: [pdf_em_branco()] * (len(htmls) - 1) + [RuntimeError('travou')]
+
+        arquivos = self.conteudo_zip(self.gerar(self.frota + self.obras, formato='zip'))
+
+        self.assertEqual(sorted(arquivos), [
+            'falhas.txt', f'frota/memorando_{self.frota[0].pk}.pdf', f'frota/memorando_{self.frota[1].pk}.pdf',
+            f'frota/memorando_{self.frota[2].pk}.pdf',
+        ])
+        self.assertIn(f'Multa {self.obras[0].pk} (LOT0009): travou', arquivos['falhas.txt'].decode())
+
+    def test_lote_grande_vai_para_o_comando(self):
+        with mock.patch.object(views, 'LIMITE_MEMORANDOS_LOTE', 2):
+            resposta = self.gerar(self.frota)
+
+        self.assertRedirects(resposta, reverse('listar_multas'), fetch_redirect_response=False)
+        self.renderizar.assert_not_called()
+        mensagem = str(list(resposta.wsgi_request._messages)[0])
+        self.assertIn('gerar_memorandos', mensagem)
+
+
+class ImportarMultasTests(TestCase):
+    """Autuações em lote: dedupe por órgão e auto, motorista pelos vínculos, histórico e pontos em lote."""
+
+    CABECALHO = ['AIT', 'Placa', 'Data', 'Infração', 'Local', 'Vencimento']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.veiculo = criar_veiculo('IMP0001')
+        cls.ana = criar_motorista('00000000033')
+        VinculoMotorista.objects.create(
+            veiculo=cls.veiculo, motorista=cls.ana, inicio=timezone.now() - timedelta(days=60),
+            origem=VinculoMotorista.ORIGEM_CHOICES.CARGA,
+        )
+        cls.grave = InfracaoTransito.objects.create(
+            descricao='Avançar o sinal vermelho', gravidade='grave', valor=195.23
+        )
+        cls.cadastrada = criar_multa(cls.veiculo, auto_infracao='AI-100', orgao_autuador='DETRAN-BA')
+        cls.usuario = User.objects.create_user('importador')
+        # Dentro da janela de 12 meses e depois do início do vínculo
+        cls.quando = timezone.localtime() - timedelta(days=10)
+
+    def linha(self, auto, prazo='31/12/2030'):
+        return [auto, 'imp-0001', self.quando.strftime('%d/%m/%Y %H:%M'), 'AVANCAR O SINAL VERMELHO', 'Av. Paralela',
+                prazo]
+
+    def importar(self, *linhas, cabecalho=CABECALHO, **opcoes):
+        opcoes.setdefault('orgao_autuador', 'DETRAN-BA')
+        return importacao.importar_multas(arquivo_csv(cabecalho, *linhas), 'autos.csv', **opcoes)
+
+    def importadas(self):
+        return Multa.objects.exclude(pk=self.cadastrada.pk)
+
+    def test_simular_nao_grava(self):
+        resultado = self.importar(self.linha('AI-200'), self.linha('AI-201'), simular=True)
+
+        self.assertEqual((resultado.importados, resultado.rejeitados), (2, []))
+        self.assertEqual([(item['auto_infracao'], item['motorista']) for item in resultado.amostra],
+                         [('AI-200', self.ana.nome), ('AI-201', self.ana.nome)])
+        self.assertFalse(self.importadas().exists())
+        self.assertEqual(Multa.history.count(), 1)
+        self.assertEqual(DocumentoBusca.objects.filter(tipo='multa').count(), 1)
+        self.assertEqual(Motorista.objects.get(pk=self.ana.pk).pontos_cnh, 0)
+
+    def test_repetidos_no_banco_e_no_arquivo(self):
+        resultado = self.importar(
+            self.linha('ai 100'),                   # já cadastrado no DETRAN-BA, escrito de outro jeito
+            self.linha('AI-200'),
+            self.linha('AI200'),                    # repetido no arquivo
+            self.linha('AI-300', prazo=''),         # sem prazo de pagamento
+        )
+
+        self.assertEqual((resultado.importados, resultado.ja_importados), (1, 1))
+        self.assertEqual([(numero, motivo) for numero, _, motivo in resultado.rejeitados], [
+            (4, "auto de infração repetido no arquivo"), (5, "prazo de pagamento não informado"),
+        ])
+        self.assertEqual(list(self.importadas().values_list('auto_infracao', flat=True)), ['AI-200'])
+
+        # O mesmo número vindo de outro órgão é outra autuação
+        outro_orgao = self.importar(self.linha('AI-100') + ['SEMOB'], cabecalho=self.CABECALHO + ['Órgão'])
+        self.assertEqual((outro_orgao.importados, outro_orgao.ja_importados), (1, 0))
+        self.assertEqual(
+            sorted(Multa.objects.filter(auto_infracao_busca='ai100').values_list('orgao_autuador', flat=True)),
+            ['DETRAN-BA', 'SEMOB'],
+        )
+
+    def test_grava_motorista_setor_historico_e_pontos(self):
+        resultado = self.importar(self.linha('AI-200'), self.linha('AI-201'), usuario=self.usuario)
+
+        self.assertEqual(resultado.importados, 2)
+        multas = self.importadas()
+        self.assertEqual(set(multas.values_list('motorista', 'setor_nome', 'infracao', 'prazo_pagamento')),
+                         {(self.ana.pk, 'Frota', self.grave.pk, date(2030, 12, 31))})
+        self.assertEqual(Motorista.objects.get(pk=self.ana.pk).pontos_cnh, 10)
+
+        historicos = Multa.history.filter(id__in=multas.values('pk'))
+        self.assertEqual(
+            sorted(historicos.values_list('auto_infracao', 'history_type', 'history_change_reason', 'history_user')),
+            [('AI-200', '+', "Importada do arquivo autos.csv", self.usuario.pk),
+             ('AI-201', '+', "Importada do arquivo autos.csv", self.usuario.pk)],
+        )
+        self.assertEqual(DocumentoBusca.objects.filter(tipo='multa', objeto_id__in=multas.values('pk')).count(), 2)
+
+    def test_auto_gravado_por_outra_importacao_no_meio_do_lote(self):
+        conferir = importacao._cadastradas
+
+        def concorrente(chaves):
+            # Outra importação grava o AI-300 logo depois da checagem deste lote
+            cadastradas = conferir(chaves)
+            if not Multa.objects.filter(auto_infracao='AI-300').exists():
+                criar_multa(self.veiculo, auto_infracao='AI-300', orgao_autuador='DETRAN-BA')
+            return cadastradas
+
+        with mock.patch.object(importacao, '_cadastradas', side_effect=concorrente) as cadastradas:
+            resultado = self.importar(self.linha('AI-300'), self.linha('AI-301'))
+
+        self.assertEqual(cadastradas.call_count, 2)  # checagem do lote e a de depois do IntegrityError
+        self.assertEqual((resultado.importados, resultado.ja_importados), (1, 1))
+        self.assertEqual(sorted(self.importadas().values_list('auto_infracao', flat=True)), ['AI-300', 'AI-301'])
+        # Só a criação do lote regravado entrou no histórico
+        self.assertEqual(Multa.history.filter(history_change_reason="Importada do arquivo autos.csv").count(), 1)
+
+
+# ==================================================
+# ==================== VÍNCULOS ====================
+# ==================================================
+
+class LinhaDoTempoTests(TestCase):
+    """Varredura em memória de LinhaDoTempo, conferida com a consulta de responsavel()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.veiculo = criar_veiculo('VIN0001')
+        cls.ana, cls.bia, cls.caio, cls.davi = (criar_motorista(f'{n:011d}') for n in range(1, 5))
+
+    def vincular(self, motorista, inicio, fim=None, veiculo=None):
+        return VinculoMotorista.objects.create(
+            veiculo=veiculo or self.veiculo, motorista=motorista, inicio=inicio, fim=fim,
+            origem=VinculoMotorista.ORIGEM_CHOICES.CARGA,
+        )
+
+    def conferir(self, esperados, veiculo=None):
+        veiculo = veiculo or self.veiculo
+        linha_do_tempo = vinculos.LinhaDoTempo([veiculo.pk])
+        self.assertEqual(
+            linha_do_tempo.responsaveis(veiculo.pk, list(esperados)),
+            {instante: motorista and motorista.pk for instante, motorista in esperados.items()},
+        )
+        for instante, motorista in esperados.items():
+            self.assertEqual(vinculos.responsavel(veiculo.pk, instante), motorista, instante)
+
+    def test_vinculos_sobrepostos_e_fechados(self):
+        self.vincular(self.ana, dia(1), dia(10))
+        self.vincular(self.bia, dia(5))             # em aberto, começa durante o da Ana
+        self.vincular(self.caio, dia(7), dia(8))    # fechado, dentro dos outros dois
+
+        self.conferir({
+            dia(0): None,             # antes de qualquer vínculo
+            dia(1): self.ana,         # início é inclusivo
+            dia(4): self.ana,
+            dia(5): self.bia,         # o mais recente que cobre o instante
+            dia(7, 12): self.caio,
+            dia(8): self.bia,         # fim é exclusivo: Caio sai, Bia continua
+            dia(9): self.bia,         # Ana ainda vinculada, mas Bia é mais recente
+            dia(30): self.bia,
+        })
+
+    def test_vinculo_fechado_sem_sucessor(self):
+        self.vincular(self.ana, dia(1), dia(3))
+        self.vincular(self.bia, dia(2), dia(4))
+
+        self.conferir({dia(1): self.ana, dia(2): self.bia, dia(3): self.bia, dia(4): None, dia(5): None})
+
+    def test_mesmo_inicio_vale_o_ultimo_criado(self):
+        self.vincular(self.caio, dia(1))
+        self.vincular(self.davi, dia(1))
+
+        self.conferir({dia(1): self.davi, dia(2): self.davi})
+
+    def test_veiculos_separados(self):
+        outro = criar_veiculo('VIN0002')
+        self.vincular(self.ana, dia(1))
+        self.vincular(self.bia, dia(1), veiculo=outro)
+
+        linha_do_tempo = vinculos.LinhaDoTempo([self.veiculo.pk, outro.pk])
+        self.assertEqual(linha_do_tempo.responsaveis(self.veiculo.pk, [dia(2)]), {dia(2): self.ana.pk})
+        self.assertEqual(linha_do_tempo.responsaveis(outro.pk, [dia(2)]), {dia(2): self.bia.pk})
+        self.assertEqual(vinculos.LinhaDoTempo([]).responsaveis(self.veiculo.pk, [dia(2)]), {dia(2): None})
+
+
+# ==================================================
+# =================== PONTUAÇÃO ====================
+# ==================================================
+
+class ConciliarPontosTests(TestCase):
+    """Motorista.pontos_cnh acompanha as multas por deltas, sem recalcular o total."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.veiculo = criar_veiculo('PTS0001')
+        cls.ana = criar_motorista('00000000011')
+        cls.bia = criar_motorista('00000000022')
+        cls.grave = InfracaoTransito.objects.create(
+            descricao='Avançar o sinal vermelho', gravidade='grave', valor=195.23
+        )
+        cls.leve = InfracaoTransito.objects.create(
+            descricao='Estacionar em local proibido', gravidade='leve', valor=88.38
+        )
+
+    def pontos(self, *motoristas):
+        return [Motorista.objects.get(pk=m.pk).pontos_cnh for m in motoristas]
+
+    def test_criar_e_reatribuir(self):
+        multa = criar_multa(self.veiculo, motorista=self.ana, infracao=self.grave,
+                            data_hora_infracao=timezone.now() - timedelta(days=10))
+        self.assertEqual(self.pontos(self.ana, self.bia), [5, 0])
+
+        multa.motorista = self.bia
+        multa.save()
+        self.assertEqual(self.pontos(self.ana, self.bia), [0, 5])
+
+        multa.infracao = self.leve
+        multa.save()
+        self.assertEqual(self.pontos(self.ana, self.bia), [0, 3])
+
+        multa.motorista = None
+        multa.save()
+        self.assertEqual(self.pontos(self.ana, self.bia), [0, 0])
+        multa.refresh_from_db()
+        self.assertEqual((multa.pontos_vigentes, multa.pontos_motorista_id), (0, None))
+
+    def test_excluir_desconta(self):
+        criar_multa(self.veiculo, motorista=self.ana, infracao=self.leve,
+                    data_hora_infracao=timezone.now() - timedelta(days=3))
+        multa = criar_multa(self.veiculo, motorista=self.ana, infracao=self.grave,
+                            data_hora_infracao=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.pontos(self.ana), [8])
+
+        multa.delete()
+        self.assertEqual(self.pontos(self.ana), [3])
+
+    def test_conciliar_sem_mudanca_nao_altera(self):
+        multa = criar_multa(self.veiculo, motorista=self.ana, infracao=self.grave,
+                            data_hora_infracao=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(pontuacao.conciliar([multa.pk]), 0)
+        self.assertEqual(self.pontos(self.ana), [5])
+
+    def test_expirar_janela_de_12_meses(self):
+        agora = timezone.now()
+        velha = criar_multa(self.veiculo, motorista=self.ana, infracao=self.grave,
+                            data_hora_infracao=agora - timedelta(days=300))
+        recente = criar_multa(self.veiculo, motorista=self.ana, infracao=self.leve,
+                              data_hora_infracao=agora - timedelta(days=30))
+        fora = criar_multa(self.veiculo, motorista=self.ana, infracao=self.leve,
+                           data_hora_infracao=agora - timedelta(days=400))
+        self.assertEqual(self.pontos(self.ana), [8])  # a de 400 dias já nasce sem pontos
+
+        # 100 dias depois só a de 300 dias sai da janela
+        self.assertEqual(pontuacao.expirar(agora + timedelta(days=100)), 1)
+        self.assertEqual(self.pontos(self.ana), [3])
+        self.assertEqual(
+            dict(Multa.objects.filter(pk__in=[velha.pk, recente.pk, fora.pk]).values_list('pk', 'pontos_vigentes')),
+            {velha.pk: 0, recente.pk: 3, fora.pk: 0},
+        )
+        self.assertEqual(pontuacao.expirar(agora + timedelta(days=100)), 0)
+
+        # O acumulador bate com a soma refeita do zero
+        pontuacao.recalcular_totais()
+        self.assertEqual(self.pontos(self.ana), [3])
+
+
+# ==================================================
+# =================== HISTÓRICO ====================
+# ==================================================
+
+class HistoricoEnxutoTests(TestCase):
+    """Deltas entre checkpoints e a reconstrução de qualquer versão por estado_em."""
+
+    ALTERACOES = CHECKPOINT + 5
+
+    def salvar(self, veiculo, quando):
+        veiculo._history_date = quando
+        veiculo.save()
+
+    def contagem(self, veiculo):
+        return (
+            Veiculo.history.filter(id=veiculo.pk).count(),
+            AlteracaoHistorico.objects.filter(tabela='veiculo', objeto_id=veiculo.pk).count(),
+        )
+
+    def test_save_sem_alteracao_nao_grava(self):
+        veiculo = Veiculo(placa='HIS0001', renavam='RHIS0001', chassi='CHIS0001', marca='Fiat',
+                          modelo='Strada', ano=2020, ano_modelo=2020)
+        self.salvar(veiculo, dia(0))
+        self.salvar(veiculo, dia(1))  # só updated_at muda
+        self.assertEqual(self.contagem(veiculo), (1, 0))
+
+    def test_estado_em_reconstroi_cada_versao(self):
+        veiculo = Veiculo(placa='HIS0002', renavam='RHIS0002', chassi='CHIS0002', marca='Fiat',
+                          modelo='M0', ano=2020, ano_modelo=2020)
+        self.salvar(veiculo, dia(0))
+        for n in range(1, self.ALTERACOES + 1):
+            veiculo.modelo = f'M{n}'
+            if n % 3 == 0:
+                veiculo.cor = Veiculo.Cores.PRETO if veiculo.cor == Veiculo.Cores.BRANCO else Veiculo.Cores.BRANCO
+            self.salvar(veiculo, dia(n))
+
+        # Criação e um checkpoint completo a cada CHECKPOINT alterações; o resto em deltas
+        self.assertEqual(self.contagem(veiculo), (2, self.ALTERACOES - 1))
+
+        self.assertIsNone(estado_em(Veiculo, veiculo.pk, dia(0) - timedelta(seconds=1)))
+        for n in range(self.ALTERACOES + 1):
+            estado = estado_em(Veiculo, veiculo.pk, dia(n, hora=12))
+            self.assertEqual(estado['modelo'], f'M{n}', n)
+            self.assertEqual(estado['cor'], Veiculo.Cores.PRETO if n // 3 % 2 else Veiculo.Cores.BRANCO, n)
+            self.assertEqual(estado['placa'], 'HIS0002')
+
+        lista = list(versoes(Veiculo, veiculo.pk))
+        self.assertEqual(len(lista), self.ALTERACOES + 1)
+        self.assertEqual([v['estado']['modelo'] for v in lista], [f'M{n}' for n in range(self.ALTERACOES + 1)])
+        self.assertIn('cor', lista[3]['alterados'])
+        self.assertNotIn('cor', lista[4]['alterados'])
+
+    def test_exclusao(self):
+        veiculo = criar_veiculo('HIS0003')
+        pk = veiculo.pk
+        veiculo._history_date = timezone.now() + timedelta(days=1)
+        veiculo.delete()
+
+        self.assertEqual(estado_em(Veiculo, pk, timezone.now())['placa'], 'HIS0003')
+        self.assertIsNone(estado_em(Veiculo, pk, timezone.now() + timedelta(days=2)))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DiferencasTests(TestCase):
+    """Diff campo a campo de cada entrada, calculado só para a página e guardado no cache."""
+
+    ALTERACOES = CHECKPOINT + 5
+
+    def setUp(self):
+        cache.clear()
+        self.veiculo = Veiculo(placa='DIF0001', renavam='RDIF0001', chassi='CDIF0001', marca='Fiat',
+                               modelo='M0', ano=2020, ano_modelo=2020)
+        self.veiculo._history_date = dia(0)
+        self.veiculo.save()
+        for n in range(1, self.ALTERACOES + 1):
+            self.veiculo.modelo = f'M{n}'
+            self.veiculo._history_date = dia(n)
+            self.veiculo.save()
+        self.registros = diferencas.entradas(Veiculo, self.veiculo.pk, None, 100)
+
+    def test_cada_entrada_mostra_so_o_que_mudou(self):
+        diffs = diferencas.diferencas(Veiculo, self.veiculo.pk, self.registros)
+
+        self.assertEqual(len(self.registros), self.ALTERACOES + 1)
+        criacao, *alteracoes = reversed(self.registros)
+        self.assertIn(('placa', None, 'DIF0001'), diffs[diferencas._chave(criacao)])
+        for n, registro in enumerate(alteracoes, start=1):
+            # Inclusive o checkpoint completo gravado no meio, comparado com o estado anterior
+            self.assertEqual(diffs[diferencas._chave(registro)], [('modelo', f'M{n - 1}', f'M{n}')], n)
+
+    def test_pagina_do_meio_parte_do_checkpoint_anterior(self):
+        completos = diferencas.diferencas(Veiculo, self.veiculo.pk, self.registros)
+        cache.clear()
+        pagina = self.registros[3:8]
+
+        with self.assertNumQueries(2):
+            diffs = diferencas.diferencas(Veiculo, self.veiculo.pk, pagina)
+
+        self.assertEqual(diffs, {chave: completos[chave] for chave in map(diferencas._chave, pagina)})
+
+    def test_historico_passado_vem_do_cache(self):
+        diffs = diferencas.diferencas(Veiculo, self.veiculo.pk, self.registros)
+        with self.assertNumQueries(0):
+            self.assertEqual(diferencas.diferencas(Veiculo, self.veiculo.pk, self.registros), diffs)
+
+    def test_pagina_resolve_chaves_estrangeiras(self):
+        self.veiculo.setor = Setor.objects.create(nome='Obras')
+        self.veiculo.save()
+        usuario = User.objects.create_user('auditor')
+        usuario.groups.add(Group.objects.create(name=ADMINISTRADOR))
+        self.client.force_login(usuario)
+
+        resposta = self.client.get(reverse('historico_objeto', args=['veiculo', self.veiculo.pk]), {'por_pagina': 5})
+
+        self.assertEqual(len(resposta.context['entradas']), 5)
+        self.assertContains(resposta, '<td>Obras</td>', html=True)
+        self.assertEqual(self.client.get(reverse('historico_objeto', args=['setor', 1])).status_code, 404)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    RETENCAO_HISTORICO={'veiculo': 30},
+)
+class RetencaoTests(TestCase):
+    """Meses antigos do histórico em arquivos .jsonl.gz fora do MEDIA_ROOT, sem perder reconstruções."""
+
+    HOJE = date(2026, 3, 1)  # corte em 1º/01/2026
+
+    def setUp(self):
+        cache.clear()
+        self.midia = pasta_temporaria(self)
+        self.pasta = pasta_temporaria(self, 'RETENCAO_PASTA')
+
+    def quando(self, ano, mes, dia_do_mes):
+        return timezone.make_aware(datetime(ano, mes, dia_do_mes, 12))
+
+    def criar_historico(self):
+        """Criação e dois deltas antes do corte; um delta depois."""
+        veiculo = Veiculo(placa='RET0001', renavam='RRET0001', chassi='CRET0001', marca='Fiat',
+                          modelo='M0', ano=2020, ano_modelo=2020)
+        for numero, quando in enumerate([(2025, 11, 5), (2025, 11, 20), (2025, 12, 10), (2026, 1, 15)]):
+            veiculo.modelo = f'M{numero}'
+            veiculo._history_date = self.quando(*quando)
+            veiculo.save()
+        return veiculo
+
+    def test_arquiva_os_meses_antigos_e_preserva_a_reconstrucao(self):
+        veiculo = self.criar_historico()
+
+        totais = retencao.arquivar(Veiculo, hoje=self.HOJE)
+
+        self.assertEqual(totais, {'meses': ['2025-11', '2025-12'], 'checkpoints': 1, 'deltas': 2, 'convertidos': 1})
+        # O delta de janeiro virou cópia completa: o estado recente continua reconstruível
+        self.assertEqual(Veiculo.history.filter(id=veiculo.pk).count(), 1)
+        self.assertFalse(AlteracaoHistorico.objects.filter(tabela='veiculo').exists())
+        self.assertEqual(estado_em(Veiculo, veiculo.pk, self.quando(2026, 1, 20))['modelo'], 'M3')
+
+        novembro = list(retencao.registros_arquivados('2025-11', ['veiculo']))
+        self.assertEqual([(r['fonte'], r['history_type']) for r in novembro], [('checkpoint', '+'), ('delta', '~')])
+        self.assertEqual(novembro[1]['campos']['modelo'], 'M1')
+        self.assertEqual(retencao.meses_arquivados(), ['2025-12', '2025-11'])
+        # Longe do MEDIA_ROOT
+        self.assertTrue(os.path.exists(os.path.join(self.pasta, 'historico', 'veiculo', '2025-11.jsonl.gz')))
+        self.assertEqual(os.listdir(self.midia), [])
+
+        self.assertEqual(retencao.arquivar(Veiculo, hoje=self.HOJE)['meses'], [])
+
+    def test_simular_nao_altera_nada(self):
+        self.criar_historico()
+
+        totais = retencao.arquivar(Veiculo, hoje=self.HOJE, simular=True)
+
+        self.assertEqual((totais['checkpoints'], totais['deltas'], totais['convertidos']), (1, 2, 0))
+        self.assertEqual(AlteracaoHistorico.objects.filter(tabela='veiculo').count(), 3)
+        self.assertEqual(retencao.meses_arquivados(), [])
+
+    def test_mescla_e_termina_troca_interrompida(self):
+        caminho = retencao._caminho('veiculo', date(2025, 11, 1))
+
+        def linha(numero):
+            return {'fonte': 'delta', 'id': numero, 'objeto_id': 1, 'campos': {'modelo': f'M{numero}'}}
+
+        retencao._gravar_arquivo(caminho, [linha(1), linha(2)])
+        self.assertEqual(retencao._gravar_arquivo(caminho, [linha(2), linha(3)])['delta'], [2, 3])
+        self.assertEqual([r['id'] for r in retencao.ler_arquivo(caminho)], [1, 2, 3])
+
+        # Interrompida depois de salvar a cópia nova e apagar o arquivo do mês
+        storage = retencao.armazenamento()
+        with storage.open(caminho, 'rb') as arquivo:
+            storage.save(retencao._copia_nova(caminho), arquivo)
+        storage.delete(caminho)
+        self.assertEqual([r['id'] for r in retencao.ler_arquivo(caminho)], [1, 2, 3])
+
+        retencao._gravar_arquivo(caminho, [linha(4)])
+        self.assertEqual([r['id'] for r in retencao.ler_arquivo(caminho)], [1, 2, 3, 4])
+        self.assertFalse(storage.exists(retencao._copia_nova(caminho)))
+
+    def test_lista_de_meses_em_cache(self):
+        retencao._gravar_arquivo(retencao._caminho('veiculo', date(2025, 11, 1)), [{'fonte': 'delta', 'id': 1}])
+        self.assertEqual(retencao.meses_arquivados(), ['2025-11'])
+
+        with mock.patch.object(retencao, '_listar_meses') as listar:
+            retencao.meses_arquivados()
+            listar.assert_not_called()
+
+        # Mês novo gravado descarta a lista
+        retencao._gravar_arquivo(retencao._caminho('multa', date(2025, 12, 1)), [{'fonte': 'delta', 'id': 2}])
+        self.assertEqual(retencao.meses_arquivados(), ['2025-12', '2025-11'])
+
+    def test_move_arquivos_antigos_da_midia(self):
+        saida = io.BytesIO()
+        with gzip.GzipFile(fileobj=saida, mode='wb') as arquivo:
+            linha = {'fonte': 'delta', 'id': 7, 'history_date': '2025-10-03T12:00:00Z'}
+            arquivo.write(json.dumps(linha).encode() + b'\n')
+        antigo = f'{retencao.PASTA_MIDIA_ANTIGA}veiculo/2025-10.jsonl.gz'
+        default_storage.save(antigo, ContentFile(saida.getvalue()))
+
+        self.assertEqual(retencao.mover_da_midia(), 1)
+
+        self.assertFalse(default_storage.exists(antigo))
+        self.assertEqual([r['id'] for r in retencao.registros_arquivados('2025-10', ['veiculo'])], [7])
+        self.assertEqual(retencao.mover_da_midia(), 0)
+
+
+class CompactarHistoricoTests(TestCase):
+    """Histórico completo antigo convertido para checkpoints e deltas sem mudar nenhuma versão."""
+
+    def test_compactar(self):
+        veiculo = Veiculo(placa='CMP0001', renavam='RCMP0001', chassi='CCMP0001', marca='Fiat',
+                          modelo='M0', ano=2020, ano_modelo=2020)
+        veiculo._history_date = dia(0)
+        veiculo.save()
+        # Cópias completas a cada save, como o simple_history gravava antes
+        campos = campos_rastreados(Veiculo)
+        for numero, modelo in enumerate(['M0', 'M1', 'M2', 'M3'], start=1):
+            veiculo.modelo = modelo
+            Veiculo.history.model.objects.create(
+                history_date=dia(numero), history_type='~', **{c.attname: getattr(veiculo, c.attname) for c in campos}
+            )
+        antes = [estado_em(Veiculo, veiculo.pk, dia(n, hora=12)) for n in range(5)]
+
+        self.assertEqual(compactar(Veiculo, checkpoint=2, simular=True)['deltas'], 2)
+        self.assertEqual(Veiculo.history.filter(id=veiculo.pk).count(), 5)
+
+        totais = compactar(Veiculo, checkpoint=2)
+
+        self.assertEqual((totais['registros'], totais['sem_alteracao'], totais['deltas']), (5, 1, 2))
+        self.assertLess(totais['bytes_depois'], totais['bytes_antes'])
+        # Criação e o checkpoint da segunda alteração; M1 e M3 em deltas
+        self.assertEqual(Veiculo.history.filter(id=veiculo.pk).count(), 2)
+        self.assertEqual(
+            list(AlteracaoHistorico.objects.filter(objeto_id=veiculo.pk).values_list('campos', flat=True)),
+            [{'modelo': 'M1'}, {'modelo': 'M3'}],
+        )
+        self.assertEqual([estado_em(Veiculo, veiculo.pk, dia(n, hora=12)) for n in range(5)], antes)
+
+
+class AuditoriaTests(TestCase):
+    """Feed de auditoria: UNION ALL das tabelas históricas e dos deltas, filtros, cursor e meses arquivados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana')
+        cls.bia = User.objects.create_user('bia')
+        # Várias tabelas com a mesma history_date, para o desempate do cursor
+        cls.veiculo = cls.salvar(Veiculo(placa='AUD0001', renavam='RAUD0001', chassi='CAUD0001', marca='Fiat',
+                                         modelo='M0', ano=2020, ano_modelo=2020), dia(1), cls.ana)
+        cls.motorista = cls.salvar(Motorista(cpf='00000000044', nome='Carla', cnh_numero='CNH44',
+                                             telefone='71999990000'), dia(1), cls.bia)
+        cls.veiculo.modelo = 'M1'
+        cls.salvar(cls.veiculo, dia(1), cls.ana)
+        cls.salvar(Multa(veiculo=cls.veiculo, local='Av. Paralela', orgao_autuador='DETRAN-BA'), dia(2), cls.bia)
+        cls.motorista.nome = 'Carla Souza'
+        cls.salvar(cls.motorista, dia(3), cls.ana)
+        cls.veiculo.modelo = 'M2'
+        cls.salvar(cls.veiculo, dia(3), cls.bia)
+
+    @staticmethod
+    def salvar(objeto, quando, usuario):
+        objeto._history_date = quando
+        objeto._history_user = usuario
+        objeto.save()
+        return objeto
+
+    def esperadas(self):
+        """Linhas do feed montadas tabela a tabela, na ordem do cursor (mais recentes primeiro)."""
+        linhas = []
+        for chave, (model, _) in auditoria.MODELOS.items():
+            linhas += [
+                (r.history_date, chave, r.history_id, r.history_type, r.history_user_id, r.history_change_reason, r.id)
+                for r in model.history.all()
+            ]
+        linhas += [
+            (d.history_date, d.tabela, -d.pk, d.history_type, d.history_user_id, d.history_change_reason, d.objeto_id)
+            for d in AlteracaoHistorico.objects.all()
+        ]
+        return sorted(linhas, key=lambda linha: linha[:3], reverse=True)
+
+    def pagina(self, parametros=None, url='', **dados):
+        request = RequestFactory().get(f'/logs/{url}', dados)
+        return auditoria.paginar_logs(request, parametros or {})
+
+    def resumo(self, pagina):
+        return [(r['tabela'], r['objeto_id'], r['tipo'], r['data'], r['descricao']) for r in pagina]
+
+    def test_colunas_da_uniao_com_os_deltas(self):
+        linhas = auditoria.consultar(Q(), list(auditoria.MODELOS), None, 100)
+
+        self.assertEqual(linhas, self.esperadas())
+        delta = AlteracaoHistorico.objects.get(tabela='veiculo', history_date=dia(1))
+        self.assertIn((dia(1), 'veiculo', -delta.pk, '~', self.ana.pk, None, self.veiculo.pk), linhas)
+
+    def test_cursor_atravessa_tabelas_nos_dois_sentidos(self):
+        todas = self.resumo(self.pagina(por_pagina=100))
+        self.assertEqual(len(todas), 6)
+        self.assertEqual(todas[-1][:3], ('motorista', self.motorista.pk, '+'))
+
+        for tamanho in (1, 2, 4):
+            paginas, pagina = [], self.pagina(por_pagina=tamanho)
+            paginas.append(self.resumo(pagina))
+            while pagina.url_proxima:
+                pagina = self.pagina(url=pagina.url_proxima)
+                paginas.append(self.resumo(pagina))
+            self.assertEqual(sum(paginas, []), todas, tamanho)
+
+            # E de volta, da última para a primeira
+            voltando = [paginas[-1]]
+            while pagina.url_anterior:
+                pagina = self.pagina(url=pagina.url_anterior)
+                voltando.insert(0, self.resumo(pagina))
+            self.assertEqual(voltando, paginas, tamanho)
+
+    def test_filtros(self):
+        def feed(**parametros):
+            return [(r['tabela'], r['tipo'], r['usuario']) for r in self.pagina(parametros)]
+
+        self.assertEqual(feed(modelo='motorista'), [('motorista', '~', self.ana), ('motorista', '+', self.bia)])
+        self.assertEqual(feed(usuario=self.bia),
+                         [('veiculo', '~', self.bia), ('multa', '+', self.bia), ('motorista', '+', self.bia)])
+        self.assertEqual({tabela for tabela, _, _ in feed(tipo='~')}, {'veiculo', 'motorista'})
+        self.assertEqual(len(feed(tipo='~')), 3)
+        self.assertEqual(feed(data_inicio=dia(2).date(), data_fim=dia(2).date()), [('multa', '+', self.bia)])
+        self.assertEqual(len(feed(data_inicio=dia(2).date())), 3)
+
+    @override_settings(RETENCAO_HISTORICO={'veiculo': 30, 'motorista': 30, 'multa': 30})
+    def test_mes_arquivado_igual_ao_banco(self):
+        pasta_temporaria(self, 'RETENCAO_PASTA')
+        cache.clear()
+        antes = {tamanho: self.resumo(self.pagina(por_pagina=tamanho)) for tamanho in (2, 100)}
+        proxima = self.resumo(self.pagina(url=self.pagina(por_pagina=2).url_proxima))
+
+        for model in (Veiculo, Motorista, Multa):
+            retencao.arquivar(model, hoje=date(2026, 6, 1))
+        self.assertFalse(Veiculo.history.exists())
+
+        arquivo = {'arquivo': '2026-03'}
+        self.assertEqual(self.resumo(self.pagina(arquivo, por_pagina=100)), antes[100])
+        primeira = self.pagina(arquivo, por_pagina=2, arquivo='2026-03')
+        self.assertEqual(self.resumo(primeira), antes[2])
+        self.assertEqual(self.resumo(self.pagina(arquivo, url=primeira.url_proxima)), proxima)
+        self.assertEqual(
+            [r['tipo'] for r in self.pagina({**arquivo, 'modelo': 'veiculo', 'usuario': self.bia})], ['~'],
+        )
+
+    def test_consultas_nao_crescem_com_o_historico(self):
+        def consultas(tamanho):
+            with CaptureQueriesContext(connection) as contexto:
+                pagina = self.pagina(por_pagina=tamanho)
+            return len(pagina), len(contexto)
+
+        itens, poucas = consultas(5)
+        # Histórico mais antigo que a primeira página, de todas as tabelas
+        for numero in range(10):
+            veiculo = self.salvar(Veiculo(placa=f'AUX{numero:04d}', renavam=f'RAUX{numero}', chassi=f'CAUX{numero}',
+                                          marca='Fiat', modelo='M0', ano=2020, ano_modelo=2020), dia(0), self.ana)
+            self.salvar(Motorista(cpf=f'{numero:011d}', nome=f'M{numero}', cnh_numero=f'C{numero}',
+                                  telefone='71999990000'), dia(0), self.bia)
+            self.salvar(Multa(veiculo=veiculo, local='Av. Paralela', orgao_autuador='DETRAN-BA'), dia(0), self.ana)
+
+        self.assertEqual(consultas(5), (itens, poucas))
+        # Página inteira: uma consulta por tabela (históricos e objetos atuais), não por linha
+        itens, todas = consultas(100)
+        self.assertEqual(itens, 36)
+        self.assertLessEqual(todas, 1 + 2 * len(auditoria.MODELOS) + 3)
+
+
+# ==================================================
+# =================== PAGINAÇÃO ====================
+# ==================================================
+
+class CursorTests(TestCase):
+    """Ida e volta do cursor e percurso completo das páginas por keyset."""
+
+    ORDENACOES = {
+        'recentes': Ordenacao("Infração mais recente", '-data_hora_infracao'),
+        'prazo': Ordenacao("Prazo de pagamento", 'prazo_pagamento'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        veiculo = criar_veiculo('PAG0001')
+        # Datas repetidas de 3 em 3: o desempate fica com a pk
+        Multa.objects.bulk_create([
+            Multa(veiculo=veiculo, local='x', orgao_autuador='x',
+                  data_hora_infracao=dia(n // 3) + timedelta(microseconds=n // 3 * 7),
+                  prazo_pagamento=dia(n % 4).date())
+            for n in range(23)
+        ])
+
+    def test_ida_e_volta(self):
+        campos = [Multa._meta.get_field(c) for c in ('data_hora_infracao', 'prazo_pagamento', 'id')]
+        valores = [dia(2) + timedelta(microseconds=123456), dia(3).date(), 42]
+
+        cursor = codificar_cursor(PROXIMA, 'recentes', valores)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(
+            decodificar_cursor(cursor, 'recentes', [c.to_python for c in campos]), (PROXIMA, valores)
+        )
+
+    def test_cursor_invalido(self):
+        conversores = [Multa._meta.get_field('id').to_python]
+        for cursor in ('', 'lixo', codificar_cursor('x', 'recentes', [1]),
+                       codificar_cursor(PROXIMA, 'prazo', [1]), codificar_cursor(ANTERIOR, 'recentes', [1, 2]),
+                       codificar_cursor(PROXIMA, 'recentes', ['abc'])):
+            self.assertIsNone(decodificar_cursor(cursor, 'recentes', conversores), cursor)
+
+    def percorrer(self, ordenar, por_pagina=5):
+        """pks de cada página seguindo url_proxima e depois voltando por url_anterior."""
+        def abrir(parametros):
+            return paginar(RequestFactory().get('/', parametros), Multa.objects.all(), self.ORDENACOES)
+
+        idas, voltas = [], []
+        pagina = abrir({'ordenar': ordenar, 'por_pagina': por_pagina})
+        while True:
+            idas.append([m.pk for m in pagina])
+            if not pagina.url_proxima:
+                break
+            pagina = abrir(QueryDict(pagina.url_proxima[1:]))
+        while pagina.url_anterior:
+            pagina = abrir(QueryDict(pagina.url_anterior[1:]))
+            voltas.append([m.pk for m in pagina])
+        return idas, voltas
+
+    def test_percorre_todas_as_paginas(self):
+        for ordenar in self.ORDENACOES:
+            esperado = list(
+                Multa.objects.order_by(*self.ORDENACOES[ordenar].campos).values_list('pk', flat=True)
+            )
+            idas, voltas = self.percorrer(ordenar)
+
+            self.assertEqual([pk for pagina in idas for pk in pagina], esperado, ordenar)
+            self.assertEqual([len(p) for p in idas], [5, 5, 5, 5, 3])
+            # Voltando, cada página é a mesma da ida
+            self.assertEqual(voltas, idas[-2::-1], ordenar)
+
+
+# ==================================================
+# =================== QUITAÇÃO =====================
+# ==================================================
+
+def zip_comprovantes(*nomes, tamanho=10):
+    """ZIP em memória com um arquivo de conteúdo qualquer para cada nome."""
+    arquivo = io.BytesIO()
+    with zipfile.ZipFile(arquivo, 'w') as zip_:
+        for nome in nomes:
+            zip_.writestr(nome, b'%' * tamanho)
+    arquivo.seek(0)
+    return arquivo
+
+
+class CasarComprovantesTests(TestCase):
+    """Nome de cada arquivo do ZIP casado com o auto de infração ou o id da multa."""
+
+    CANDIDATAS = {
+        1: ('A-100', 'pendente'),
+        2: ('B 200', 'pendente'),
+        3: ('C-300', 'pago'),
+        4: ('D-1', 'pendente'),
+        5: ('d1', 'pendente'),   # mesmo auto normalizado que a 4
+        6: ('', 'pendente'),
+    }
+
+    def casar(self, *nomes, tamanho=10):
+        resultado = quitacao.ResultadoQuitacao()
+        with zipfile.ZipFile(zip_comprovantes(*nomes, tamanho=tamanho)) as zip_:
+            casados = quitacao.casar(zip_, self.CANDIDATAS, resultado)
+        return {pk: nome for pk, (_, nome) in casados.items()}, dict(resultado.recusados)
+
+    def test_casamento(self):
+        casados, recusados = self.casar(
+            'lote/A-100.pdf', 'b200.JPG', '6.png', 'C-300.pdf', 'D1.pdf', 'a 100.png', 'X-999.pdf', 'A-100.docx',
+            '__MACOSX/._A-100.pdf', 'lote/.DS_Store', 'lote/',
+        )
+
+        self.assertEqual(casados, {1: 'A-100.pdf', 2: 'b200.JPG', 6: '6.png'})
+        self.assertEqual(set(recusados), {'C-300.pdf', 'D1.pdf', 'a 100.png', 'X-999.pdf', 'A-100.docx'})
+        self.assertIn('já está paga', recusados['C-300.pdf'])
+        self.assertIn('mais de uma multa', recusados['D1.pdf'])
+        self.assertIn('outro comprovante', recusados['a 100.png'])
+        self.assertIn('extensão', recusados['A-100.docx'])
+
+    def test_auto_vale_antes_do_id(self):
+        candidatas = {7: ('8', 'pendente'), 8: ('Z-8', 'pendente')}
+        resultado = quitacao.ResultadoQuitacao()
+        with zipfile.ZipFile(zip_comprovantes('8.pdf')) as zip_:
+            casados = quitacao.casar(zip_, candidatas, resultado)
+        self.assertEqual(list(casados), [7])
+
+    def test_arquivo_grande_demais(self):
+        with mock.patch.object(quitacao, 'TAMANHO_MAXIMO', 5):
+            casados, recusados = self.casar('A-100.pdf', tamanho=6)
+        self.assertEqual(casados, {})
+        self.assertIn('grande demais', recusados['A-100.pdf'])
+
+
+class QuitarEmLoteTests(TestCase):
+    """Multas casadas passam a pagas com comprovante e delta no histórico, numa transação."""
+
+    def setUp(self):
+        pasta_temporaria(self)
+        veiculo = criar_veiculo('QUI0001')
+        self.primeira = criar_multa(veiculo, auto_infracao='Q-1')
+        self.segunda = criar_multa(veiculo, auto_infracao='Q-2')
+        self.sem_arquivo = criar_multa(veiculo, auto_infracao='Q-3')
+        self.usuario = User.objects.create_user('financeiro')
+
+    def test_quitar(self):
+        resultado = quitacao.quitar_em_lote(
+            zip_comprovantes('Q-1.pdf', f'{self.segunda.pk}.pdf', 'Q-9.pdf'), Multa.objects.all(), self.usuario
+        )
+
+        self.assertEqual(
+            sorted(resultado.quitadas),
+            [(self.primeira.pk, 'Q-1', 'Q-1.pdf'), (self.segunda.pk, 'Q-2', f'{self.segunda.pk}.pdf')],
+        )
+        self.assertEqual(resultado.sem_comprovante, [(self.sem_arquivo.pk, 'Q-3')])
+        self.assertEqual([nome for nome, _ in resultado.recusados], ['Q-9.pdf'])
+
+        for multa in (self.primeira, self.segunda):
+            multa.refresh_from_db()
+            self.assertEqual(multa.status_pagamento, 'pago')
+            self.assertTrue(default_storage.exists(multa.comprovante_pagamento.name))
+        self.sem_arquivo.refresh_from_db()
+        self.assertEqual(self.sem_arquivo.status_pagamento, 'pendente')
+
+        delta = AlteracaoHistorico.objects.get(tabela='multa', objeto_id=self.primeira.pk)
+        self.assertEqual(delta.history_change_reason, "Quitação em lote")
+        self.assertEqual(delta.history_user, self.usuario)
+        self.assertEqual(delta.campos['status_pagamento'], 'pago')
+        self.assertEqual(estado_em(Multa, self.primeira.pk, timezone.now())['status_pagamento'], 'pago')
+
+    def test_falha_na_transacao_apaga_os_arquivos(self):
+        with mock.patch('controle.historico.registrar_alteracoes', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                quitacao.quitar_em_lote(zip_comprovantes('Q-1.pdf'), Multa.objects.all())
+
+        self.primeira.refresh_from_db()
+        self.assertEqual(self.primeira.status_pagamento, 'pendente')
+        _, arquivos = default_storage.listdir('documentos/multas/comprovantes')
+        self.assertEqual(arquivos, [])
+
+    def test_zip_invalido(self):
+        with self.assertRaises(zipfile.BadZipFile):
+            quitacao.quitar_em_lote(io.BytesIO(b'nao sou um zip'), Multa.objects.all())
+
+
+# ==================================================
+# ================== PERMISSÕES ====================
+# ==================================================
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PermissoesTests(TestCase):
+    """Grupos lidos uma vez por usuário e invalidados quando a participação muda."""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = Group.objects.create(name=ADMINISTRADOR)
+        self.usuario = User.objects.create_user('frota')
+
+    def novo(self):
+        """O usuário como chega numa nova requisição (sem os grupos no objeto)."""
+        return User.objects.get(pk=self.usuario.pk)
+
+    def test_consulta_uma_vez(self):
+        usuario = self.novo()
+        with self.assertNumQueries(1):
+            self.assertFalse(grupo_administrador(usuario))
+            self.assertFalse(grupo_administrador(usuario))
+        # Próxima requisição: vem do cache
+        usuario = self.novo()
+        with self.assertNumQueries(0):
+            self.assertFalse(grupo_administrador(usuario))
+        self.assertEqual(permissoes.grupos(AnonymousUser()), frozenset())
+
+    def test_mudanca_de_participacao_invalida(self):
+        self.assertFalse(grupo_administrador(self.novo()))
+
+        self.usuario.groups.add(self.admin)
+        self.assertTrue(grupo_administrador(self.novo()))
+
+        self.admin.user_set.remove(self.usuario)
+        self.assertFalse(grupo_administrador(self.novo()))
+
+        self.admin.user_set.add(self.usuario)
+        self.assertTrue(grupo_administrador(self.novo()))
+
+        self.admin.user_set.clear()
+        self.assertFalse(grupo_administrador(self.novo()))
+
+    def test_carimbo_expulso_nao_revive_entradas_antigas(self):
+        cache.delete(permissoes.CHAVE_VERSAO)
+        self.usuario.groups.add(self.admin)
+        self.assertTrue(grupo_administrador(self.novo()))
+        Group.objects.create(name='Oficina')  # troca o carimbo
+        self.usuario.groups.remove(self.admin)
+
+        cache.delete(permissoes.CHAVE_VERSAO)  # expulso pelo LRU
+
+        self.assertFalse(grupo_administrador(self.novo()))
+
+    def test_renomear_grupo_invalida_todos(self):
+        self.usuario.groups.add(self.admin)
+        self.assertTrue(grupo_administrador(self.novo()))
+
+        self.admin.name = 'Antigos administradores'
+        self.admin.save()
+
+        self.assertEqual(permissoes.grupos(self.novo()), {'Antigos administradores'})
+
+    def test_dono_do_veiculo_sem_consulta(self):
+        veiculo = criar_veiculo('PER0001', created_by=self.usuario)
+        outro = User.objects.create_user('outro')
+        chefe = User.objects.create_superuser('chefe')
+        veiculo = Veiculo.objects.get(pk=veiculo.pk)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(permissoes.pode_alterar_veiculo(self.usuario, veiculo))
+            self.assertTrue(permissoes.pode_alterar_veiculo(chefe, veiculo))
+            self.assertFalse(permissoes.pode_alterar_veiculo(outro, veiculo))
+            self.assertFalse(permissoes.pode_alterar_veiculo(AnonymousUser(), veiculo))
+
+        self.client.force_login(outro)
+        self.assertEqual(self.client.post(reverse('excluir_veiculo', args=[veiculo.pk])).status_code, 403)
+
+
+# ==================================================
+# =============== CACHE POR MODELS =================
+# ==================================================
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheModelosTests(TestCase):
+    """Entradas guardadas sob os carimbos das dependências, trocados pelos signals."""
+
+    def setUp(self):
+        cache.clear()
+        self.veiculo = criar_veiculo('CAC0001')
+        self.outro = criar_veiculo('CAC0002')
+        self.gerados = []
+
+    def gerar(self, valor='valor'):
+        self.gerados.append(valor)
+        return valor
+
+    def obter(self, dependencias, variacao=()):
+        return cache_modelos.em_cache('teste', dependencias, self.gerar, variacao)
+
+    def abastecer(self, veiculo):
+        return Abastecimento.objects.create(
+            veiculo=veiculo, data=dia(0), hodometro=1000, litros=Decimal('40'),
+            valor_total=Decimal('244'), tipo_combustivel='G',
+        )
+
+    def test_em_cache_gera_uma_vez_por_versao(self):
+        self.obter(['multa'])
+        self.obter(['multa'])
+        self.obter(['multa'], variacao=('outro usuario',))
+        self.assertEqual(len(self.gerados), 2)
+
+        cache_modelos.invalidar('multa')
+        self.obter(['multa'])
+        self.assertEqual(len(self.gerados), 3)
+
+        cache_modelos.em_cache('teste', ['setor'], lambda: self.gerar(None))
+        cache_modelos.em_cache('teste', ['setor'], lambda: self.gerar(None))
+        self.assertEqual(len(self.gerados), 5)  # None não é guardado
+
+    def test_filho_invalida_so_o_pai(self):
+        dependencias = [f'veiculo:{self.veiculo.pk}']
+        self.obter(dependencias)
+        self.obter([f'veiculo:{self.outro.pk}'])
+
+        abastecimento = self.abastecer(self.veiculo)
+        self.obter(dependencias)
+        self.obter([f'veiculo:{self.outro.pk}'])
+        self.assertEqual(len(self.gerados), 3)
+
+        # Trocar o veículo invalida o pai antigo e o novo
+        abastecimento.veiculo = self.outro
+        abastecimento.save()
+        self.obter(dependencias)
+        self.obter([f'veiculo:{self.outro.pk}'])
+        self.assertEqual(len(self.gerados), 5)
+
+    def test_carimbo_trocado_de_novo_no_commit(self):
+        dependencia = [('multa', None)]
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                cache_modelos.invalidar('multa')
+                # Uma leitura aqui ainda enxerga as linhas antigas
+                durante = cache_modelos.versoes(dependencia)
+        self.assertNotEqual(cache_modelos.versoes(dependencia), durante)
+
+    def test_estatisticas(self):
+        cache_modelos.zerar_estatisticas()
+        self.obter(['multa'])
+        self.obter(['multa'])
+        self.obter(['setor'])
+
+        self.assertEqual(cache_modelos.estatisticas()['teste'], (1, 2))
+        cache_modelos.zerar_estatisticas()
+        self.assertEqual(cache_modelos.estatisticas()['teste'], (0, 0))
+
+    def test_view_de_detalhe_do_veiculo(self):
+        self.client.force_login(User.objects.create_user('frota'))
+        self.client.cookies['csrftoken'] = 'a' * 32
+        url = reverse('detalhar_veiculo', args=[self.veiculo.pk])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertContains(self.client.get(url), 'CAC0001')
+        self.assertFalse(any('controle_veiculo' in consulta['sql'] for consulta in consultas.captured_queries))
+
+        # Abastecimento novo troca o carimbo do veículo
+        self.abastecer(self.veiculo)
+        self.assertContains(self.client.get(url), '1000 km')
@@ -7,6 +7,8 @@ urlpatterns = [
     # PÁGINA INICIAL
     # ==========================
     path("", views.home, name="home"),
+    path("busca/", views.busca_global, name="busca_global"),
+    path("autocomplete/<str:tipo>/", views.autocomplete, name="autocomplete"),
 
     # ==========================
     # TERMOS DE RESPONSABILIDADE
@@ -44,6 +46,7 @@ urlpatterns = [
     # LOGS DO SISTEMA
     # ==========================
     path("logs/", views.logs_todos, name="logs_todos"),
+    path("logs/<str:modelo>/<int:pk>/", views.historico_objeto, name="historico_objeto"),
 
     # ==========================
     # ABASTECIMENTOS
@@ -67,6 +70,8 @@ urlpatterns = [
     path("multas/listar/", views.listar_multas, name="listar_multas"),
     path("multas/criar/", views.criar_multa, name="criar_multa"),
     path("multas/<int:multa_id>/memorando/", views.criar_memorando, name="criar_memorando"),
+    path("multas/memorandos/", views.memorandos_em_lote, name="memorandos_em_lote"),
+    path("multas/quitar/", views.quitar_multas_em_lote, name="quitar_multas_em_lote"),
     path("multa/<int:pk>/editar/", views.atualizar_status_multa, name="editar_multa"),
     path("multas/<int:pk>/pagar/", views.pagar_multa, name="pagar_multa"),
     path("multas/<int:pk>/detalhar/", views.detalhar_multa, name="detalhar_multa"),
@@ -77,6 +82,10 @@ urlpatterns = [
     # ==========================
     path("relatorios/", views.listar_relatorios, name="listar_relatorios"),
     path("exportar-multas-excel/", views.exportar_multas_excel, name="exportar_multas_excel"),
+    path("exportar-multas-csv/", views.exportar_multas_csv, name="exportar_multas_csv"),
+    path("relatorios/consumo/", views.relatorio_consumo, name="relatorio_consumo"),
+    path("relatorios/anomalias/", views.relatorio_anomalias, name="relatorio_anomalias"),
+    path("relatorios/anomalias/<int:pk>/revisar/", views.revisar_anomalia, name="revisar_anomalia"),
 
     # ==========================
     # CONTAS A PAGAR
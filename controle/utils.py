@@ -2,10 +2,35 @@ import requests
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+from django.core.cache import cache
 
 
 
 
 def grupo_administrador(user):
-    return user.groups.filter(name='Administrador').exists()
+    """Usa os grupos guardados por controle/permissoes.py (sem consulta a cada requisição)."""
+    from .permissoes import ADMINISTRADOR, tem_grupo
+
+    return tem_grupo(user, ADMINISTRADOR)
+
+
+CHAVE_SETORES_MULTAS = 'controle:setores_multas'
+
+
+def setores_multas():
+    """
+    [(id, nome)] dos setores que têm multas, para o filtro de listar_multas.
+    Fica em cache até uma multa ou um setor ser salvo ou excluído
+    (controle/signals.py).
+    """
+    from .models import Multa, Setor
+
+    setores = cache.get(CHAVE_SETORES_MULTAS)
+    if setores is None:
+        setores = list(
+            Setor.objects.filter(pk__in=Multa.objects.filter(setor__isnull=False).values('setor'))
+            .order_by('nome').values_list('pk', 'nome')
+        )
+        cache.set(CHAVE_SETORES_MULTAS, setores, None)
+    return setores
 
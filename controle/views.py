@@ -1,23 +1,31 @@
 # -------------------- IMPORTS --------------------
-from django.template import loader
-from django.template.loader import render_to_string
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from datetime import datetime, timezone, timedelta
-from weasyprint import HTML
+from django.conf import settings
 from .models import Motorista, Veiculo, TermoResponsabilidade, Setor, Multa
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.shortcuts import render, redirect, get_object_or_404
 from .forms import *
 import base64
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db.models import Q  # Para filtros complexos
-from .utils import grupo_administrador
+from django.db.models import Q, Sum  # Para filtros complexos
+from .utils import grupo_administrador, setores_multas
+from .permissoes import pode_alterar_veiculo
+from .cache_modelos import cache_dependente
+from .paginacao import Ordenacao, paginar
 from django.utils.text import slugify
 from itertools import chain
 from django.contrib.auth.models import User 
-from openpyxl import Workbook
-from openpyxl.styles import Font
+import tempfile
+from .exportacao import filtrar_multas, gerar_csv, gerar_xlsx
+from .busca import AUTOCOMPLETE, CACHE_AUTOCOMPLETE, TIPOS_DOCUMENTO, autocompletar, buscar, buscar_global
+from .auditoria import MODELOS as MODELOS_AUDITADOS, paginar_logs
+from .diferencas import paginar_historico
+from .pdfs import gerar_memorandos, pdf_memorando, pdf_termo, pdfs_por_setor, unir_pdfs, zip_memorandos
+from .quitacao import quitar_em_lote
+import zipfile
 
 # ==================================================
 # =================== HOME =========================
@@ -28,6 +36,40 @@ def home(request):
     """Página inicial do sistema."""
     return render(request, "controle/index.html")
 
+# ==================================================
+# ================ BUSCA GLOBAL ====================
+# ==================================================
+
+@login_required
+def busca_global(request):
+    """
+    Busca em veículos, condutores, multas, termos e abastecimentos de uma
+    vez (caixa do cabeçalho). Com ?formato=json devolve só os resultados.
+    """
+    query = request.GET.get("q", "").strip()
+    resultados = [
+        {
+            'tipo': TIPOS_DOCUMENTO[documento.tipo],
+            'titulo': documento.titulo,
+            'subtitulo': documento.subtitulo,
+            'url': documento.url,
+        }
+        for documento in buscar_global(query)
+    ] if query else []
+    if request.GET.get("formato") == "json":
+        return JsonResponse({'resultados': resultados})
+    return render(request, "controle/busca.html", {"query": query, "resultados": resultados})
+
+
+@login_required
+def autocomplete(request, tipo):
+    """Opções das caixas de seleção (veiculo, motorista, infracao) para o termo ?q=."""
+    if tipo not in AUTOCOMPLETE:
+        raise Http404("Autocomplete inexistente.")
+    resposta = JsonResponse({'resultados': autocompletar(tipo, request.GET.get("q"))})
+    resposta['Cache-Control'] = f"private, max-age={CACHE_AUTOCOMPLETE}"
+    return resposta
+
 # ==================================================
 # ========== TERMO DE RESPONSABILIDADE =============
 # ==================================================
@@ -73,23 +115,32 @@ def criar_termo(request, pk):
 
     return render(request, "controle/assinatura.html", {"form": form, "motorista": motorista})
 
+ORDENACOES_TERMO = {
+    "recentes": Ordenacao("Mais recentes", "-data_assinatura"),
+    "antigos": Ordenacao("Mais antigos", "data_assinatura"),
+}
+
 @login_required
+@cache_dependente('termoresponsabilidade', 'motorista:pk', 'veiculo')
 def visualizar_termos(request, pk):
     """
     Visualiza todos os termos de responsabilidade de um motorista.
     """
     motorista = get_object_or_404(Motorista, pk=pk)
-    termos = TermoResponsabilidade.objects.filter(motorista=motorista)
-    dicionario = {"termos" : termos, "motorista" : motorista}
+    termos = TermoResponsabilidade.objects.filter(motorista=motorista).select_related('veiculo', 'motorista')
+    pagina = paginar(request, termos, ORDENACOES_TERMO)
+    dicionario = {"termos" : pagina, "motorista" : motorista, "pagina": pagina}
     return render(request, "controle/termos.html", dicionario)
 
 @login_required
+@cache_dependente('termoresponsabilidade', 'motorista', 'veiculo')
 def lista_termo(request):
     """
     Lista todos os termos de responsabilidade do sistema.
     """
-    termos = TermoResponsabilidade.objects.all()
-    dicionario = {"termos" : termos}
+    termos = TermoResponsabilidade.objects.select_related('veiculo', 'motorista')
+    pagina = paginar(request, termos, ORDENACOES_TERMO)
+    dicionario = {"termos" : pagina, "pagina": pagina}
     return render(request, "controle/termos.html", dicionario)
 
 @login_required
@@ -97,54 +148,42 @@ def termo_responsabilidade(request, veiculo_id, motorista_id):
     """
     Gera o PDF do termo de responsabilidade assinado.
     """
-    motorista = Motorista.objects.get(id=motorista_id)
-    veiculo = Veiculo.objects.get(id=veiculo_id)
-    termo = TermoResponsabilidade.objects.filter(veiculo_id=veiculo_id, motorista_id=motorista_id).first()
+    termo = TermoResponsabilidade.objects.select_related('veiculo__setor', 'motorista').filter(
+        veiculo_id=veiculo_id, motorista_id=motorista_id
+    ).first()
+    if not termo or not termo.arquivo:
+        raise Http404("Termo de responsabilidade não encontrado.")
 
-    template = loader.get_template("controle/termo_responsabilidade.html")
-
-    # Carrega imagem da assinatura
-    with termo.arquivo.open("rb") as f:
-        assinatura_base64 = base64.b64encode(f.read()).decode("utf-8")
-    img_data = f"data:image/png;base64,{assinatura_base64}"
-
-    html_string = template.render({
-        'motorista': motorista,
-        'veiculo': veiculo,
-        'data_hoje': termo.data_assinatura.strftime("%d/%m/%Y"),
-        'assinatura' : img_data 
-    })
-
-    pdf_file = HTML(string=html_string).write_pdf()
-    response = HttpResponse(pdf_file, content_type="application/pdf")
-    response['Content-Disposition'] = f'attachment; filename="termo_{motorista.nome}_{veiculo.placa}.pdf"'
+    response = FileResponse(default_storage.open(pdf_termo(termo)), content_type="application/pdf")
+    response['Content-Disposition'] = f'attachment; filename="termo_{termo.motorista.nome}_{termo.veiculo.placa}.pdf"'
     return response
 
 # ==================================================
 # ================= MOTORISTA ======================
 # ==================================================
 
+ORDENACOES_MOTORISTA = {
+    "a-z": Ordenacao("Nome (A-Z)", "nome"),
+    "z-a": Ordenacao("Nome (Z-A)", "-nome"),
+    "cnh": Ordenacao("Validade da CNH", "cnh_validade"),
+    "pontos": Ordenacao("Mais pontos na CNH", "-pontos_cnh"),
+}
+
 @login_required
 def lista_motoristas(request):
     """
     Lista todos os motoristas cadastrados, com ordenação e filtro.
     """
     motoristas = Motorista.objects.all()
-    ordem = request.GET.get("ordenar", "a-z")
-    if ordem == "z-a":
-        motoristas = motoristas.order_by("-nome")
-    else:
-        motoristas = motoristas.order_by("nome")
 
     query = request.GET.get("q")
-    if query:
-        motoristas = motoristas.filter(
-            Q(nome__icontains=query) | Q(cpf__icontains=query) | Q(cnh_numero__icontains=query)
-        )
+    motoristas = buscar(motoristas, query)
 
+    pagina = paginar(request, motoristas, ORDENACOES_MOTORISTA)
     dicionario = {
-        "motoristas": motoristas,
-        "ordenar": ordem,
+        "motoristas": pagina,
+        "pagina": pagina,
+        "ordenar": pagina.ordenar,
         "query": query or "",
     }
     return render(request, "controle/motorista.html", dicionario)
@@ -194,7 +233,14 @@ def excluir_motorista(request, pk):
 # ================= VEICULO ========================
 # ==================================================
 
+ORDENACOES_VEICULO = {
+    "placa": Ordenacao("Placa", "placa"),
+    "modelo": Ordenacao("Modelo", "modelo"),
+    "recentes": Ordenacao("Cadastro mais recente", "-created_at"),
+}
+
 @login_required
+@cache_dependente('veiculo', 'setor')
 def listar_veiculo(request):
     """
     Lista todos os veículos, com filtros por placa, setor e status.
@@ -205,8 +251,7 @@ def listar_veiculo(request):
         veiculos = Veiculo.objects.filter(created_by=request.user)
 
     query = request.GET.get("q")
-    if query:
-        veiculos = veiculos.filter(placa__icontains=query)
+    veiculos = buscar(veiculos, query)
 
     setor_id = request.GET.get("setor")
     if setor_id:
@@ -219,8 +264,10 @@ def listar_veiculo(request):
     setores = Setor.objects.all()
     status_choices = Veiculo.STATUS_CHOICE.choices
 
+    pagina = paginar(request, veiculos, ORDENACOES_VEICULO)
     contexto = {
-        "veiculo": veiculos,
+        "veiculo": pagina,
+        "pagina": pagina,
         "query": query or "",
         "setores": setores,
         "setor_id": setor_id or "",
@@ -230,6 +277,7 @@ def listar_veiculo(request):
     return render(request, "controle/veiculo.html", contexto)
 
 @login_required
+@cache_dependente('veiculo:pk', 'setor', 'motorista')
 def detalhar_veiculo(request, pk):
     """
     Mostra detalhes de um veículo e seus últimos abastecimentos.
@@ -265,7 +313,7 @@ def editar_veiculo(request, pk):
     Edita os dados de um veículo existente.
     """
     veiculo = get_object_or_404(Veiculo, pk=pk)
-    if request.user != veiculo.created_by and not request.user.is_superuser:
+    if not pode_alterar_veiculo(request.user, veiculo):
         return HttpResponseForbidden("Você não tem permissão para editar este veículo.")
 
     if request.method == 'POST':
@@ -285,7 +333,7 @@ def excluir_veiculo(request, pk):
     Inativa (não exclui fisicamente) um veículo.
     """
     veiculo = get_object_or_404(Veiculo, pk=pk)
-    if request.user != veiculo.created_by and not request.user.is_superuser:
+    if not pode_alterar_veiculo(request.user, veiculo):
         return HttpResponseForbidden("Você não tem permissão para excluir este veículo.")
 
     if request.method == 'POST':
@@ -301,52 +349,33 @@ def excluir_veiculo(request, pk):
 @user_passes_test(grupo_administrador, login_url='acesso_negado')
 def logs_todos(request):
     """
-    Lista todos os logs de alterações dos modelos principais.
+    Lista os logs de alterações dos modelos principais, com filtros por
+    modelo, usuário, ação e período. Uma única consulta (UNION ALL) por página.
     """
-    logs_motorista = Motorista.history.all()
-    logs_veiculo = Veiculo.history.all()
-    logs_termo = TermoResponsabilidade.history.all()
-    logs_multas = Multa.history.all()
-
-    todos_logs = sorted(
-        chain(logs_motorista, logs_veiculo, logs_termo, logs_multas),
-        key=lambda log: log.history_date or timezone.now(),
-        reverse=True
-    )
+    form = FiltroLogsForm(request.GET or None)
+    parametros = form.cleaned_data if form.is_valid() else {}
+    pagina = paginar_logs(request, parametros)
+    return render(request, 'controle/logs_todos.html', {'logs': pagina, 'pagina': pagina, 'form': form})
 
-    logs_processados = []
-    for log in todos_logs:
-        modelo = getattr(log.instance._meta, 'model_name', 'desconhecido') if hasattr(log, 'instance') and log.instance else 'desconhecido'
-        tipos = {'+': 'Criado', '~': 'Atualizado', '-': 'Deletado'}
-        tipo_operacao = tipos.get(log.history_type, 'Desconhecido')
 
-        try:
-            if modelo == 'motorista':
-                descricao_objeto = getattr(log, 'nome', str(log))
-            elif modelo == 'veiculo':
-                descricao_objeto = getattr(log, 'placa', str(log))
-            elif modelo == 'termoresponsabilidade':
-                try:
-                    veiculo = log.veiculo
-                    motorista = log.motorista
-                    descricao_objeto = f"Termo - {veiculo} - {motorista}"
-                except Exception:
-                    descricao_objeto = "Termo - [dados indisponíveis]"
-            else:
-                descricao_objeto = str(log)
-        except Exception:
-            descricao_objeto = 'Erro ao processar descrição'
-
-        logs_processados.append({
-            'modelo': modelo.capitalize(),
-            'descricao': descricao_objeto,
-            'tipo_operacao': tipo_operacao,
-            'usuario': getattr(log, 'history_user', None),
-            'data': log.history_date,
-            'motivo': getattr(log, 'history_change_reason', None),
-        })
-
-    return render(request, 'controle/logs_todos.html', {'logs': logs_processados})
+@user_passes_test(grupo_administrador, login_url='acesso_negado')
+def historico_objeto(request, modelo, pk):
+    """
+    Histórico de um veículo, condutor, multa ou termo com as alterações
+    campo a campo de cada entrada (controle/diferencas.py).
+    """
+    if modelo not in MODELOS_AUDITADOS:
+        raise Http404
+    model, rotulo = MODELOS_AUDITADOS[modelo]
+    pagina = paginar_historico(request, model, pk)
+    contexto = {
+        'objeto': model.objects.filter(pk=pk).first(),
+        'objeto_id': pk,
+        'rotulo': rotulo,
+        'entradas': pagina,
+        'pagina': pagina,
+    }
+    return render(request, 'controle/historico_objeto.html', contexto)
 
 # ==================================================
 # ============= ABASTECIMENTO ======================
@@ -360,8 +389,9 @@ def lista_abastecimentos(request):
     from .models import Abastecimento  # Certifique-se que o model está importado
 
     hoje = datetime.now().date()
-    trinta_dias_atras = hoje - timedelta(days=30)
-    abastecimentos = Abastecimento.objects.filter(data__gte=trinta_dias_atras)
+    periodo_inicio = hoje - timedelta(days=30)
+    periodo_fim = None
+    abastecimentos = Abastecimento.objects.select_related('veiculo', 'abastecido_por')
 
     placa = request.GET.get("placa")
     if placa:
@@ -373,10 +403,14 @@ def lista_abastecimentos(request):
         try:
             data_inicio_dt = datetime.strptime(data_inicio, "%Y-%m-%d").date()
             data_fim_dt = datetime.strptime(data_fim, "%Y-%m-%d").date()
-            abastecimentos = abastecimentos.filter(data__range=(data_inicio_dt, data_fim_dt))
+            periodo_inicio = max(periodo_inicio, data_inicio_dt)
+            periodo_fim = data_fim_dt
         except ValueError:
             messages.error(request, "Formato de data inválido. Use AAAA-MM-DD.")
 
+    # Km anterior, km rodado e média km/l calculados no banco para a página toda
+    abastecimentos = abastecimentos.com_consumo(periodo_inicio, periodo_fim)
+
     contexto = {
         "abastecimentos": abastecimentos,
         "placa": placa or "",
@@ -434,13 +468,19 @@ def excluir_abastecimento(request, pk):
 # ================ USUÁRIOS ========================
 # ==================================================
 
+ORDENACOES_USUARIO = {
+    "usuario": Ordenacao("Usuário", "username"),
+    "recentes": Ordenacao("Mais recentes", "-pk"),
+}
+
 @user_passes_test(grupo_administrador, login_url='acesso_negado')
 def lista_usuarios(request):
     """
     Lista todos os usuários do sistema.
     """
-    usuarios = User.objects.all()
-    return render(request, "controle/listar_usuarios.html", {"usuarios": usuarios})
+    usuarios = User.objects.prefetch_related('groups')
+    pagina = paginar(request, usuarios, ORDENACOES_USUARIO)
+    return render(request, "controle/listar_usuarios.html", {"usuarios": pagina, "pagina": pagina})
 
 
 @user_passes_test(grupo_administrador, login_url='acesso_negado')
@@ -531,37 +571,109 @@ def criar_memorando(request, multa_id):
     """
     Gera o PDF do memorando de uma multa.
     """
-    multa = get_object_or_404(Multa, pk=multa_id)
-    html_string = render_to_string("controle/memorando.html", {"multa": multa})
-    pdf_file = HTML(string=html_string).write_pdf()
-    response = HttpResponse(pdf_file, content_type="application/pdf")
+    multa = get_object_or_404(Multa.objects.select_related('veiculo', 'infracao', 'conta_pagamento'), pk=multa_id)
+    response = FileResponse(default_storage.open(pdf_memorando(multa)), content_type="application/pdf")
     response['Content-Disposition'] = f'inline; filename=memorando_{multa.id}.pdf'
     return response
 
+# Acima disso o lote deve ser gerado pelo comando gerar_memorandos
+# Multas por requisição: o que o pool renderiza dentro do tempo limite do
+# servidor (~4 workers, ~1s por PDF). Lotes maiores: comando gerar_memorandos
+LIMITE_MEMORANDOS_LOTE = getattr(settings, 'MEMORANDOS_LOTE_TELA', 50)
+
+@login_required
+def memorandos_em_lote(request):
+    """
+    Gera os memorandos das multas marcadas na lista (ou, sem marcação, de
+    todas as do filtro atual): um PDF unificado por setor ou um ZIP com um
+    PDF por multa.
+    """
+    if request.method != "POST":
+        return redirect("listar_multas")
+
+    ids = request.POST.getlist("multas")
+    multas = Multa.objects.filter(pk__in=ids) if ids else filtrar_multas(Multa.objects.all(), request.POST)
+    multas = multas.order_by('setor_nome', 'pk')
+    total = multas.count()
+    if not total:
+        messages.error(request, "Nenhuma multa encontrada para gerar memorandos.")
+        return redirect("listar_multas")
+    if total > LIMITE_MEMORANDOS_LOTE:
+        messages.error(
+            request,
+            f"{total} multas selecionadas; o limite pela tela é {LIMITE_MEMORANDOS_LOTE}. "
+            "Refine o filtro ou use o comando gerar_memorandos."
+        )
+        return redirect("listar_multas")
+
+    resultados = gerar_memorandos(multas)
+    if request.POST.get("formato") == "zip":
+        response = StreamingHttpResponse(zip_memorandos(resultados), content_type="application/zip")
+        response['Content-Disposition'] = 'attachment; filename="memorandos.zip"'
+        return response
+
+    setores = pdfs_por_setor(resultados)
+    if len(setores) == 1 and all(not isinstance(r, Exception) for _, r in resultados):
+        nome, caminhos = next(iter(setores.items()))
+        response = HttpResponse(unir_pdfs(caminhos), content_type="application/pdf")
+        response['Content-Disposition'] = f'attachment; filename="{nome}"'
+        return response
+    # Vários setores (ou falhas a relatar): um PDF por setor dentro do ZIP
+    response = StreamingHttpResponse(zip_memorandos(resultados, unificar=True), content_type="application/zip")
+    response['Content-Disposition'] = 'attachment; filename="memorandos_por_setor.zip"'
+    return response
+
 @login_required
+def quitar_multas_em_lote(request):
+    """
+    Quita as multas marcadas na lista (ou, sem marcação, as do filtro atual)
+    com um ZIP de comprovantes nomeados pelo auto de infração ou pelo id, e
+    mostra o relatório do que não casou.
+    """
+    if request.method != "POST":
+        return redirect("listar_multas")
+    arquivo = request.FILES.get("comprovantes")
+    if not arquivo:
+        messages.error(request, "Envie o ZIP com os comprovantes para quitar em lote.")
+        return redirect("listar_multas")
+
+    ids = request.POST.getlist("multas")
+    multas = Multa.objects.filter(pk__in=ids) if ids else filtrar_multas(Multa.objects.all(), request.POST)
+    try:
+        resultado = quitar_em_lote(arquivo, multas, usuario=request.user)
+    except zipfile.BadZipFile:
+        messages.error(request, "O arquivo enviado não é um ZIP válido.")
+        return redirect("listar_multas")
+    return render(request, "controle/quitacao_multas.html", {"resultado": resultado})
+
+ORDENACOES_MULTA = {
+    "recentes": Ordenacao("Infração mais recente", "-data_hora_infracao"),
+    "antigas": Ordenacao("Infração mais antiga", "data_hora_infracao"),
+    "prazo": Ordenacao("Prazo de pagamento", "prazo_pagamento"),
+    "cadastro": Ordenacao("Cadastro mais recente", "-data_registro"),
+}
+
+@login_required
+@cache_dependente('multa', 'veiculo', 'infracaotransito', 'setor')
 def listar_multas(request):
     """
     Lista todas as multas, com filtros por status e setor.
     """
-    multas = Multa.objects.all().order_by('-data_hora_infracao')
+    multas = filtrar_multas(Multa.objects.select_related('veiculo').com_infracao(), request.GET)
     status_multa = request.GET.get('status_multa')
     status_pagamento = request.GET.get('status_pagamento')
     setor = request.GET.get('setor')
 
-    if status_multa and status_multa != "todos":
-        multas = multas.filter(status_multa=status_multa)
-    if status_pagamento and status_pagamento != "todos":
-        multas = multas.filter(status_pagamento=status_pagamento)
-    if setor and setor != "todos":
-        multas = multas.filter(setor=setor)
-
     conta_form = ContaPagamentoForm()
+    pagina = paginar(request, multas, ORDENACOES_MULTA)
     context = {
-        'multas': multas,
+        'multas': pagina,
+        'pagina': pagina,
         'status_multa_selecionado': status_multa,
         'status_pagamento_selecionado': status_pagamento,
         'setor_selecionado': setor,
-        'setores': Multa.objects.values_list('setor', flat=True).distinct(),
+        'query': request.GET.get('q', ''),
+        'setores': setores_multas(),
         'conta_form': conta_form,
     }
     return render(request, 'controle/listar_multas.html', context)
@@ -614,64 +726,34 @@ def trocar_setor(request, pk):
 @user_passes_test(grupo_administrador, login_url='acesso_negado')
 def exportar_multas_excel(request):
     """
-    Exporta todas as multas para um arquivo Excel.
-    """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Multas"
-
-    # Cabeçalhos
-    ws.append([
-        'ID', 'Placa', 'Setor', 'Setor Descrição', 'Motorista',
-        'Infração', 'Valor', 'Gravidade',
-        'Data/Hora Infração', 'Local', 'Órgão Autuador',
-        'Status Multa', 'Status Pagamento', 'Prazo Pagamento', 'Data Registro',
-        'Documento Recebido', 'Comprovante Pagamento', 'Notificação Infração'
-    ])
-
-    link_font = Font(color="0000FF", underline="single")
-    multas = Multa.objects.select_related('veiculo', 'motorista', 'infracao')
-
-    for multa in multas:
-        row = [
-            multa.id,
-            multa.veiculo.placa if multa.veiculo else '',
-            multa.setor or '',
-            multa.setor_descricao or '',
-            multa.motorista.nome if multa.motorista else '',
-            multa.infracao.descricao if multa.infracao else '',
-            multa.valor if multa.infracao else '',
-            multa.gravidade if multa.infracao else '',
-            multa.data_hora_infracao.strftime('%d/%m/%Y %H:%M'),
-            multa.local,
-            multa.orgao_autuador,
-            multa.get_status_multa_display(),
-            multa.get_status_pagamento_display(),
-            multa.prazo_pagamento.strftime('%d/%m/%Y'),
-            multa.data_registro.strftime('%d/%m/%Y %H:%M'),
-            '', '', ''
-        ]
-        ws.append(row)
-        current_row = ws.max_row
-        domain = request.build_absolute_uri('/')[:-1]
-        links = [
-            multa.documento_recebido.url if multa.documento_recebido else '',
-            multa.comprovante_pagamento.url if multa.comprovante_pagamento else '',
-            multa.notificacao_infracao.url if multa.notificacao_infracao else '',
-        ]
-        for i, file_url in enumerate(links):
-            if file_url:
-                cell = ws.cell(row=current_row, column=16 + i)
-                full_url = f"{domain}{file_url}"
-                cell.value = "📎 Abrir Documento"
-                cell.hyperlink = full_url
-                cell.font = link_font
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    Exporta as multas para Excel, com os mesmos filtros de listar_multas.
+    A planilha é montada em arquivo temporário (openpyxl write-only) e
+    enviada em blocos.
+    """
+    multas = filtrar_multas(Multa.objects.all(), request.GET)
+    arquivo = tempfile.TemporaryFile()
+    gerar_xlsx(multas, arquivo, request.build_absolute_uri('/')[:-1])
+    arquivo.seek(0)
+
+    return FileResponse(
+        arquivo,
+        as_attachment=True,
+        filename='multas.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
     )
-    response['Content-Disposition'] = 'attachment; filename=multas.xlsx'
-    wb.save(response)
+
+@user_passes_test(grupo_administrador, login_url='acesso_negado')
+def exportar_multas_csv(request):
+    """
+    Exporta as multas para CSV, com os mesmos filtros de listar_multas.
+    As linhas são geradas enquanto a resposta é enviada.
+    """
+    multas = filtrar_multas(Multa.objects.all(), request.GET)
+    response = StreamingHttpResponse(
+        gerar_csv(multas, request.build_absolute_uri('/')[:-1]),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = 'attachment; filename=multas.csv'
     return response
 
 @user_passes_test(grupo_administrador, login_url='acesso_negado')
@@ -681,6 +763,89 @@ def listar_relatorios(request):
     """
     return render(request, 'controle/listar_relatorios.html')
 
+@user_passes_test(grupo_administrador, login_url='acesso_negado')
+def relatorio_consumo(request):
+    """
+    Relatório anual de consumo de combustível por veículo e por mês.
+    Lê apenas o consolidado mensal (ConsumoMensal), nunca os abastecimentos.
+    """
+    from .models import ConsumoMensal
+
+    try:
+        ano = int(request.GET.get("ano", datetime.now().year))
+    except ValueError:
+        ano = datetime.now().year
+
+    consumos = ConsumoMensal.objects.filter(mes__year=ano).order_by()
+    totais = dict(
+        litros=Sum('litros'),
+        valor_total=Sum('valor_total'),
+        km_rodado=Sum('km_rodado'),
+        quantidade=Sum('quantidade'),
+    )
+
+    por_mes = list(consumos.values('mes').annotate(**totais).order_by('mes'))
+    por_veiculo = list(consumos.values(
+        'veiculo_id', 'veiculo__placa', 'veiculo__modelo'
+    ).annotate(**totais).order_by('veiculo__placa'))
+
+    for linha in chain(por_mes, por_veiculo):
+        linha['km_por_litro'] = (
+            round(linha['km_rodado'] / float(linha['litros']), 2) if linha['litros'] else None
+        )
+
+    contexto = {
+        "ano": ano,
+        "por_mes": por_mes,
+        "por_veiculo": por_veiculo,
+    }
+    return render(request, 'controle/relatorio_consumo.html', contexto)
+
+@user_passes_test(grupo_administrador, login_url='acesso_negado')
+def relatorio_anomalias(request):
+    """
+    Abastecimentos marcados pela análise de anomalias, pendentes de revisão.
+    POST executa a análise da frota inteira.
+    """
+    from .anomalias import analisar_frota
+    from .models import AnomaliaAbastecimento
+
+    if request.method == "POST":
+        totais = analisar_frota()
+        messages.success(request, f"Análise concluída: {sum(totais.values())} anomalias encontradas.")
+        return redirect("relatorio_anomalias")
+
+    anomalias = AnomaliaAbastecimento.objects.filter(revisado=False).select_related(
+        'abastecimento__veiculo', 'abastecimento__abastecido_por'
+    ).order_by('-abastecimento__data', 'tipo')
+
+    tipo = request.GET.get("tipo")
+    if tipo:
+        anomalias = anomalias.filter(tipo=tipo)
+
+    contexto = {
+        "anomalias": anomalias[:500],
+        "tipos": AnomaliaAbastecimento.Tipos.choices,
+        "tipo": tipo or "",
+    }
+    return render(request, 'controle/relatorio_anomalias.html', contexto)
+
+@user_passes_test(grupo_administrador, login_url='acesso_negado')
+def revisar_anomalia(request, pk):
+    """
+    Marca uma anomalia como revisada; ela não volta a aparecer nas próximas análises.
+    """
+    from .models import AnomaliaAbastecimento
+
+    anomalia = get_object_or_404(AnomaliaAbastecimento, pk=pk)
+    if request.method == "POST":
+        anomalia.revisado = True
+        anomalia.revisado_por = request.user
+        anomalia.revisado_em = datetime.now(timezone.utc)
+        anomalia.save()
+        messages.success(request, "Anomalia marcada como revisada.")
+    return redirect("relatorio_anomalias")
+
 @login_required
 def criar_conta_pagamento(request):
     if request.method == "POST":
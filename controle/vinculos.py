@@ -0,0 +1,162 @@
+"""
+Linha do tempo de vínculos veículo–motorista (VinculoMotorista).
+
+Os vínculos são abertos quando um termo de responsabilidade é assinado ou
+um motorista é adicionado ao veículo, e fechados quando ele é retirado do
+veículo (controle/signals.py). Vários motoristas podem estar vinculados ao
+mesmo tempo; o responsável num instante é o do vínculo mais recente que o
+cobre.
+
+Para um instante só, responsavel() faz uma consulta: no PostgreSQL pelo
+índice GiST em (veiculo_id, tstzrange(inicio, fim)), nos outros bancos pelo
+índice (veiculo, inicio). Para milhares de multas, LinhaDoTempo carrega os
+vínculos dos veículos de um lote uma vez e responde em memória, varrendo os
+instantes em ordem com um heap dos vínculos ativos.
+"""
+import heapq
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Multa, VinculoMotorista
+
+TAMANHO_LOTE = 2000
+
+
+# ==================================================
+# ================ MANUTENÇÃO ======================
+# ==================================================
+
+def abrir(veiculo_ids, motorista_ids, inicio=None, origem=VinculoMotorista.ORIGEM_CHOICES.VEICULO, termo=None):
+    """Abre os vínculos dos pares (veículo, motorista) que ainda não têm um em aberto."""
+    inicio = inicio or timezone.now()
+    abertos = set(
+        VinculoMotorista.objects.filter(veiculo_id__in=veiculo_ids, motorista_id__in=motorista_ids, fim__isnull=True)
+        .values_list('veiculo_id', 'motorista_id')
+    )
+    VinculoMotorista.objects.bulk_create([
+        VinculoMotorista(veiculo_id=v, motorista_id=m, inicio=inicio, origem=origem, termo=termo)
+        for v in veiculo_ids for m in motorista_ids if (v, m) not in abertos
+    ])
+
+
+def fechar(veiculo_ids=None, motorista_ids=None, fim=None):
+    """Fecha os vínculos em aberto dos veículos e/ou motoristas informados."""
+    vinculos = VinculoMotorista.objects.filter(fim__isnull=True)
+    if veiculo_ids is not None:
+        vinculos = vinculos.filter(veiculo_id__in=veiculo_ids)
+    if motorista_ids is not None:
+        vinculos = vinculos.filter(motorista_id__in=motorista_ids)
+    vinculos.update(fim=fim or timezone.now())
+
+
+# ==================================================
+# ================== CONSULTA ======================
+# ==================================================
+
+def vigentes(veiculo_id, quando):
+    """Vínculos do veículo que cobrem o instante, do mais recente ao mais antigo."""
+    vinculos = VinculoMotorista.objects.filter(veiculo_id=veiculo_id)
+    if connection.vendor == 'postgresql':
+        cobre = RawSQL("tstzrange(inicio, fim, '[)') @> %s::timestamptz", (quando,), output_field=BooleanField())
+        vinculos = vinculos.filter(cobre)
+    else:
+        vinculos = vinculos.filter(Q(fim__isnull=True) | Q(fim__gt=quando), inicio__lte=quando)
+    return vinculos.order_by('-inicio', '-id')
+
+
+def responsavel(veiculo_id, quando):
+    """Motorista que respondia pelo veículo no instante (ou None)."""
+    vinculo = vigentes(veiculo_id, quando).select_related('motorista').first()
+    return vinculo.motorista if vinculo else None
+
+
+class LinhaDoTempo:
+    """Vínculos de vários veículos em memória, para atribuir muitas multas de uma vez."""
+
+    def __init__(self, veiculo_ids):
+        self.por_veiculo = defaultdict(list)
+        vinculos = (
+            VinculoMotorista.objects.filter(veiculo_id__in=veiculo_ids)
+            .order_by('inicio', 'id')
+            .values_list('veiculo_id', 'id', 'inicio', 'fim', 'motorista_id')
+        )
+        for veiculo_id, *vinculo in vinculos:
+            self.por_veiculo[veiculo_id].append(vinculo)
+
+    def responsaveis(self, veiculo_id, instantes):
+        """{instante: motorista_id ou None}, numa varredura só pelos vínculos do veículo."""
+        vinculos = self.por_veiculo.get(veiculo_id, [])
+        ativos = []  # heap por início decrescente
+        proximo = 0
+        resultado = {}
+        for instante in sorted(instantes):
+            while proximo < len(vinculos) and vinculos[proximo][1] <= instante:
+                vinculo_id, inicio, fim, motorista_id = vinculos[proximo]
+                heapq.heappush(ativos, (-inicio.timestamp(), -vinculo_id, fim, motorista_id))
+                proximo += 1
+            # Os que terminaram antes do instante saem quando chegam ao topo
+            while ativos and ativos[0][2] is not None and ativos[0][2] <= instante:
+                heapq.heappop(ativos)
+            resultado[instante] = ativos[0][3] if ativos else None
+        return resultado
+
+
+# ==================================================
+# ============ ATRIBUIÇÃO DAS MULTAS ===============
+# ==================================================
+
+def atribuir_motoristas(multas=None, tamanho_lote=TAMANHO_LOTE, simular=False):
+    """
+    Preenche Multa.motorista, pela linha do tempo, nas multas sem motorista.
+    Lotes de multas ordenadas por veículo e data: uma consulta de vínculos
+    e um bulk_update por lote. Devolve (analisadas, atribuídas).
+    """
+    from .busca import indexar
+    from .cache_modelos import invalidar
+    from .historico import registrar_alteracoes
+    from .pontuacao import conciliar
+
+    multas = (Multa.objects.all() if multas is None else multas).filter(motorista__isnull=True)
+    linhas = multas.order_by('veiculo_id', 'data_hora_infracao', 'id').values_list('id', 'veiculo_id', 'data_hora_infracao')
+    analisadas = atribuidas = 0
+    lote = []
+
+    def processar(lote):
+        linha_do_tempo = LinhaDoTempo({veiculo_id for _, veiculo_id, _ in lote})
+        instantes = defaultdict(list)
+        for _, veiculo_id, data in lote:
+            instantes[veiculo_id].append(data)
+        responsaveis = {
+            veiculo_id: linha_do_tempo.responsaveis(veiculo_id, datas) for veiculo_id, datas in instantes.items()
+        }
+        alteradas = [
+            Multa(pk=multa_id, motorista_id=responsaveis[veiculo_id][data])
+            for multa_id, veiculo_id, data in lote
+            if responsaveis[veiculo_id][data] is not None
+        ]
+        if alteradas and not simular:
+            with transaction.atomic():
+                Multa.objects.bulk_update(alteradas, ['motorista'])
+                # bulk_update não dispara signals nem histórico
+                registrar_alteracoes(Multa, {m.pk: {'motorista_id': m.motorista_id} for m in alteradas},
+                                     motivo="Motorista atribuído pela linha do tempo de vínculos")
+            pks = [m.pk for m in alteradas]
+            conciliar(pks)
+            indexar(Multa.objects.filter(pk__in=pks))
+            invalidar('multa', pks)
+        return len(alteradas)
+
+    for linha in linhas.iterator(chunk_size=tamanho_lote):
+        lote.append(linha)
+        if len(lote) == tamanho_lote:
+            analisadas += len(lote)
+            atribuidas += processar(lote)
+            lote = []
+    if lote:
+        analisadas += len(lote)
+        atribuidas += processar(lote)
+    return analisadas, atribuidas
@@ -0,0 +1,44 @@
+"""
+Widgets de seleção com autocomplete.
+
+Renderizam só as opções já selecionadas (nenhuma lista de veículos ou
+condutores vai na página) e o atributo data-autocomplete com a URL do
+endpoint JSON; o static/controle/js/autocomplete.js cria a caixa de busca
+e preenche as opções conforme o usuário digita. No POST o ModelChoiceField
+continua validando, carregando só as chaves escolhidas.
+"""
+from django import forms
+from django.urls import reverse
+
+from .busca import AUTOCOMPLETE
+
+
+class AutocompleteMixin:
+    def __init__(self, tipo, attrs=None):
+        super().__init__(attrs)
+        self.tipo = tipo
+
+    def get_context(self, name, value, attrs):
+        contexto = super().get_context(name, value, attrs)
+        contexto['widget']['attrs']['data-autocomplete'] = reverse('autocomplete', args=[self.tipo])
+        return contexto
+
+    def optgroups(self, name, value, attrs=None):
+        rotulo = AUTOCOMPLETE[self.tipo][1]
+        selecionados = [v for v in value if str(v).isdigit()]
+        grupos = []
+        if not self.allow_multiple_selected and self.choices.field.empty_label is not None:
+            grupos.append((None, [self.create_option(name, '', self.choices.field.empty_label, not selecionados, 0)], 0))
+        objetos = self.choices.queryset.filter(pk__in=selecionados) if selecionados else []
+        for indice, objeto in enumerate(objetos, start=len(grupos)):
+            opcao = self.create_option(name, str(objeto.pk), rotulo(objeto), True, indice)
+            grupos.append((None, [opcao], indice))
+        return grupos
+
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, forms.SelectMultiple):
+    pass